@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+库存统计基准测试
+在合成的 100 店铺 × 1000 SKU 库存矩阵上比较原有的循环实现与数组实现：
+- 检查两者输出的字典完全一致
+- 报告各统计函数的耗时和加速比
+
+用法: python bench_inventory_analytics.py [店铺数] [SKU数]
+"""
+
+import random
+import sys
+import time
+
+from inventory_check import (
+    KEY_STORES, STORE_REGION_MAPPING, get_store_region, map_region_to_key, simplify_store_name,
+    calculate_stock_status_distribution, calculate_region_heatmap,
+    calculate_product_depth_stats, calculate_key_store_analysis
+)
+from inventory_matrix import InventoryMatrix, make_product_key
+
+
+# ============ 原有的循环实现（参考） ============
+
+def legacy_stock_status_distribution(inventory_matrix):
+    stock_stats = {
+        "高库存店铺": {"count": 0, "percentage": 0},
+        "低库存店铺": {"count": 0, "percentage": 0},
+        "无库存店铺": {"count": 0, "percentage": 0}
+    }
+    total_stores = len(inventory_matrix)
+    if total_stores == 0:
+        return stock_stats
+    for store_data in inventory_matrix.values():
+        has_stock = False
+        low_stock = False
+        for stock in store_data.values():
+            if stock and str(stock).isdigit():
+                stock_count = int(stock)
+                if stock_count > 0:
+                    has_stock = True
+                    if 1 <= stock_count <= 2:
+                        low_stock = True
+                    break
+        if has_stock:
+            if low_stock:
+                stock_stats["低库存店铺"]["count"] += 1
+            else:
+                stock_stats["高库存店铺"]["count"] += 1
+        else:
+            stock_stats["无库存店铺"]["count"] += 1
+    for key in stock_stats:
+        stock_stats[key]["percentage"] = round((stock_stats[key]["count"] / total_stores) * 100, 2)
+    return stock_stats
+
+
+def legacy_region_heatmap(inventory_matrix):
+    region_stats = {
+        "首尔圈": {"count": 0, "percentage": 0, "inventory": 0},
+        "京畿道圈": {"count": 0, "percentage": 0, "inventory": 0},
+        "釜山圈": {"count": 0, "percentage": 0, "inventory": 0},
+        "大邱圈": {"count": 0, "percentage": 0, "inventory": 0},
+        "其他地区": {"count": 0, "percentage": 0, "inventory": 0}
+    }
+    total_stores = len(inventory_matrix)
+    if total_stores == 0:
+        return region_stats
+    for store_name, store_data in inventory_matrix.items():
+        region_key = map_region_to_key(get_store_region(store_name)) or "其他地区"
+        region_stats[region_key]["count"] += 1
+        total_inventory = 0
+        for stock in store_data.values():
+            if stock and str(stock).isdigit():
+                total_inventory += int(stock)
+        region_stats[region_key]["inventory"] += total_inventory
+    for key in region_stats:
+        region_stats[key]["percentage"] = round((region_stats[key]["count"] / total_stores) * 100, 2)
+    return region_stats
+
+
+def legacy_product_depth_stats(favorites_list, inventory_matrix):
+    product_stats = {}
+    for favorite in favorites_list:
+        product_key = make_product_key(favorite)
+        product_stats[product_key] = {
+            "total_inventory": 0,
+            "stores_with_stock": 0,
+            "region_distribution": {
+                "首尔圈": {"total": 0, "stores": []},
+                "京畿道圈": {"total": 0, "stores": []},
+                "釜山圈": {"total": 0, "stores": []},
+                "大邱圈": {"total": 0, "stores": []}
+            }
+        }
+        for store_name, products in inventory_matrix.items():
+            if product_key in products:
+                stock = products[product_key]
+                if stock and str(stock).isdigit():
+                    stock_count = int(stock)
+                    if stock_count > 0:
+                        product_stats[product_key]["total_inventory"] += stock_count
+                        product_stats[product_key]["stores_with_stock"] += 1
+                        region_key = map_region_to_key(get_store_region(store_name))
+                        if region_key:
+                            distribution = product_stats[product_key]["region_distribution"][region_key]
+                            distribution["total"] += stock_count
+                            distribution["stores"].append({
+                                "store_name": simplify_store_name(store_name),
+                                "stock": stock_count
+                            })
+        for region_key in product_stats[product_key]["region_distribution"]:
+            product_stats[product_key]["region_distribution"][region_key]["stores"].sort(
+                key=lambda x: x["stock"], reverse=True
+            )
+    return product_stats
+
+
+def legacy_key_store_analysis(favorites_list, inventory_matrix):
+    # 原实现在产品缺失时沿用上一个产品的库存值计算 stock_count，参考实现按 0 件计
+    result = {}
+    for store_name in KEY_STORES:
+        if store_name not in inventory_matrix:
+            result[store_name] = []
+            continue
+        store_products = []
+        for favorite in favorites_list:
+            product_key = make_product_key(favorite)
+            stock = inventory_matrix[store_name].get(product_key)
+            stock_count = int(stock) if stock and str(stock).isdigit() else 0
+            display_text = f"{product_key}({stock_count}件)" if stock_count > 0 else f"{product_key}(无)"
+            store_products.append({
+                "product_key": product_key,
+                "display_text": display_text,
+                "stock_count": stock_count
+            })
+        store_products.sort(key=lambda x: x["stock_count"], reverse=True)
+        result[store_name] = store_products
+    return result
+
+
+# ============ 合成数据 ============
+
+def build_synthetic_matrix(store_count, sku_count, seed=42):
+    """生成合成的收藏列表和字典形式的库存矩阵（列按收藏顺序排列，与查询流程一致）"""
+    rng = random.Random(seed)
+    store_names = list(dict.fromkeys(KEY_STORES + list(STORE_REGION_MAPPING)))[:store_count]
+    store_names += [f"始祖鸟测试店{i:03d}" for i in range(store_count - len(store_names))]
+
+    favorites = [
+        {"product_model": f"MODEL-{i // 20:03d}", "color": f"COLOR-{i // 5 % 4}",
+         "size": ["XS", "S", "M", "L", "XL"][i % 5], "sku": str(100000 + i)}
+        for i in range(sku_count)
+    ]
+
+    stock_choices = [0] * 6 + [1, 2, 3, 5, 8, 12] + ["0", "4", None, "-"]
+    inventory_matrix = {}
+    for store_name in store_names:
+        products = {}
+        for favorite in favorites:
+            # 约 10% 的单元格缺失（该店铺未返回此产品）
+            if rng.random() < 0.1:
+                continue
+            products[make_product_key(favorite)] = rng.choice(stock_choices)
+        inventory_matrix[store_name] = products
+    return favorites, inventory_matrix
+
+
+def best_of(func, repeat):
+    """多次运行取最短耗时（秒）"""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    store_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    sku_count = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    print("=" * 60)
+    print(f"📊 库存统计基准测试: {store_count} 店铺 × {sku_count} SKU")
+    print("=" * 60)
+
+    favorites, inventory_dict = build_synthetic_matrix(store_count, sku_count)
+    product_keys = [make_product_key(favorite) for favorite in favorites]
+
+    convert_time, matrix = best_of(lambda: InventoryMatrix.from_dict(inventory_dict, product_keys), 3)
+    print(f"字典 → InventoryMatrix 转换: {convert_time * 1000:.1f} ms（每次查询只转换一次）")
+    print()
+
+    cases = [
+        ("库存状态分布", lambda: legacy_stock_status_distribution(inventory_dict),
+         lambda: calculate_stock_status_distribution(matrix)),
+        ("区域热力图", lambda: legacy_region_heatmap(inventory_dict),
+         lambda: calculate_region_heatmap(matrix)),
+        ("产品深度统计", lambda: legacy_product_depth_stats(favorites, inventory_dict),
+         lambda: calculate_product_depth_stats(favorites, matrix)),
+        ("重点店铺分析", lambda: legacy_key_store_analysis(favorites, inventory_dict),
+         lambda: calculate_key_store_analysis(favorites, matrix)),
+    ]
+
+    print(f"{'统计':<10} {'循环实现':>12} {'数组实现':>12} {'加速比':>8}  输出一致")
+    print("-" * 60)
+    all_equal = True
+    total_legacy = total_vectorized = 0.0
+    for name, legacy, vectorized in cases:
+        legacy_time, legacy_result = best_of(legacy, 3)
+        vectorized_time, vectorized_result = best_of(vectorized, 3)
+        equal = legacy_result == vectorized_result
+        all_equal &= equal
+        total_legacy += legacy_time
+        total_vectorized += vectorized_time
+        print(f"{name:<10} {legacy_time * 1000:>10.1f}ms {vectorized_time * 1000:>10.1f}ms "
+              f"{legacy_time / vectorized_time:>7.1f}x  {'✅' if equal else '❌'}")
+
+    print("-" * 60)
+    print(f"{'合计':<10} {total_legacy * 1000:>10.1f}ms {total_vectorized * 1000:>10.1f}ms "
+          f"{total_legacy / total_vectorized:>7.1f}x")
+    print()
+    print("✅ 所有输出一致" if all_equal else "❌ 输出不一致")
+    return 0 if all_equal else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
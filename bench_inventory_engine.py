@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+库存查询引擎负载基准测试
+在子进程中启动本地替身服务（fake_upstream.py），通过 ARCTERYX_API_BASE_URL 把库存查询指向它，
+分别以 10 / 100 / 1000 个SKU驱动 batch_query_stock_concurrent 和 safe_batch_query，报告：
+- 耗时和吞吐量（SKU/秒）
+- 单次请求延迟的 p50 / p95 / p99
+- 请求次数、峰值线程数、峰值内存（RSS 增量）
+
+每次运行使用不同的SKU和临时快照数据库，结果不会命中快照或请求合并。
+
+用法:
+    python bench_inventory_engine.py
+    python bench_inventory_engine.py --sizes 10,100 --latency-ms 120 --error-rate 0.05
+    python bench_inventory_engine.py --burst-every 10 --burst-seconds 1 --rps 100
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+import numpy as np
+
+
+def start_fake_upstream(args):
+    """在子进程中启动替身服务（服务端线程不计入本进程的线程数和内存），返回 (进程, base_url)"""
+    command = [
+        sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_upstream.py"),
+        "--port", "0",
+        "--latency-ms", str(args.latency_ms), "--latency-sigma", str(args.latency_sigma),
+        "--slow-rate", str(args.slow_rate), "--slow-ms", str(args.slow_ms),
+        "--error-rate", str(args.error_rate),
+        "--burst-every", str(args.burst_every), "--burst-seconds", str(args.burst_seconds),
+        "--stores", str(args.stores), "--seed", "42",
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True, encoding="utf-8")
+    for line in process.stdout:
+        match = re.search(r"http://[\d.]+:\d+", line)
+        if match:
+            return process, match.group(0)
+    raise RuntimeError("替身服务启动失败")
+
+
+def fetch_upstream_stats(base_url):
+    with urllib.request.urlopen(f"{base_url}/__stats", timeout=5) as response:
+        return json.loads(response.read())
+
+
+def read_rss_bytes():
+    """当前进程的常驻内存（Linux 读取 /proc，其他平台返回 None）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class ResourceMonitor:
+    """后台采样线程数和常驻内存的峰值"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        self.peak_threads = max(self.peak_threads, threading.active_count())
+        rss = read_rss_bytes()
+        if rss is not None:
+            self.peak_rss = max(self.peak_rss or 0, rss)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="bench-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop_event.set()
+        self._thread.join()
+        self._sample()
+
+
+def install_latency_probe(inventory_engine):
+    """记录异步引擎每次请求的耗时（包装 _request_stock，对冲和重试的每次尝试分别记录）"""
+    samples = []
+    request_stock = inventory_engine._request_stock
+
+    async def _timed_request_stock(session, url, client_timeout):
+        started = time.perf_counter()
+        try:
+            return await request_stock(session, url, client_timeout)
+        finally:
+            samples.append(time.perf_counter() - started)
+
+    inventory_engine._request_stock = _timed_request_stock
+    return samples
+
+
+def count_products(inventory_data):
+    """库存矩阵 {店铺: {产品: 库存}} 中有数据的产品数量"""
+    return len({product_key for products in inventory_data.values() for product_key in products})
+
+
+def run_case(name, func, sku_count, latency_samples, base_url, verbose):
+    """执行一次查询并返回统计结果"""
+    latency_samples.clear()
+    requests_before = sum(fetch_upstream_stats(base_url)["requests"].values())
+    rss_before = read_rss_bytes()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+    with ResourceMonitor() as monitor, output:
+        started = time.perf_counter()
+        succeeded = func()
+        duration = time.perf_counter() - started
+
+    latencies = np.array(latency_samples) * 1000 if latency_samples else np.zeros(1)
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    requests_sent = sum(fetch_upstream_stats(base_url)["requests"].values()) - requests_before
+    rss_delta = (monitor.peak_rss - rss_before) / 1024 / 1024 if rss_before and monitor.peak_rss else None
+    return {
+        "name": name,
+        "skus": sku_count,
+        "succeeded": succeeded,
+        "duration": duration,
+        "throughput": sku_count / duration if duration > 0 else 0,
+        "p50": p50, "p95": p95, "p99": p99,
+        "requests": requests_sent,
+        "threads": monitor.peak_threads,
+        "rss_delta": rss_delta,
+    }
+
+
+def print_result(result):
+    rss_text = f"{result['rss_delta']:>7.1f}MB" if result['rss_delta'] is not None else f"{'-':>9}"
+    print(f"{result['name']:<30} {result['skus']:>5} {result['succeeded']:>5} {result['duration']:>8.2f}s "
+          f"{result['throughput']:>8.1f} {result['p50']:>7.0f} {result['p95']:>7.0f} {result['p99']:>7.0f} "
+          f"{result['requests']:>6} {result['threads']:>5} {rss_text}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="库存查询引擎负载基准测试")
+    parser.add_argument("--sizes", default="10,100,1000", help="SKU数量，逗号分隔")
+    parser.add_argument("--latency-ms", type=float, default=80)
+    parser.add_argument("--latency-sigma", type=float, default=0.4)
+    parser.add_argument("--slow-rate", type=float, default=0.01)
+    parser.add_argument("--slow-ms", type=float, default=1000)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--burst-every", type=float, default=0)
+    parser.add_argument("--burst-seconds", type=float, default=0)
+    parser.add_argument("--stores", type=int, default=55)
+    parser.add_argument("--rps", type=float, default=None,
+                        help="覆盖进程级每秒请求预算（默认使用 REQUESTS_PER_SECOND）")
+    parser.add_argument("--verbose", action="store_true", help="保留查询过程中的日志输出")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+
+    process, base_url = start_fake_upstream(args)
+    try:
+        # 必须在导入库存模块之前设置，接口地址在导入时确定
+        os.environ["ARCTERYX_API_BASE_URL"] = base_url
+        import inventory_engine
+        import inventory_store
+        from inventory_check import batch_query_stock_concurrent, safe_batch_query
+
+        inventory_store._snapshot_store = inventory_store.InventorySnapshotStore(
+            os.path.join(tempfile.mkdtemp(prefix="bench_inventory_"), "snapshots.db"))
+        if args.rps:
+            inventory_engine.stock_budget.rate = inventory_engine.stock_budget.capacity = float(args.rps)
+        latency_samples = install_latency_probe(inventory_engine)
+
+        print("=" * 110)
+        print(f"🚀 库存查询引擎负载基准测试: 替身服务 {base_url}")
+        print(f"   延迟中位数 {args.latency_ms}ms (σ={args.latency_sigma}), 慢请求 {args.slow_rate * 100:.1f}% "
+              f"(+{args.slow_ms}ms), 错误率 {args.error_rate * 100:.1f}%, 429 突发 "
+              f"{f'每 {args.burst_every}s 持续 {args.burst_seconds}s' if args.burst_every else '关闭'}, "
+              f"每秒请求预算 {inventory_engine.stock_budget.rate:.0f}")
+        print("=" * 110)
+        print(f"{'入口':<26} {'SKU':>5} {'成功':>5} {'耗时':>9} {'SKU/秒':>8} {'p50ms':>7} {'p95ms':>7} "
+              f"{'p99ms':>7} {'请求数':>6} {'线程':>5} {'RSS增量':>9}")
+        print("-" * 110)
+
+        next_sku = 100000
+        for size in sizes:
+            product_ids = [str(next_sku + i) for i in range(size)]
+            next_sku += size
+            print_result(run_case(
+                "batch_query_stock_concurrent", lambda: len(batch_query_stock_concurrent(product_ids)),
+                size, latency_samples, base_url, args.verbose))
+
+            favorites = [
+                {"product_model": f"MODEL-{i // 10:03d}", "color": f"COLOR-{i // 5 % 2}",
+                 "size": ["XS", "S", "M", "L", "XL"][i % 5], "sku": str(next_sku + i)}
+                for i in range(size)
+            ]
+            next_sku += size
+            print_result(run_case(
+                "safe_batch_query", lambda: count_products(safe_batch_query(favorites)),
+                size, latency_samples, base_url, args.verbose))
+
+        print("-" * 110)
+        stats = fetch_upstream_stats(base_url)
+        print(f"替身服务统计: 请求 {stats['requests']}, 峰值并发 {stats['peak_in_flight']}, "
+              f"发送 {stats['bytes_sent'] / 1024 / 1024:.1f}MB")
+        controller_state = inventory_engine.stock_controller.snapshot()
+        print(f"并发控制器: 上限 {controller_state['limit']}, 增加 {controller_state['increases']} 次, "
+              f"降低 {controller_state['decreases']} 次")
+        breaker_stats = inventory_engine.stock_breaker.stats()
+        print(f"熔断器: {breaker_stats['state']}, 熔断 {breaker_stats['opened']} 次, "
+              f"快速失败 {breaker_stats['rejected']} 次")
+        return 0
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+库存响应解码基准测试
+用合成的 limit=0 库存接口响应（每个店铺包含完整元数据）比较：
+- 原方式：response.json() 后保留完整的店铺行字典
+- 新方式：decode_stock_payload（orjson / 标准库定向解析）只保留紧凑的库存行
+
+报告每批的响应字节数、解码为对象的字节数、耗时和峰值内存（tracemalloc）
+
+用法: python bench_stock_decode.py [SKU数] [店铺数]
+"""
+
+import json
+import sys
+import time
+import tracemalloc
+
+import stock_decode
+from fake_upstream import build_stock_payload, default_store_names
+from stock_decode import decode_stock_payload
+
+
+def legacy_decode(body):
+    """原方式：完整解析并保留整行"""
+    data = json.loads(body)
+    if data.get("success"):
+        return data["data"]["rows"]
+    return []
+
+
+def decoded_size(rows):
+    """只解码 store_name / usable_stock 时实际解码的字节数（按这两个值的 JSON 文本计）"""
+    return sum(
+        len(json.dumps(row.get("store_name"), ensure_ascii=False).encode("utf-8"))
+        + len(json.dumps(row.get("usable_stock")))
+        for row in rows
+    )
+
+
+def measure(name, decode, bodies, full_parse=False):
+    """解码一整批响应并保留结果（与分块流水线在一块内持有结果的方式相同）"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    results = [decode(body) for body in bodies]
+    elapsed = time.perf_counter() - started
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    if full_parse:
+        decoded_bytes = sum(len(body) for body in bodies)
+    else:
+        decoded_bytes = sum(decoded_size(rows) for rows in results)
+    rows = sum(len(r) for r in results)
+    print(f"{name:<22} {elapsed * 1000:>9.1f}ms {decoded_bytes / 1024:>10.1f}KB "
+          f"{retained / 1024 / 1024:>9.2f}MB {peak / 1024 / 1024:>9.2f}MB  {rows} 行")
+    return results
+
+
+def main():
+    sku_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    store_count = int(sys.argv[2]) if len(sys.argv) > 2 else 55
+
+    store_names = default_store_names(store_count)
+    bodies = [build_stock_payload(str(100000 + i), store_names) for i in range(sku_count)]
+    total_bytes = sum(len(body) for body in bodies)
+
+    print("=" * 80)
+    print(f"📦 库存响应解码基准测试: {sku_count} 个SKU × {store_count} 个店铺")
+    print(f"   响应总大小: {total_bytes / 1024 / 1024:.2f}MB（平均每个SKU {total_bytes / sku_count / 1024:.1f}KB）")
+    print("=" * 80)
+    print(f"{'方式':<22} {'耗时':>11} {'解码字节':>12} {'保留内存':>11} {'峰值内存':>11}")
+    print("-" * 80)
+
+    baseline = measure("原方式(json.loads)", legacy_decode, bodies, full_parse=True)
+
+    results = []
+    if stock_decode.orjson is not None:
+        results.append(measure("orjson + 紧凑行", decode_stock_payload, bodies))
+    else:
+        print("orjson 未安装，跳过 orjson 解码")
+
+    orjson_module = stock_decode.orjson
+    stock_decode.orjson = None
+    try:
+        results.append(measure("定向解析 + 紧凑行", decode_stock_payload, bodies))
+    finally:
+        stock_decode.orjson = orjson_module
+
+    print("-" * 80)
+    expected = [[(row["store_name"], row["usable_stock"]) for row in rows] for rows in baseline]
+    all_equal = all(
+        [[(row.store_name, row.usable_stock) for row in rows] for rows in result] == expected
+        for result in results
+    )
+    print("✅ 解码结果一致" if all_equal else "❌ 解码结果不一致")
+    return 0 if all_equal else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+详情页选项数据提取基准测试
+比较每个页面的 CPU 耗时：
+- 原方式：四个非贪婪 DOTALL 正则，失败后构建 BeautifulSoup 树并对每个脚本标签执行 r'\\{.*\\}'
+- 新方式：extract_option_payload（一次扫描定位 options 键，反转义后直接解码）
+
+页面来源：录制目录（HTTP_CASSETTE_DIR）中录制的详情页；没有录制的详情页时使用两种合成页面
+（fake_upstream.build_product_page）：
+- Next.js 转义数据（与真实页面结构相同，原方式无法提取）
+- var 对象赋值（原方式可以提取，用于比较两种方式的耗时和结果）
+原方式没有提取到任何页面时无法比较结果，基准测试失败
+
+用法:
+    HTTP_CASSETTE_DIR=cassettes python bench_variant_extract.py
+    python bench_variant_extract.py --synthetic 20 --filler-kb 300 --repeat 5
+"""
+
+import argparse
+import json
+import re
+import sys
+import time
+
+from bs4 import BeautifulSoup
+
+from fake_upstream import build_product_page
+from http_cassette import iter_cassettes
+from page_decode import extract_option_payload
+
+
+def legacy_extract(html_content):
+    """原方式：正则和 BeautifulSoup 级联（与替换前的 extract_variant_json_from_html 相同）"""
+    json_patterns = [
+        r'var\s+\w+\s*=\s*(\{.*?"options".*?\});',
+        r'"options"\s*:\s*(\[.*?\]),',
+        r'data-variant=\'(.*?)\'',
+        r'<script[^>]*>var\s+\w+\s*=\s*(\{.*?\});',
+    ]
+    for pattern in json_patterns:
+        for match in re.findall(pattern, html_content, re.DOTALL):
+            try:
+                json_str = match.replace('\\"', '"').replace('\\/', '/')
+                if json_str.startswith('[') or json_str.startswith('{'):
+                    data = json.loads(json_str)
+                    if isinstance(data, (dict, list)):
+                        return data
+            except json.JSONDecodeError:
+                continue
+
+    soup = BeautifulSoup(html_content, 'html.parser')
+    for script in soup.find_all('script'):
+        script_content = script.string
+        if script_content and ('variant' in script_content.lower() or 'option' in script_content.lower()):
+            try:
+                json_match = re.search(r'\{.*\}', script_content, re.DOTALL)
+                if json_match:
+                    return json.loads(json_match.group(0).replace('\\"', '"'))
+            except Exception:
+                continue
+    return None
+
+
+def option_list(data):
+    """提取结果中的选项数组（原方式可能返回包含 options 的对象）"""
+    if isinstance(data, dict):
+        data = data.get("options", data.get("product", {}).get("options"))
+    return data if isinstance(data, list) else None
+
+
+def load_pages(args):
+    """
+    录制的详情页；没有时生成两种合成页面
+    返回 [(页面分组名称, 页面列表, 原方式是否应能提取全部页面)]
+    """
+    pages = [
+        entry.body.decode("utf-8", errors="replace")
+        for entry in iter_cassettes("text/html") if entry.status == 200
+    ]
+    if pages and not args.synthetic:
+        return [("录制的详情页", pages, False)]
+    count = args.synthetic or 10
+    return [
+        (name, [
+            build_product_page(100000 + i, color_count=4 + i % 5, filler_kb=args.filler_kb,
+                               script_count=args.scripts, embed=embed)
+            for i in range(count)
+        ], embed == "var")
+        for name, embed in (("合成详情页(Next.js转义数据)", "next"), ("合成详情页(var对象)", "var"))
+    ]
+
+
+def measure(name, extract, pages, repeat):
+    """每个页面的 CPU 耗时（取多次中最短的一次）"""
+    per_page = []
+    results = []
+    for page in pages:
+        best = None
+        for _ in range(repeat):
+            started = time.process_time()
+            result = extract(page)
+            elapsed = time.process_time() - started
+            best = elapsed if best is None else min(best, elapsed)
+        per_page.append(best)
+        results.append(option_list(result))
+    found = sum(1 for result in results if result)
+    print(f"{name:<28} {sum(per_page) / len(per_page) * 1000:>10.2f}ms {max(per_page) * 1000:>10.2f}ms "
+          f"{found:>5}/{len(pages)}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="详情页选项数据提取基准测试")
+    parser.add_argument("--synthetic", type=int, default=0, help="使用指定数量的合成页面（忽略录制的页面）")
+    parser.add_argument("--filler-kb", type=int, default=150, help="合成页面的填充大小（KB）")
+    parser.add_argument("--scripts", type=int, default=20, help="合成页面中统计脚本的数量")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    groups = load_pages(args)
+    legacy, current = [], []
+    legacy_missing = 0
+    for source, pages, legacy_expected in groups:
+        total_bytes = sum(len(page.encode("utf-8")) for page in pages)
+
+        print("=" * 72)
+        print(f"🔍 详情页选项数据提取基准测试: {source} {len(pages)} 个，"
+              f"平均 {total_bytes / len(pages) / 1024:.0f}KB")
+        print("=" * 72)
+        print(f"{'方式':<24} {'平均CPU/页':>12} {'最慢CPU/页':>12} {'提取成功':>9}")
+        print("-" * 72)
+
+        group_legacy = measure("原方式(正则+BeautifulSoup)", legacy_extract, pages, args.repeat)
+        current += measure("extract_option_payload", extract_option_payload, pages, args.repeat)
+        legacy += group_legacy
+        if legacy_expected:
+            legacy_missing += sum(1 for old in group_legacy if not old)
+        print()
+
+    print("-" * 72)
+    comparable = sum(1 for old in legacy if old)
+    if legacy_missing:
+        print(f"❌ 原方式应能提取的页面中有 {legacy_missing} 个没有提取到选项数据，耗时比较无效")
+        return 1
+    if not comparable:
+        print("❌ 原方式在所有页面上都没有提取到选项数据，无法比较结果")
+        return 1
+    mismatched = sum(1 for old, new in zip(legacy, current) if old and old != new)
+    if mismatched:
+        print(f"❌ {mismatched} 个页面的提取结果与原方式不一致")
+        return 1
+    print(f"✅ 原方式能提取的 {comparable} 个页面，提取结果一致")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,7 @@ import streamlit as st
 import requests
 from datetime import datetime, timedelta
 import sys
+from product_detail import get_product_page
 
 
 class ProductCache:
@@ -9,21 +10,23 @@ class ProductCache:
         self.ttl_minutes = ttl_minutes
 
     def fetch_and_cache_product_info(self, product_id, detail_url):
-        """获取并缓存产品信息（不依赖具体解析函数）"""
+        """获取并缓存产品信息（只保存解析后的结构化数据，不保存HTML）"""
         cache_key = f"product_{product_id}"
 
         # 检查缓存
         if not self.should_refresh_cache(cache_key):
-            return st.session_state[cache_key]['data']
+            return st.session_state[cache_key]
 
-        # 获取HTML内容（不依赖product_detail的函数）
-        html_content = self.fetch_html_from_url(detail_url)
-        if not html_content:
+        # 解析结果按URL在进程内共享，这里只保存当前会话用到的部分
+        page = get_product_page(detail_url)
+        if page is None:
             return None
 
-        # 将HTML内容缓存，让product_detail.py来解析
+        color_options, size_options = page.variants()
         cache_data = {
-            'html_content': html_content,
+            'details': page.details(),
+            'color_options': color_options,
+            'size_options': size_options,
             'detail_url': detail_url,
             'timestamp': datetime.now(),
             'product_id': product_id
@@ -32,21 +35,6 @@ class ProductCache:
         st.session_state[cache_key] = cache_data
         return cache_data
 
-    def fetch_html_from_url(self, url):
-        """独立的HTML获取函数"""
-        import requests
-        try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            }
-            response = requests.get(url, headers=headers, timeout=10)
-            response.raise_for_status()
-            return response.text
-        except Exception as e:
-            print(f"HTML获取失败: {e}")
-            return None
-
     def should_refresh_cache(self, cache_key):
         """检查是否需要刷新缓存"""
         if cache_key not in st.session_state:
@@ -1,5 +1,12 @@
 import streamlit as st
 from cache_manager import product_cache
+from singleflight import get_singleflight_stats
+from circuit_breaker import get_circuit_breaker_stats
+from inventory_engine import HEDGE_ENABLED, stock_hedging
+from inventory_prewarm import get_prewarmer
+from metrics import get_metrics_exporter
+from http_cassette import get_cassette_stats
+from product_catalog import get_catalog_refresher, get_product_catalog
 from datetime import datetime
 
 
@@ -63,7 +70,91 @@ def show_cache_management_tab():
         st.info("暂无缓存数据")
     
     st.divider()
-    
+
+    # 请求合并统计
+    flight_stats = get_singleflight_stats()
+    if flight_stats:
+        st.write("**请求合并统计：**")
+        st.dataframe([
+            {
+                "请求类型": item['name'],
+                "实际请求": item['executed'],
+                "合并次数": item['collapsed'],
+                "合并比例": f"{item['collapse_rate']}%",
+                "在途请求": item['in_flight']
+            }
+            for item in flight_stats
+        ], use_container_width=True)
+        st.divider()
+
+    # 熔断器状态
+    breaker_stats = get_circuit_breaker_stats()
+    if breaker_stats:
+        st.write("**上游接口熔断状态：**")
+        st.dataframe([
+            {
+                "接口": item['name'],
+                "状态": item['state'],
+                "连续失败": item['consecutive_failures'],
+                "熔断次数": item['opened'],
+                "快速失败": item['rejected']
+            }
+            for item in breaker_stats
+        ], use_container_width=True)
+        st.divider()
+
+    # 对冲请求统计（用于调整对冲分位数和额外负载上限）
+    if HEDGE_ENABLED:
+        hedge_stats = stock_hedging.stats()
+        delay_text = f"{hedge_stats['delay']} 秒" if hedge_stats['delay'] is not None else "样本不足"
+        st.caption(f"库存对冲请求：对冲延迟 {delay_text}，主请求 {hedge_stats['requests']} 次，"
+                   f"对冲 {hedge_stats['issued']} 次（额外负载 {hedge_stats['extra_load']}%），"
+                   f"对冲胜出 {hedge_stats['won']} 次（{hedge_stats['win_rate']}%），"
+                   f"因负载上限跳过 {hedge_stats['suppressed']} 次")
+    else:
+        st.caption("库存对冲请求未启用（设置环境变量 INVENTORY_HEDGE=1 开启）")
+    
+    # 后台库存预热状态
+    prewarm_stats = get_prewarmer().get_statistics()
+    if prewarm_stats['running']:
+        last_round = prewarm_stats['last_round_at']
+        last_round_text = last_round.strftime("%H:%M:%S") if last_round else "进行中"
+        st.caption(f"后台库存预热运行中：每轮 {prewarm_stats['interval']} 秒，已完成 {prewarm_stats['rounds']} 轮，"
+                   f"累计刷新 {prewarm_stats['refreshed']} 个SKU，跳过 {prewarm_stats['skipped']} 个（上一轮: {last_round_text}）")
+    else:
+        st.caption("后台库存预热未启用（设置环境变量 INVENTORY_PREWARM=1 开启）")
+
+    # 本地产品目录状态
+    catalog_stats = get_product_catalog().get_statistics()
+    refresher_stats = get_catalog_refresher().get_statistics()
+    catalog_text = (f"本地产品目录：{catalog_stats['products']} 个产品，已抓取详情 {catalog_stats['detailed']} 个，"
+                    f"已索引 {catalog_stats['indexed']} 个")
+    if refresher_stats['running']:
+        last_round = refresher_stats['last_round_at']
+        last_round_text = last_round.strftime("%H:%M:%S") if last_round else "进行中"
+        st.caption(f"{catalog_text}；后台刷新运行中：已完成 {refresher_stats['rounds']} 轮，"
+                   f"发现新产品 {refresher_stats['discovered']} 个，抓取详情 {refresher_stats['fetched']} 个"
+                   f"（失败 {refresher_stats['failed']} 个，上一轮: {last_round_text}）")
+    else:
+        st.caption(f"{catalog_text}（后台刷新未启用，设置环境变量 PRODUCT_CATALOG_REFRESH=1 开启）")
+
+    # 指标导出状态
+    exporter_stats = get_metrics_exporter().get_statistics()
+    if exporter_stats['running']:
+        targets = [target for target in (exporter_stats['url'], exporter_stats['file_path']) if target]
+        st.caption(f"库存查询指标导出中（Prometheus 格式）：{'，'.join(targets)}")
+    if exporter_stats['bind_error']:
+        st.caption(f"⚠️ 指标端口启动失败，本进程不再重试：{exporter_stats['bind_error']}")
+    elif not exporter_stats['running']:
+        st.caption("库存查询指标导出未启用（设置环境变量 INVENTORY_METRICS_PORT 或 INVENTORY_METRICS_FILE 开启）")
+
+    # 上游请求录制/回放状态
+    cassette_stats = get_cassette_stats()
+    if cassette_stats['mode'] != "off":
+        mode_text = "录制" if cassette_stats['mode'] == "record" else "回放"
+        st.caption(f"上游请求{mode_text}模式（{cassette_stats['dir']}）：录制 {cassette_stats['recorded']} 条，"
+                   f"回放 {cassette_stats['replayed']} 条，未命中 {cassette_stats['missed']} 条")
+
     # 清除缓存按钮
     col1, col2, col3 = st.columns(3, gap="small")
     
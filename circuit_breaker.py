@@ -0,0 +1,114 @@
+import threading
+import time
+
+# 所有熔断器（按名称登记，便于统计展示）
+_breakers = {}
+
+STATE_CLOSED = "closed"        # 正常放行
+STATE_OPEN = "open"            # 熔断中：直接失败，不请求上游
+STATE_HALF_OPEN = "half_open"  # 冷却期结束：只放行一个探测请求
+
+STATE_LABELS = {
+    STATE_CLOSED: "正常",
+    STATE_OPEN: "熔断中",
+    STATE_HALF_OPEN: "探测中",
+}
+
+
+class CircuitBreaker:
+    """
+    进程级熔断器（线程安全）
+    - 连续失败达到 failure_threshold 次后熔断，冷却 reset_timeout 秒内的请求直接失败
+    - 冷却结束后放行一个探测请求：成功则恢复，失败则重新熔断
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_started_at = None
+        self.opened = 0
+        self.rejected = 0
+        _breakers[name] = self
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == STATE_OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = STATE_HALF_OPEN
+            self._probe_started_at = None
+        return self._state
+
+    def is_open(self):
+        """是否处于熔断冷却期（只查询状态，不占用探测名额）"""
+        return self.state == STATE_OPEN
+
+    def allow_request(self):
+        """是否允许发出请求（熔断中返回 False 并计入拒绝次数）"""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == STATE_CLOSED:
+                return True
+            if state == STATE_HALF_OPEN:
+                # 只放行一个探测请求；探测请求迟迟没有结果（例如被取消）时允许重新探测
+                if self._probe_started_at is None or now - self._probe_started_at >= self.reset_timeout:
+                    self._probe_started_at = now
+                    return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = STATE_CLOSED
+            self._consecutive_failures = 0
+            self._probe_started_at = None
+
+    def release_probe(self):
+        """请求既不算成功也不算失败（例如被限流）：只释放半开状态的探测名额，不改变连续失败次数"""
+        with self._lock:
+            self._probe_started_at = None
+
+    def record_failure(self):
+        with self._lock:
+            now = time.monotonic()
+            self._consecutive_failures += 1
+            state = self._current_state(now)
+            if state == STATE_HALF_OPEN or (
+                    state == STATE_CLOSED and self._consecutive_failures >= self.failure_threshold):
+                self._state = STATE_OPEN
+                self._opened_at = now
+                self._probe_started_at = None
+                self.opened += 1
+                print(f"⚡ {self.name} 熔断: 连续失败 {self._consecutive_failures} 次，{self.reset_timeout} 秒内直接失败")
+
+    def retry_after(self):
+        """距离冷却结束的秒数（未熔断时为 0）"""
+        with self._lock:
+            if self._current_state(time.monotonic()) != STATE_OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def stats(self):
+        """获取统计信息"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return {
+                "name": self.name,
+                "state": STATE_LABELS[state],
+                "consecutive_failures": self._consecutive_failures,
+                "opened": self.opened,
+                "rejected": self.rejected
+            }
+
+
+def get_circuit_breaker_stats():
+    """获取所有熔断器的统计信息"""
+    return [breaker.stats() for breaker in list(_breakers.values())]
@@ -0,0 +1,225 @@
+import asyncio
+import collections
+import threading
+import time
+
+
+class AIMDController:
+    """
+    AIMD 并发控制器（进程级共享）
+    - 延迟没有明显高于基准延迟时，每完成约一个并发窗口的请求，并发上限加性增加
+    - 基准延迟是成功请求延迟的慢速 EWMA，单次请求的延迟抖动不会阻止增长
+    - 遇到 429/5xx 或超时时，并发上限乘性减少（同一个冷却期内只减少一次）
+    """
+
+    def __init__(self, min_limit=1, max_limit=32, initial_limit=4, increase_step=1,
+                 decrease_factor=0.5, latency_tolerance=1.5, smoothing=0.2, baseline_smoothing=0.02):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.latency_tolerance = latency_tolerance
+        self.smoothing = smoothing
+        self.baseline_smoothing = baseline_smoothing
+
+        self._lock = threading.Lock()
+        self._limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self._latency_ewma = None
+        self._baseline_latency = None
+        self._successes_in_window = 0
+        self._last_decrease_at = 0.0
+        self.increases = 0
+        self.decreases = 0
+
+    @property
+    def current_limit(self):
+        """当前并发上限（整数）"""
+        return int(self._limit)
+
+    def on_success(self, latency):
+        """记录一次成功请求的延迟"""
+        with self._lock:
+            if self._latency_ewma is None:
+                self._latency_ewma = latency
+            else:
+                self._latency_ewma += self.smoothing * (latency - self._latency_ewma)
+
+            # 基准延迟：慢速 EWMA，只有近期延迟持续明显高于长期水平时才视为排队变慢
+            if self._baseline_latency is None:
+                self._baseline_latency = latency
+            else:
+                self._baseline_latency += self.baseline_smoothing * (latency - self._baseline_latency)
+
+            if self._latency_ewma <= self._baseline_latency * self.latency_tolerance:
+                self._successes_in_window += 1
+                if self._successes_in_window >= self.current_limit:
+                    self._limit = min(self.max_limit, self._limit + self.increase_step)
+                    self._successes_in_window = 0
+                    self.increases += 1
+            else:
+                # 延迟上升：保持当前并发，不再增加
+                self._successes_in_window = 0
+
+    def on_congestion(self):
+        """记录一次拥塞信号（429/5xx/超时）"""
+        with self._lock:
+            now = time.monotonic()
+            # 冷却期：同一批在途请求陆续失败时只减少一次
+            cooldown = max(self._latency_ewma or 0.0, 0.5)
+            if now - self._last_decrease_at < cooldown:
+                return
+            self._limit = max(self.min_limit, self._limit * self.decrease_factor)
+            self._successes_in_window = 0
+            self._last_decrease_at = now
+            self.decreases += 1
+
+    def snapshot(self):
+        """获取当前状态"""
+        with self._lock:
+            return {
+                "limit": self.current_limit,
+                "min_limit": self.min_limit,
+                "max_limit": self.max_limit,
+                "latency_ewma": round(self._latency_ewma, 3) if self._latency_ewma is not None else None,
+                "baseline_latency": round(self._baseline_latency, 3) if self._baseline_latency is not None else None,
+                "increases": self.increases,
+                "decreases": self.decreases
+            }
+
+
+class AdaptiveLimiter:
+    """异步并发闸门：在途请求数不超过控制器的当前并发上限（只在事件循环中使用）"""
+
+    def __init__(self, controller):
+        self.controller = controller
+        self.in_flight = 0
+        self._condition = None
+
+    async def __aenter__(self):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.controller.current_limit)
+            self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+
+class RateBudget:
+    """
+    令牌桶请求预算（进程级共享，线程安全）
+    采用预约方式：令牌不足时计算需要等待的时间，请求按到达顺序均匀地分布在时间轴上
+    """
+
+    def __init__(self, rate_per_second, burst=None):
+        self.rate = float(rate_per_second)
+        self.capacity = float(burst if burst is not None else rate_per_second)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """预约一个令牌，返回需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    async def acquire(self):
+        """协程版：等待直到获得一个令牌"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def acquire_blocking(self):
+        """线程版：阻塞直到获得一个令牌"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HedgingPolicy:
+    """
+    对冲请求策略（进程级共享，线程安全）
+    - 对冲延迟：最近 window 个成功请求延迟的 percentile 分位数（样本不足时不对冲）
+    - 额外负载上限：每个主请求积累 max_extra_ratio 个对冲名额，最多积累 burst 个，
+      因此对冲请求长期不超过主请求数量的 max_extra_ratio
+    """
+
+    def __init__(self, percentile=0.95, window=200, min_samples=20, min_delay=0.05,
+                 max_extra_ratio=0.1, burst=3):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_extra_ratio = max_extra_ratio
+        self.burst = float(burst)
+
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=window)
+        self._delay = None
+        self._samples_since_update = 0
+        self._tokens = 0.0
+        self.requests = 0
+        self.issued = 0
+        self.won = 0
+        self.suppressed = 0
+
+    def record_latency(self, latency):
+        """记录一次成功请求的延迟"""
+        with self._lock:
+            self._latencies.append(latency)
+            self._samples_since_update += 1
+
+    def hedge_delay(self):
+        """当前的对冲延迟（秒），样本不足时返回 None"""
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            # 分位数每积累 10 个新样本才重新计算一次
+            if self._delay is None or self._samples_since_update >= 10:
+                ordered = sorted(self._latencies)
+                self._delay = max(self.min_delay, ordered[int(self.percentile * (len(ordered) - 1))])
+                self._samples_since_update = 0
+            return self._delay
+
+    def on_request(self):
+        """记录一次主请求（积累对冲名额）"""
+        with self._lock:
+            self.requests += 1
+            self._tokens = min(self.burst, self._tokens + self.max_extra_ratio)
+
+    def try_acquire(self):
+        """申请一个对冲名额（超出额外负载上限时返回 False）"""
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.issued += 1
+                return True
+            self.suppressed += 1
+            return False
+
+    def record_win(self):
+        """记录一次对冲请求先于主请求返回"""
+        with self._lock:
+            self.won += 1
+
+    def stats(self):
+        """获取统计信息"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "issued": self.issued,
+                "won": self.won,
+                "suppressed": self.suppressed,
+                "delay": round(self._delay, 3) if self._delay is not None else None,
+                "extra_load": round(self.issued / self.requests * 100, 2) if self.requests else 0,
+                "win_rate": round(self.won / self.issued * 100, 2) if self.issued else 0
+            }
@@ -1,7 +1,7 @@
-import requests
 import json
 from datetime import datetime, timedelta
 import streamlit as st
+from http_cassette import http_get
 
 
 def get_accurate_exchange_rate():
@@ -37,7 +37,7 @@ def get_accurate_exchange_rate():
             "currCode": "410"
         }
         
-        response = requests.get(url, params=params, timeout=10)
+        response = http_get(url, params=params, timeout=10)
         response.raise_for_status()
         
         data = response.json()
@@ -92,7 +92,8 @@ def get_estimated_exchange_rate():
     for date_str in date_list:
         try:
             url = f"https://www.unionpayintl.com/upload/jfimg/{date_str}.json"
-            response = requests.get(url, timeout=10)
+            # 录制键不含日期：回放时不受当天日期影响
+            response = http_get(url, timeout=10, cassette_key="unionpay-estimated-rate")
             response.raise_for_status()
 
             data = response.json()
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上游接口本地替身服务
+模拟 /api/stores（库存）和 /api/products/search（产品搜索），用于在不请求真实接口的情况下
+测试和基准测试库存查询流程，可配置：
+- 延迟分布：对数正态分布（中位数 + 离散度），以及一定比例的慢请求（长尾）
+- 错误率：随机返回 500
+- 429 突发：每隔一段时间出现一段持续返回 429 的窗口
+- 响应大小：店铺数量和每个店铺元数据的填充字节数
+
+用法:
+    python fake_upstream.py --port 8765 --latency-ms 80 --error-rate 0.02
+    ARCTERYX_API_BASE_URL=http://127.0.0.1:8765 streamlit run main.py
+
+统计信息: GET /__stats
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def default_store_names(store_count):
+    """真实的韩文店名（不足时补充测试店名）"""
+    # 延迟导入：同一进程中先启动替身服务、再设置 ARCTERYX_API_BASE_URL 并导入库存模块时，
+    # 接口地址不会在设置之前就被确定
+    from inventory_check import store_translation
+    store_names = list(store_translation)[:store_count]
+    return store_names + [f"아크테릭스 테스트점 {i}" for i in range(store_count - len(store_names))]
+
+
+def build_store_rows(product_id, store_names, padding=0):
+    """生成一个SKU的店铺库存行（每个店铺带完整元数据，与真实接口结构相同）"""
+    product_id = int(product_id) if str(product_id).isdigit() else 0
+    rows = []
+    for i, store_name in enumerate(store_names):
+        rows.append({
+            "store_id": 1000 + i,
+            "store_code": f"AK{1000 + i}",
+            "store_name": store_name,
+            "store_type": "DEPARTMENT" if i % 3 else "FLAGSHIP",
+            "local_code": f"{i % 17:02d}",
+            "zipcode": f"{10000 + i * 37}",
+            "address": f"서울특별시 강남구 테헤란로 {100 + i}길 {i * 3 + 1}",
+            "address_detail": f"{i % 9 + 1}층 아크테릭스 매장",
+            "tel": f"02-{3000 + i}-{1000 + i * 7}",
+            "x": f"{127.0 + i / 1000:.6f}",
+            "y": f"{37.5 + i / 1000:.6f}",
+            "open_time": "10:30",
+            "close_time": "20:00",
+            "holiday": "백화점 휴점일에 준함",
+            "description": "아크테릭스 공식 매장입니다. 재고는 실시간으로 변동될 수 있습니다." * 2 + "x" * padding,
+            "image_url": f"https://cdn.arcteryx.co.kr/store/{1000 + i}/main.jpg",
+            "is_pickup": i % 2 == 0,
+            "store_sort": i,
+            "product_option_id": product_id,
+            "usable_stock": (product_id + i) % 5,
+        })
+    return rows
+
+
+def build_stock_payload(product_id, store_names, padding=0):
+    """生成库存接口的完整响应（bytes）"""
+    rows = build_store_rows(product_id, store_names, padding)
+    payload = {"success": True, "message": "", "data": {"total": len(rows), "rows": rows}}
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def build_search_payload(keyword, page=1, display_size=16, gender=None):
+    """生成产品搜索接口的响应：结果数量和产品ID由关键词决定（同一关键词结果稳定）"""
+    seed = int(hashlib.md5(f"{keyword}|{gender}".encode("utf-8")).hexdigest()[:8], 16)
+    total = seed % 40
+    start = (max(1, page) - 1) * display_size
+    rows = [
+        {
+            "product_id": 50000 + (seed + i * 7919) % 50000,
+            "product_name": f"{keyword} {i + 1}",
+            "gender": gender or "UNISEX",
+            "price": 159000 + (seed + i) % 20 * 10000,
+        }
+        for i in range(start, min(total, start + display_size))
+    ]
+    payload = {"success": True, "message": "", "data": {"total": total, "rows": rows}}
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8")
+
+
+def build_product_options(product_id, color_count=6, sizes=("XS", "S", "M", "L", "XL", "XXL")):
+    """生成详情页的选项数组（颜色选项及各颜色下的尺码选项，字段顺序与真实页面相同）"""
+    product_id = int(product_id) if str(product_id).isdigit() else 0
+    options = []
+    for c in range(color_count):
+        color_id = product_id * 100 + c
+        options.append({
+            "id": color_id, "parent_ids": [0], "sale_state": "ON", "value": f"Color {c}/Black",
+            "adjust_price": 0, "color_chips": [f"#{c * 40 % 256:02X}3A5F", "#FFFFFF"][:1 + c % 2],
+            "image_chip": f"https://product.arcteryx.co.kr/images/chips/{color_id}.jpg"
+        })
+        for j, size in enumerate(sizes):
+            options.append({
+                "id": color_id * 10 + j, "parent_ids": [0, color_id],
+                "sale_state": "SOLDOUT" if (c + j) % 4 == 0 else "ON", "value": size,
+                "adjust_price": 0, "sell_price": 459000 + j * 10000,
+                "is_orderable": (c + j) % 4 != 0, "stock": (product_id + c * j) % 7, "images": []
+            })
+    return options
+
+
+def build_product_page(product_id, color_count=6, filler_kb=150, script_count=20, model_name="Beta SL Jacket",
+                       embed="next"):
+    """
+    生成产品详情页HTML，并附带若干统计脚本（var xxx = {...};）和填充内容，使页面大小接近真实页面
+    embed: 选项数据的嵌入方式
+    - "next": 以转义格式嵌在 Next.js 数据脚本中（与真实页面结构相同）
+    - "var": 以未转义的对象赋值（var productData = {...};）放在页面头部的第一个脚本中
+    """
+    product = {"product": {"id": product_id, "season": "24/FW", "options": build_product_options(product_id, color_count)}}
+    if embed == "var":
+        head_script = "<script>var productData = " + json.dumps(product, separators=(",", ":")) + ";</script>"
+        data_script = ""
+    else:
+        head_script = ""
+        data_script = "self.__next_f.push([1," + json.dumps(json.dumps(product, separators=(",", ":"))) + "])"
+    analytics = "".join(
+        f'<script>var dataLayer{i} = {{"event":"view_item","index":{i}}}; window.track{i}();</script>'
+        for i in range(script_count)
+    )
+    filler = "<div class=\"filler\">" + "아크테릭스 제품 상세 정보 " * (filler_kb * 1024 // 40) + "</div>"
+    return (
+        "<html><head>" + head_script + analytics + "</head><body><div id=\"content-wrap\"><div>nav</div>"
+        "<div><div>gallery</div><div><div><div><div>title</div><div>"
+        "<p>Lightweight, packable GORE-TEX shell.</p><p>Helmet compatible hood.</p>"
+        "</div></div></div></div></div><div><p>" + model_name + "</p></div></div>"
+        + filler + "<script>" + data_script + "</script></body></html>"
+    )
+
+
+class _FakeUpstreamServer(ThreadingHTTPServer):
+    # 加大监听队列：并发较高时连接不会因为队列已满而等待重传
+    request_queue_size = 512
+    daemon_threads = True
+
+
+class FakeUpstream:
+    """本地替身服务（在后台线程中运行）"""
+
+    def __init__(self, host="127.0.0.1", port=0, latency_ms=50, latency_sigma=0.3, slow_rate=0.0,
+                 slow_ms=1000, error_rate=0.0, burst_every=0, burst_seconds=0, store_count=55,
+                 padding=0, seed=None):
+        self.host = host
+        self.port = port
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.error_rate = error_rate
+        self.burst_every = burst_every
+        self.burst_seconds = burst_seconds
+        self.padding = padding
+        self.store_count = store_count
+        self._store_names = None
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+        self._started_at = time.monotonic()
+        self.requests = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.bytes_sent = 0
+
+    @property
+    def base_url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def store_names(self):
+        """店铺名称（真实的韩文店名，不足时补充测试店名）"""
+        if self._store_names is None:
+            self._store_names = default_store_names(self.store_count)
+        return self._store_names
+
+    def _sample_latency(self):
+        """对数正态分布的延迟（秒），slow_rate 比例的请求额外增加 slow_ms"""
+        with self._lock:
+            latency = self.latency_ms * math.exp(self._random.gauss(0, self.latency_sigma)) \
+                if self.latency_sigma > 0 else self.latency_ms
+            if self.slow_rate and self._random.random() < self.slow_rate:
+                latency += self.slow_ms
+            fail = self.error_rate and self._random.random() < self.error_rate
+        return latency / 1000, fail
+
+    def _in_burst(self):
+        """是否处于 429 突发窗口（每 burst_every 秒的前 burst_seconds 秒）"""
+        if not self.burst_every or not self.burst_seconds:
+            return False
+        return (time.monotonic() - self._started_at) % self.burst_every < self.burst_seconds
+
+    def _enter(self):
+        with self._lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def _leave(self, path, status, size):
+        with self._lock:
+            self.in_flight -= 1
+            key = f"{path} {status}"
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.bytes_sent += size
+
+    def handle(self, path, query):
+        """处理一个请求，返回 (status, body, headers)"""
+        if path == "/__stats":
+            return 200, json.dumps(self.stats(), ensure_ascii=False).encode("utf-8"), {}
+        if path not in ("/api/stores", "/api/products/search"):
+            return 404, b'{"success":false,"message":"not found"}', {}
+
+        latency, fail = self._sample_latency()
+        time.sleep(latency)
+        if self._in_burst():
+            return 429, b'{"success":false,"message":"too many requests"}', {"Retry-After": "1"}
+        if fail:
+            return 500, b'{"success":false,"message":"internal error"}', {}
+
+        if path == "/api/stores":
+            product_id = query.get("product_option_id", ["0"])[0]
+            return 200, build_stock_payload(product_id, self.store_names, self.padding), {}
+        page = int(query.get("page", ["1"])[0] or 1)
+        display_size = int(query.get("display_size", ["16"])[0] or 16)
+        keyword = query.get("search_keyword", [""])[0]
+        gender = query.get("f_gender[]", [None])[0]
+        return 200, build_search_payload(keyword, page, display_size, gender), {}
+
+    def start(self):
+        """启动服务，返回 base_url"""
+        upstream = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == "/__stats":
+                    self._send(*upstream.handle(parsed.path, {}))
+                    return
+                upstream._enter()
+                status, body = 500, b""
+                try:
+                    status, body, headers = upstream.handle(parsed.path, parse_qs(parsed.query))
+                    self._send(status, body, headers)
+                finally:
+                    upstream._leave(parsed.path, status, len(body))
+
+            def _send(self, status, body, headers):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = _FakeUpstreamServer((self.host, self.port), _Handler)
+        self.port = self._server.server_address[1]
+        self._started_at = time.monotonic()
+        threading.Thread(target=self._server.serve_forever, name="fake-upstream", daemon=True).start()
+        return self.base_url
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def stats(self):
+        """获取统计信息"""
+        with self._lock:
+            return {
+                "requests": dict(sorted(self.requests.items())),
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "bytes_sent": self.bytes_sent
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="上游接口本地替身服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765, help="监听端口（0 为随机端口）")
+    parser.add_argument("--latency-ms", type=float, default=50, help="延迟中位数（毫秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.3, help="对数正态分布的离散度（0 为固定延迟）")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="慢请求比例")
+    parser.add_argument("--slow-ms", type=float, default=1000, help="慢请求额外延迟（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--burst-every", type=float, default=0, help="429 突发周期（秒，0 为关闭）")
+    parser.add_argument("--burst-seconds", type=float, default=0, help="每个周期内返回 429 的时长（秒）")
+    parser.add_argument("--stores", type=int, default=55, help="每个SKU返回的店铺数量")
+    parser.add_argument("--padding", type=int, default=0, help="每个店铺额外填充的字节数")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(
+        host=args.host, port=args.port, latency_ms=args.latency_ms, latency_sigma=args.latency_sigma,
+        slow_rate=args.slow_rate, slow_ms=args.slow_ms, error_rate=args.error_rate,
+        burst_every=args.burst_every, burst_seconds=args.burst_seconds, store_count=args.stores,
+        padding=args.padding, seed=args.seed
+    )
+    base_url = upstream.start()
+    print(f"🧪 本地替身服务已启动: {base_url}", flush=True)
+    print(f"   使用方式: ARCTERYX_API_BASE_URL={base_url}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        print(f"统计信息: {json.dumps(upstream.stats(), ensure_ascii=False)}")
+        upstream.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,8 @@
+import numpy as np
 import pandas as pd
 from io import BytesIO
-from inventory_check import get_store_region
+from inventory_check import store_registry
+from inventory_matrix import InventoryMatrix
 import streamlit as st
 import hashlib
 import json
@@ -18,11 +20,13 @@ def store_in_region(store_name, target_region):
     """检查店铺是否在目标区域"""
     if target_region == "全部":
         return True
-    return get_store_region(store_name) == target_region
+    return store_registry.get(store_name).region == target_region
 
 
 def _hash_inventory_matrix(inventory_matrix):
     """为库存矩阵生成哈希值（用于缓存）"""
+    if isinstance(inventory_matrix, InventoryMatrix):
+        return inventory_matrix.digest()
     try:
         matrix_json = json.dumps(inventory_matrix, sort_keys=True, default=str)
         return hashlib.md5(matrix_json.encode()).hexdigest()
@@ -43,33 +47,33 @@ def apply_filters_and_sort(inventory_matrix_hash, stock_filter, region_filter, s
 
 
 def apply_filters_and_sort_internal(inventory_matrix, stock_filter, region_filter, sort_option):
-    """应用筛选和排序的内部实现"""
-    filtered_data = {}
-
-    for store_name, products in inventory_matrix.items():
-        # 库存状态筛选
-        if stock_filter != "全部":
-            has_stock = any_has_stock(products)
-            if (stock_filter == "有库存" and not has_stock) or \
-                    (stock_filter == "无库存" and has_stock):
-                continue
-
-        # 区域筛选
-        if region_filter != "全部" and not store_in_region(store_name, region_filter):
-            continue
-
-        filtered_data[store_name] = products
-
-    # 排序
+    """应用筛选和排序的内部实现（基于数组运算，返回 InventoryMatrix）"""
+    matrix = InventoryMatrix.from_dict(inventory_matrix)
+    keep = np.ones(len(matrix.stores), dtype=bool)
+
+    # 库存状态筛选
+    if stock_filter != "全部":
+        has_stock = (matrix.values > 0).any(axis=1)
+        if stock_filter == "有库存":
+            keep &= has_stock
+        elif stock_filter == "无库存":
+            keep &= ~has_stock
+
+    # 区域筛选
+    if region_filter != "全部":
+        keep &= np.fromiter((store_in_region(store_name, region_filter) for store_name in matrix.stores),
+                            dtype=bool, count=len(matrix.stores))
+
+    rows = np.flatnonzero(keep)
+
+    # 排序（稳定排序：库存总量相同的店铺保持原有顺序）
     if sort_option != "默认":
-        sorted_items = sorted(
-            filtered_data.items(),
-            key=lambda x: sum(int(stock) for stock in x[1].values() if stock and str(stock).isdigit()),
-            reverse=(sort_option == "库存总量降序")
-        )
-        filtered_data = dict(sorted_items)
-
-    return filtered_data
+        totals = matrix.stock.sum(axis=1)[rows]
+        if sort_option == "库存总量降序":
+            totals = -totals
+        rows = rows[np.argsort(totals, kind="stable")]
+
+    return matrix.take(rows=rows)
 
 
 # 创建缓存版本（使用会话状态缓存）
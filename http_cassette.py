@@ -0,0 +1,159 @@
+import base64
+import gzip
+import hashlib
+import json
+import os
+import threading
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+# 上游请求录制/回放（可通过环境变量开启）：
+# - HTTP_CASSETTE_MODE=record：正常请求上游，并把响应压缩保存到 HTTP_CASSETTE_DIR
+# - HTTP_CASSETTE_MODE=replay：不请求上游，直接返回录制的响应；没有录制的请求视为连接失败
+# 产品搜索、详情页、库存接口和汇率接口都经过这里，回放时走与线上完全相同的解析和统计流程
+MODE_OFF = "off"
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+CASSETTE_MODE = os.environ.get("HTTP_CASSETTE_MODE", MODE_OFF).strip().lower() or MODE_OFF
+CASSETTE_DIR = os.environ.get("HTTP_CASSETTE_DIR", "cassettes")
+
+# 录制时保留的响应头（解析只依赖内容类型和编码）
+_KEPT_HEADERS = ("Content-Type", "Content-Encoding", "Retry-After")
+
+_stats_lock = threading.Lock()
+_stats = {"recorded": 0, "replayed": 0, "missed": 0}
+
+
+class CassetteMiss(requests.exceptions.ConnectionError):
+    """回放模式下没有找到录制的响应"""
+
+
+class CassetteEntry(NamedTuple):
+    """一条录制的响应"""
+    url: str
+    status: int
+    headers: dict
+    body: bytes
+
+    def to_response(self):
+        """还原为 requests.Response（raise_for_status / json / text 与真实响应一致）"""
+        response = requests.Response()
+        response.status_code = self.status
+        response.url = self.url
+        response.headers = CaseInsensitiveDict(self.headers)
+        response._content = self.body
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        if response.encoding is None or response.encoding == "ISO-8859-1":
+            response.encoding = "utf-8"
+        response.reason = "Replayed"
+        return response
+
+
+def is_recording():
+    return CASSETTE_MODE == MODE_RECORD
+
+
+def is_replaying():
+    return CASSETTE_MODE == MODE_REPLAY
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def cassette_path(url, key=None):
+    """录制文件路径：<目录>/<域名>/<请求键的哈希>.json.gz"""
+    digest = hashlib.sha1((key or url).encode("utf-8")).hexdigest()[:20]
+    host = urlparse(url).netloc.replace(":", "_") or "local"
+    return os.path.join(CASSETTE_DIR, host, f"{digest}.json.gz")
+
+
+def save_cassette(url, status, headers, body, key=None):
+    """录制一条响应（非录制模式时不做任何事）"""
+    if not is_recording():
+        return
+    try:
+        text = body.decode("utf-8")
+        encoding = "utf-8"
+    except UnicodeDecodeError:
+        text = base64.b64encode(body).decode("ascii")
+        encoding = "base64"
+    record = {
+        "url": url,
+        "key": key,
+        "status": int(status),
+        "headers": {name: headers[name] for name in _KEPT_HEADERS if name in headers},
+        "encoding": encoding,
+        "body": text
+    }
+    path = cassette_path(url, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # 先写临时文件再替换，并发录制同一URL时不会留下不完整的文件
+    tmp_path = f"{path}.{threading.get_ident()}.tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    _count("recorded")
+
+
+def load_cassette(url, key=None) -> Optional[CassetteEntry]:
+    """回放模式下返回录制的响应，没有录制时抛出 CassetteMiss；非回放模式返回 None"""
+    if not is_replaying():
+        return None
+    path = cassette_path(url, key)
+    try:
+        entry = _read_cassette(path)
+    except FileNotFoundError:
+        _count("missed")
+        raise CassetteMiss(f"没有录制的响应: {key or url}")
+    _count("replayed")
+    return entry
+
+
+def _read_cassette(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        record = json.load(f)
+    body = record["body"]
+    body = base64.b64decode(body) if record.get("encoding") == "base64" else body.encode("utf-8")
+    return CassetteEntry(record["url"], record["status"], record["headers"], body)
+
+
+def iter_cassettes(content_type=None):
+    """遍历录制目录中的全部响应（可按内容类型筛选，例如 "text/html"），用于离线分析和基准测试"""
+    if not os.path.isdir(CASSETTE_DIR):
+        return
+    for root, _, files in os.walk(CASSETTE_DIR):
+        for name in sorted(files):
+            if not name.endswith(".json.gz"):
+                continue
+            entry = _read_cassette(os.path.join(root, name))
+            if content_type and content_type not in CaseInsensitiveDict(entry.headers).get("Content-Type", ""):
+                continue
+            yield entry
+
+
+def http_get(url, params=None, session=None, cassette_key=None, **kwargs):
+    """
+    requests.get 的录制/回放版本（参数与 requests.get 相同）
+    - session: 使用指定的 requests.Session（例如带连接池和重试的全局会话）
+    - cassette_key: 录制键（默认为带参数的完整URL；URL中含有日期等变化部分时可指定固定的键）
+    """
+    full_url = requests.Request("GET", url, params=params).prepare().url
+    entry = load_cassette(full_url, cassette_key)
+    if entry is not None:
+        return entry.to_response()
+
+    response = (session or requests).get(url, params=params, **kwargs)
+    save_cassette(full_url, response.status_code, response.headers, response.content, cassette_key)
+    return response
+
+
+def get_cassette_stats():
+    """获取录制/回放统计信息"""
+    with _stats_lock:
+        return {"mode": CASSETTE_MODE, "dir": CASSETTE_DIR, **_stats}
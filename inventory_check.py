@@ -1,16 +1,36 @@
 import requests
 import json
+import time
+import numpy as np
+from inventory_engine import (
+    STOCK_API_URL, STOCK_HEADERS, decode_stock_payload, stream_stock_batch, stock_flight, stock_controller,
+    stock_budget, stock_breaker, stock_hedging, HEDGE_ENABLED, report_breaker_failure, BREAKER_REJECTED,
+    is_breaker_rejected
+)
+from inventory_store import get_snapshot_store
+from http_cassette import http_get
+from metrics import record_stock_batch, record_stock_fetch, record_stock_request, record_stock_retry
+from inventory_matrix import InventoryMatrix, make_product_key
+from store_registry import StoreRegistry
 # 确保新函数可以被其他模块导入
 __all__ = [
     'get_store_region', 'map_region_to_key', 'simplify_store_name',
     'translate_store_name', 'get_stock_status', 'query_stock_by_product_id',
-    'get_inventory_matrix_transposed', 'calculate_stock_status_distribution',
+    'get_inventory_matrix_transposed', 'iter_inventory_matrix', 'order_inventory_columns',
+    'safe_iter_inventory_matrix', 'batch_query_stock_with_deadline', 'calculate_stock_status_distribution',
     'calculate_region_heatmap', 'calculate_product_depth_stats',
     'calculate_enhanced_inventory_stats',
     'calculate_key_store_analysis'
 
 ]
 
+# 库存快照的最大可用年龄（秒），更新的快照直接复用，不再请求接口
+INVENTORY_MAX_AGE_SECONDS = 300
+# 分块流水线每块的SKU数量
+QUERY_CHUNK_SIZE = 50
+# 一次批量查询的整体截止时间（秒），到期后返回已完成的部分结果
+INVENTORY_BATCH_DEADLINE_SECONDS = 120
+
 # 店铺名称翻译字典
 store_translation = {
     "아크테릭스 롯데백화점 본점": "始祖鸟乐天百货总店",
@@ -141,9 +161,30 @@ def simplify_store_name(store_name):
     if store_name.startswith("始祖鸟"):
         return store_name[3:]  # 去掉前3个字符
     return store_name
+
+# 重点关注店铺列表
+KEY_STORES = [
+    "始祖鸟新世界百货总店", "始祖鸟新世界百货江南店", "始祖鸟新世界百货Centum City店",
+    "始祖鸟乐天百货总店", "始祖鸟旗舰店江南", "始祖鸟釜山店",
+    "始祖鸟骊州Premium Village店", "始祖鸟The Hyundai首尔", "始祖鸟旗舰店大邱寿城",
+    "始祖鸟现代百货板桥店", "始祖鸟钟路店"
+]
+
+# 区域分类（热力图按此顺序输出，最后一项为不在映射表中的店铺）
+REGION_KEYS = ["首尔圈", "京畿道圈", "釜山圈", "大邱圈"]
+OTHER_REGION_KEY = "其他地区"
+
+
+# 店铺注册表：翻译、区域和重点店铺标记在注册时一次性计算
+store_registry = StoreRegistry(
+    store_translation, STORE_REGION_MAPPING, REGION_KEYS, KEY_STORES,
+    region_key_of=map_region_to_key, simplify_name=simplify_store_name
+)
+
+
 def translate_store_name(korean_name):
     """翻译店铺名称"""
-    return store_translation.get(korean_name, korean_name)
+    return store_registry.resolve(korean_name).name
 
 
 def get_stock_status(stock):
@@ -160,289 +201,377 @@ def get_stock_status(stock):
         return "❓❓ 库存信息异常"
 
 
-def query_stock_by_product_id(product_id):
-    """根据产品ID查询库存（保持原有函数不变，用于回退和单个查询）"""
-    url = f"https://api.arcteryx.co.kr/api/stores?limit=0&page=1&local_code=&search_keyword=&x=&y=&product_option_id={product_id}&orderby=store_sort%7Casc"
+def query_stock_by_product_id(product_id, max_age=INVENTORY_MAX_AGE_SECONDS):
+    """根据产品ID查询库存（优先使用未过期的快照，用于回退和单个查询）"""
+    store = get_snapshot_store()
+    cached = store.load_fresh([product_id], max_age)
+    if cached:
+        return cached[str(product_id)]
 
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
-    }
+    # 同一SKU的并发调用共享一次请求
+    return stock_flight.do(str(product_id), _fetch_stock_and_save, product_id)
+
+
+def _fetch_stock_and_save(product_id):
+    """请求库存接口并保存快照"""
+    url = STOCK_API_URL.format(product_id=product_id)
+
+    # 与异步引擎共享熔断器：熔断期间直接失败
+    if not stock_breaker.allow_request():
+        return BREAKER_REJECTED
 
+    status = "error"
+    started = time.monotonic()
     try:
+        # 与异步引擎共享每秒请求预算
+        stock_budget.acquire_blocking()
         # Use connection pooling session instead of creating new request
         session = get_session()
-        response = session.get(url, headers=headers, timeout=10)
+        started = time.monotonic()
+        response = http_get(url, session=session, headers=STOCK_HEADERS, timeout=10)
+        status = response.status_code
+        # urllib3 在连接池内部完成的重试
+        retries = getattr(response.raw, "retries", None)
+        record_stock_retry("sync", len(retries.history) if retries is not None else 0)
+        record_stock_request("sync", status, time.monotonic() - started, len(response.content))
         response.raise_for_status()
-        data = response.json()
-
-        if data.get("success"):
-            return data["data"]["rows"]
-        else:
-            return []
+        rows = decode_stock_payload(response.content)
+        stock_breaker.record_success()
+        record_stock_fetch("sync", bool(rows))
+        get_snapshot_store().save_snapshot(product_id, rows)
+        return rows
 
     except Exception as e:
+        if not isinstance(status, int):
+            status = "timeout" if isinstance(e, requests.exceptions.Timeout) else "error"
+            record_stock_request("sync", status, time.monotonic() - started)
+        report_breaker_failure(status)
+        record_stock_fetch("sync", False)
         print(f"库存查询失败: {e}")
         return []
 
 
-def get_inventory_matrix_transposed(favorites_list):
-    """转置库存矩阵：店铺×产品（并发优化版）"""
-    if not favorites_list:
-        return {}
+def _merge_stock_rows(inventory_data, product_key, stores_data):
+    """将单个产品的店铺库存行合并到库存矩阵中"""
+    if not product_key or not stores_data:
+        return
 
-    # 提取所有SKU ID用于批量查询
-    product_ids = [favorite['sku'] for favorite in favorites_list]
+    # 处理每个店铺的库存数据
+    for store_data in stores_data:
+        # 翻译和区域等信息在注册表中预先计算，这里只做一次查找
+        store_name = store_registry.resolve(store_data.get("store_name", "")).name
+        if store_name not in inventory_data:
+            inventory_data[store_name] = {}
 
-    print(f"开始处理 {len(product_ids)} 个产品的库存查询...")
+        stock_count = store_data.get("usable_stock", 0)
+        inventory_data[store_name][product_key] = stock_count
 
-    # 根据产品数量动态调整并发数（优化版：提高并发度）
-    if len(product_ids) <= 2:
-        max_workers = 1
-    elif len(product_ids) <= 5:
-        max_workers = 3  # Increased from 2
-    elif len(product_ids) <= 10:
-        max_workers = 6  # Increased from 4
-    else:
-        max_workers = 10  # Increased from 8
 
-    # 使用并发查询
-    batch_results = batch_query_stock_concurrent(
-        product_ids,
-        max_workers=max_workers,
-        timeout_per_request=10  # Can be kept at 10, connection pooling helps
-    )
+def order_inventory_columns(inventory_data, favorites_list):
+    """按收藏列表的顺序排列每个店铺的产品列（流式合并时列顺序取决于完成顺序）"""
+    product_keys = list(dict.fromkeys(make_product_key(favorite) for favorite in favorites_list))
+    return {
+        store_name: {key: products[key] for key in product_keys if key in products}
+        for store_name, products in inventory_data.items()
+    }
+
+
+def iter_inventory_matrix(favorites_list, max_age=INVENTORY_MAX_AGE_SECONDS, max_workers=None,
+                          chunk_size=QUERY_CHUNK_SIZE, deadline_seconds=INVENTORY_BATCH_DEADLINE_SECONDS):
+    """
+    流式构建库存矩阵（分块流水线）
+
+    SKU 按 chunk_size 分块依次处理：每块先读取未过期的快照，再并发查询其余SKU，
+    每完成一个就合并到矩阵中；一块全部合并并保存快照后才开始下一块，
+    因此在途请求和待合并结果的内存占用只与块大小有关。
+    某一块的异步查询失败时只对该块剩余的SKU回退到串行查询。
+
+    整个批次共用一个截止时间（deadline_seconds，None 表示不限制）：到期后取消在途请求，
+    之后的块只使用快照；库存接口熔断时同样跳过网络查询。这些SKU记入 progress["missed"]。
+
+    Yields:
+        (sku, stock_rows, inventory_matrix, progress)
+        - inventory_matrix 是持续增长的同一个字典
+        - 查询失败或超时未完成的产品 stock_rows 为空列表（同样会产出，便于统计进度）
+        - progress: {"done", "total", "chunk", "chunks", "elapsed", "eta", "missed"}（时间单位：秒）
+          missed 是持续增长的同一个列表，包含未在截止时间内完成或被熔断拒绝的SKU
+    """
+    if not favorites_list:
+        return
+
+    # 提取所有SKU ID用于批量查询
+    product_ids = list(dict.fromkeys(favorite['sku'] for favorite in favorites_list))
 
     # 构建产品键映射
     product_key_mapping = {}
     for favorite in favorites_list:
-        product_key = f"{favorite['product_model']} {favorite['color']} {favorite['size']}"
+        product_key = make_product_key(favorite)
         product_key_mapping[favorite['sku']] = product_key
 
-    # 转换数据格式
-    inventory_data = {}
-    for product_id, stores_data in batch_results.items():
-        if not stores_data:
-            continue
+    store = get_snapshot_store()
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+    missed = []
+    chunk_size = max(1, chunk_size)
+    chunks = [product_ids[i:i + chunk_size] for i in range(0, len(product_ids), chunk_size)]
+    total = len(product_ids)
+    done = 0
+    fetched_count = 0
+    fetch_time = 0.0
+    start_time = time.time()
+
+    print(f"开始处理 {total} 个产品的库存查询，共 {len(chunks)} 块...")
+
+    def _progress(chunk_index):
+        elapsed = time.time() - start_time
+        # ETA 按网络查询的平均耗时估算（快照命中的SKU几乎不耗时）
+        per_sku = fetch_time / fetched_count if fetched_count else 0.0
+        return {
+            "done": done,
+            "total": total,
+            "chunk": chunk_index,
+            "chunks": len(chunks),
+            "elapsed": round(elapsed, 2),
+            "eta": round(per_sku * (total - done), 2) if fetched_count else None,
+            "missed": missed
+        }
 
-        product_key = product_key_mapping.get(product_id)
-        if not product_key:
+    inventory_data = {}
+    for chunk_index, chunk_ids in enumerate(chunks, 1):
+        # 先读取未过期的快照，只对缺失或过期的SKU发起网络请求
+        cached_results = store.load_fresh(chunk_ids, max_age)
+        stale_ids = [pid for pid in chunk_ids if str(pid) not in cached_results]
+
+        for pid in chunk_ids:
+            rows = cached_results.get(str(pid))
+            if rows:
+                _merge_stock_rows(inventory_data, product_key_mapping.get(pid), rows)
+                done += 1
+                yield pid, rows, inventory_data, _progress(chunk_index)
+
+        if not stale_ids:
             continue
 
-        # 处理每个店铺的库存数据
-        for store_data in stores_data:
-            store_name = translate_store_name(store_data.get("store_name", ""))
-            if store_name not in inventory_data:
-                inventory_data[store_name] = {}
+        # 已过截止时间或库存接口熔断中：本块需要网络查询的SKU直接记为未完成
+        if (deadline is not None and time.monotonic() >= deadline) or stock_breaker.is_open():
+            unfinished_ids = stale_ids
+        else:
+            # 使用并发查询（并发数由共享的 AIMD 控制器决定，max_workers 仅作为本批次的上限）
+            unfinished_ids = dict.fromkeys(stale_ids)
+            fetched_results = {}
+            chunk_started = time.time()
+            try:
+                for pid, rows in stream_stock_query_concurrent(stale_ids, max_workers=max_workers,
+                                                               timeout_per_request=10, deadline=deadline):
+                    if is_breaker_rejected(rows):
+                        # 本块进行中熔断：被拒绝的SKU与截止时间后未完成的SKU一样记为未完成
+                        continue
+                    unfinished_ids.pop(pid, None)
+                    if rows:
+                        fetched_results[pid] = rows
+                        _merge_stock_rows(inventory_data, product_key_mapping.get(pid), rows)
+                    done += 1
+                    fetched_count += 1
+                    fetch_time += time.time() - chunk_started
+                    chunk_started = time.time()
+                    yield pid, rows, inventory_data, _progress(chunk_index)
+            finally:
+                store.save_snapshots(fetched_results)
+
+        for pid in unfinished_ids:
+            missed.append(pid)
+            done += 1
+            yield pid, [], inventory_data, _progress(chunk_index)
+
+        print(f"第 {chunk_index}/{len(chunks)} 块完成: 进度 {done}/{total}, "
+              f"已用时 {round(time.time() - start_time, 2)}秒")
+
+    if missed:
+        print(f"⏱ {len(missed)} 个产品未在截止时间内完成: {missed}")
+
+
+def get_inventory_matrix_transposed(favorites_list, max_age=INVENTORY_MAX_AGE_SECONDS, max_workers=None):
+    """转置库存矩阵：店铺×产品（并发优化版，未过期的快照直接复用）"""
+    if not favorites_list:
+        return {}
 
-            stock_count = store_data.get("usable_stock", 0)
-            inventory_data[store_name][product_key] = stock_count
+    inventory_data = {}
+    for _, _, inventory_data, _ in iter_inventory_matrix(favorites_list, max_age=max_age, max_workers=max_workers):
+        pass
+    inventory_data = order_inventory_columns(inventory_data, favorites_list)
 
     print(f"库存矩阵构建完成: 共 {len(inventory_data)} 个店铺")
     return inventory_data
+
+
+def _region_codes(store_names):
+    """每个店铺的区域分类下标（REGION_KEYS 中的位置，其他地区为 len(REGION_KEYS)）"""
+    return np.fromiter((store_registry.get(name).region_code for name in store_names),
+                       dtype=np.intp, count=len(store_names))
+
+
+def _percentage(count, total):
+    return round((count / total) * 100, 2)
+
+
 def calculate_stock_status_distribution(inventory_matrix):
-    """计算库存状态分布"""
+    """
+    计算库存状态分布（数组运算）
+
+    店铺中按列顺序第一个有库存的产品为 1~2 件时记为低库存店铺
+    """
+    matrix = InventoryMatrix.from_dict(inventory_matrix)
     stock_stats = {
         "高库存店铺": {"count": 0, "percentage": 0},
         "低库存店铺": {"count": 0, "percentage": 0},
         "无库存店铺": {"count": 0, "percentage": 0}
     }
 
-    total_stores = len(inventory_matrix)
+    total_stores = len(matrix)
     if total_stores == 0:
         return stock_stats
 
-    for store_data in inventory_matrix.values():
-        has_stock = False
-        low_stock = False
-
-        for stock in store_data.values():
-            if stock and str(stock).isdigit():
-                stock_count = int(stock)
-                if stock_count > 0:
-                    has_stock = True
-                    if 1 <= stock_count <= 2:
-                        low_stock = True
-                    break
-
-        if has_stock:
-            if low_stock:
-                stock_stats["低库存店铺"]["count"] += 1
-            else:
-                stock_stats["高库存店铺"]["count"] += 1
-        else:
-            stock_stats["无库存店铺"]["count"] += 1
+    in_stock = matrix.values > 0
+    has_stock = in_stock.any(axis=1)
+    if matrix.products:
+        first_stock = matrix.values[np.arange(total_stores), in_stock.argmax(axis=1)]
+        low_stock = has_stock & (first_stock <= 2)
+    else:
+        low_stock = has_stock
+
+    stock_stats["低库存店铺"]["count"] = int(low_stock.sum())
+    stock_stats["高库存店铺"]["count"] = int(has_stock.sum()) - stock_stats["低库存店铺"]["count"]
+    stock_stats["无库存店铺"]["count"] = total_stores - int(has_stock.sum())
 
     # 计算百分比
     for key in stock_stats:
-        stock_stats[key]["percentage"] = round((stock_stats[key]["count"] / total_stores) * 100, 2)
+        stock_stats[key]["percentage"] = _percentage(stock_stats[key]["count"], total_stores)
 
     return stock_stats
 
 
 def calculate_region_heatmap(inventory_matrix):
-    """计算区域库存热力图数据"""
+    """计算区域库存热力图数据（数组运算）"""
+    matrix = InventoryMatrix.from_dict(inventory_matrix)
     region_stats = {
-        "首尔圈": {"count": 0, "percentage": 0, "inventory": 0},
-        "京畿道圈": {"count": 0, "percentage": 0, "inventory": 0},
-        "釜山圈": {"count": 0, "percentage": 0, "inventory": 0},
-        "大邱圈": {"count": 0, "percentage": 0, "inventory": 0},
-        "其他地区": {"count": 0, "percentage": 0, "inventory": 0}
+        key: {"count": 0, "percentage": 0, "inventory": 0} for key in REGION_KEYS + [OTHER_REGION_KEY]
     }
 
-    total_stores = len(inventory_matrix)
+    total_stores = len(matrix)
     if total_stores == 0:
         return region_stats
 
-    for store_name, store_data in inventory_matrix.items():
-        # 获取店铺区域
-        region = get_store_region(store_name)
-
-        # 确定区域分类
-        if region == "首尔城区":
-            region_key = "首尔圈"
-        elif region == "京畿道地区":
-            region_key = "京畿道圈"
-        elif region == "釜山":
-            region_key = "釜山圈"
-        elif region == "大邱":
-            region_key = "大邱圈"
-        else:
-            region_key = "其他地区"
-
-        # 统计店铺数量
-        region_stats[region_key]["count"] += 1
+    codes = _region_codes(matrix.stores)
+    store_counts = np.bincount(codes, minlength=len(region_stats))
+    store_totals = matrix.stock.sum(axis=1, dtype=np.int64)
+    region_inventory = np.zeros(len(region_stats), dtype=np.int64)
+    np.add.at(region_inventory, codes, store_totals)
 
-        # 统计库存总量
-        total_inventory = 0
-        for stock in store_data.values():
-            if stock and str(stock).isdigit():
-                total_inventory += int(stock)
-        region_stats[region_key]["inventory"] += total_inventory
-
-    # 计算百分比
-    for key in region_stats:
-        if total_stores > 0:
-            region_stats[key]["percentage"] = round((region_stats[key]["count"] / total_stores) * 100, 2)
+    for i, key in enumerate(region_stats):
+        region_stats[key]["count"] = int(store_counts[i])
+        region_stats[key]["inventory"] = int(region_inventory[i])
+        region_stats[key]["percentage"] = _percentage(region_stats[key]["count"], total_stores)
 
     return region_stats
 
 
 def calculate_product_depth_stats(favorites_list, inventory_matrix):
-    """计算产品深度库存统计（包含店铺详情）"""
-    product_stats = {}
+    """
+    计算产品深度库存统计（包含店铺详情，数组运算）
+
+    每个区域先对全部产品列做一次按库存降序的稳定排序，
+    之后每个产品只需取出排序结果中有库存的前几行
+    """
+    matrix = InventoryMatrix.from_dict(inventory_matrix)
+    stock = matrix.stock
+    codes = _region_codes(matrix.stores)
+    simplified_names = [store_registry.get(name).simplified_name for name in matrix.stores]
+
+    product_totals = stock.sum(axis=0, dtype=np.int64)
+    product_store_counts = (stock > 0).sum(axis=0)
+
+    # 每个区域：店铺下标、按库存降序的稳定排序、有库存的店铺数
+    region_orders = []
+    for code in range(len(REGION_KEYS)):
+        rows = np.flatnonzero(codes == code)
+        region_stock = stock[rows]
+        order = np.argsort(-region_stock, axis=0, kind="stable")
+        region_orders.append((rows, region_stock, order, (region_stock > 0).sum(axis=0)))
 
+    product_stats = {}
     for favorite in favorites_list:
-        product_key = f"{favorite['product_model']} {favorite['color']} {favorite['size']}"
+        product_key = make_product_key(favorite)
+        j = matrix.product_index.get(product_key)
+
+        region_distribution = {}
+        for region_key, (rows, region_stock, order, counts) in zip(REGION_KEYS, region_orders):
+            stores = []
+            total = 0
+            if j is not None and counts[j]:
+                top = order[:counts[j], j]
+                top_stock = region_stock[top, j].tolist()
+                total = sum(top_stock)
+                stores = [
+                    {"store_name": simplified_names[i], "stock": count}
+                    for i, count in zip(rows[top].tolist(), top_stock)
+                ]
+            region_distribution[region_key] = {"total": total, "stores": stores}
 
         product_stats[product_key] = {
-            "total_inventory": 0,
-            "stores_with_stock": 0,
-            "region_distribution": {
-                "首尔圈": {"total": 0, "stores": []},
-                "京畿道圈": {"total": 0, "stores": []},
-                "釜山圈": {"total": 0, "stores": []},
-                "大邱圈": {"total": 0, "stores": []}
-            }
+            "total_inventory": int(product_totals[j]) if j is not None else 0,
+            "stores_with_stock": int(product_store_counts[j]) if j is not None else 0,
+            "region_distribution": region_distribution
         }
 
-        # 统计每个店铺的库存
-        for store_name, products in inventory_matrix.items():
-            if product_key in products:
-                stock = products[product_key]
-                if stock and str(stock).isdigit():
-                    stock_count = int(stock)
-                    if stock_count > 0:
-                        # 更新总统计
-                        product_stats[product_key]["total_inventory"] += stock_count
-                        product_stats[product_key]["stores_with_stock"] += 1
-
-                        # 确定区域
-                        region = get_store_region(store_name)
-                        region_key = map_region_to_key(region)
-
-                        if region_key:
-                            # 简化店铺名称
-                            simplified_name = simplify_store_name(store_name)
-
-                            # 添加店铺详情
-                            product_stats[product_key]["region_distribution"][region_key]["total"] += stock_count
-                            product_stats[product_key]["region_distribution"][region_key]["stores"].append({
-                                "store_name": simplified_name,
-                                "stock": stock_count
-                            })
-
-        # 对每个区域的店铺按库存量降序排序
-        for region_key in product_stats[product_key]["region_distribution"]:
-            product_stats[product_key]["region_distribution"][region_key]["stores"].sort(
-                key=lambda x: x["stock"], reverse=True
-            )
-
     return product_stats
 
 
 def calculate_key_store_analysis(favorites_list, inventory_matrix):
-    """计算重点关注店铺库存分析"""
-    # 重点关注店铺列表
-    key_stores = [
-        "始祖鸟新世界百货总店", "始祖鸟新世界百货江南店", "始祖鸟新世界百货Centum City店",
-        "始祖鸟乐天百货总店", "始祖鸟旗舰店江南", "始祖鸟釜山店",
-        "始祖鸟骊州Premium Village店", "始祖鸟The Hyundai首尔", "始祖鸟旗舰店大邱寿城",
-        "始祖鸟现代百货板桥店", "始祖鸟钟路店"
-    ]
+    """计算重点关注店铺库存分析（数组运算）"""
+    matrix = InventoryMatrix.from_dict(inventory_matrix)
+    product_keys = [make_product_key(favorite) for favorite in favorites_list]
+    columns = np.fromiter((matrix.product_index.get(key, -1) for key in product_keys),
+                          dtype=np.intp, count=len(product_keys))
+    known_columns = columns >= 0
 
     result = {}
 
     # 为每个重点关注店铺创建产品库存列表
-    for store_name in key_stores:
-        if store_name in inventory_matrix:
-            store_products = []
-
-            # 遍历所有收藏产品
-            for favorite in favorites_list:
-                product_key = f"{favorite['product_model']} {favorite['color']} {favorite['size']}"
-
-                if product_key in inventory_matrix[store_name]:
-                    stock = inventory_matrix[store_name][product_key]
-                    if stock and str(stock).isdigit():
-                        stock_count = int(stock)
-                        if stock_count > 0:
-                            # 有库存：显示数量
-                            display_text = f"{product_key}({stock_count}件)"
-                        else:
-                            # 无库存：显示"无"
-                            display_text = f"{product_key}(无)"
-                    else:
-                        # 库存信息异常或无库存
-                        display_text = f"{product_key}(无)"
-                else:
-                    # 店铺中没有该产品的记录
-                    display_text = f"{product_key}(无)"
-
-                store_products.append({
-                    "product_key": product_key,
-                    "display_text": display_text,
-                    "stock_count": int(stock) if stock and str(stock).isdigit() else 0
-                })
-
-            # 按库存量降序排序
-            store_products.sort(key=lambda x: x["stock_count"], reverse=True)
-            result[store_name] = store_products
-        else:
+    for store in store_registry.key_stores:
+        store_name = store.name
+        i = matrix.store_index.get(store_name)
+        if i is None:
             # 如果店铺不在库存矩阵中，创建空列表
             result[store_name] = []
+            continue
+
+        # 店铺中没有该产品的记录或库存信息异常时按 0 件计
+        store_stock = np.zeros(len(product_keys), dtype=np.int32)
+        store_stock[known_columns] = matrix.values[i, columns[known_columns]].clip(min=0)
+        order = np.argsort(-store_stock, kind="stable")
+
+        store_products = []
+        for k, stock_count in zip(order.tolist(), store_stock[order].tolist()):
+            product_key = product_keys[k]
+            store_products.append({
+                "product_key": product_key,
+                "display_text": f"{product_key}({stock_count}件)" if stock_count > 0 else f"{product_key}(无)",
+                "stock_count": stock_count
+            })
+        result[store_name] = store_products
 
     return result
+
+
 def calculate_enhanced_inventory_stats(inventory_matrix):
     """计算增强版库存统计（替换原有的calculate_inventory_stats）"""
+    inventory_matrix = InventoryMatrix.from_dict(inventory_matrix)
     return {
         "stock_status": calculate_stock_status_distribution(inventory_matrix),
         "region_heatmap": calculate_region_heatmap(inventory_matrix)
     }
 
 
-import concurrent.futures
-import time
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 # Add connection pooling after imports
 from requests.adapters import HTTPAdapter
@@ -469,7 +598,7 @@ def get_session():
         adapter = HTTPAdapter(
             max_retries=retry_strategy,
             pool_connections=10,  # 连接池大小
-            pool_maxsize=10  # 单个主机最大连接数
+            pool_maxsize=stock_controller.max_limit  # 单个主机最大连接数（与并发控制器上限一致）
         )
         
         _session.mount("http://", adapter)
@@ -478,87 +607,142 @@ def get_session():
     return _session
 
 
-def batch_query_stock_concurrent(product_ids: List[str], max_workers: int = 3, timeout_per_request: int = 10) -> Dict[
-    str, Any]:
+def stream_stock_query_concurrent(product_ids: List[str], max_workers: Optional[int] = None,
+                                  timeout_per_request: int = 10,
+                                  deadline: Optional[float] = None) -> Iterator[Tuple[str, List[Any]]]:
     """
-    并发批量查询库存（稳定可靠版本）
+    并发批量查询库存（流式版本，基于异步引擎）：每个产品查询完成后立即产出
 
     Args:
         product_ids: 产品ID列表
-        max_workers: 最大并发数（默认3，保守设置）
+        max_workers: 本批次最大在途请求数（默认None，由共享的 AIMD 控制器自适应调整）
         timeout_per_request: 单个请求超时时间（秒）
+        deadline: 整体截止时间（time.monotonic() 时间戳），到期后不再产出，未产出的产品即为超时
 
-    Returns:
-        查询结果字典 {product_id: stock_data}
+    Yields:
+        (product_id, stock_data)，失败或返回空数据的产品 stock_data 为空列表
     """
-    results = {}
-    failed_queries = []
-
     # 参数验证
     if not product_ids:
-        return {}
+        return
 
-    if max_workers > 15:  # 安全限制，最大并发数不超过5
-        max_workers = 15
+    succeeded = 0
+    failed_queries = []
+    pending_ids = dict.fromkeys(product_ids)
+    total_ids = len(pending_ids)
 
-    print(f"开始并发查询 {len(product_ids)} 个产品，并发数: {max_workers}")
+    controller_state = stock_controller.snapshot()
+    print(f"开始并发查询 {len(product_ids)} 个产品，当前并发上限: {controller_state['limit']}"
+          + (f"（本批次上限 {max_workers}）" if max_workers else ""))
     start_time = time.time()
 
     try:
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # 提交所有查询任务
-            future_to_id = {
-                executor.submit(query_stock_by_product_id, pid): pid
-                for pid in product_ids
-            }
-
-            # 处理完成的任务
-            for future in concurrent.futures.as_completed(future_to_id):
-                product_id = future_to_id[future]
-                try:
-                    # 设置单个请求超时
-                    stock_data = future.result(timeout=timeout_per_request)
-                    if stock_data:
-                        results[product_id] = stock_data
-                        print(f"✓ 成功查询产品 {product_id}")
-                    else:
-                        failed_queries.append((product_id, "返回空数据"))
-                        print(f"⚠ 产品 {product_id} 返回空数据")
-
-                except concurrent.futures.TimeoutError:
-                    failed_queries.append((product_id, "请求超时"))
-                    print(f"⏰ 产品 {product_id} 查询超时")
-                except Exception as e:
-                    failed_queries.append((product_id, str(e)))
-                    print(f"❌ 产品 {product_id} 查询失败: {e}")
-
-    except Exception as e:
-        print(f"并发查询执行器异常: {e}")
-        # 回退到串行查询
-        return fallback_serial_query(product_ids)
+        try:
+            for product_id, stock_data in stream_stock_batch(product_ids, max_in_flight=max_workers,
+                                                             timeout=timeout_per_request, deadline=deadline):
+                pending_ids.pop(product_id, None)
+                if stock_data:
+                    succeeded += 1
+                    print(f"✓ 成功查询产品 {product_id}")
+                elif is_breaker_rejected(stock_data):
+                    failed_queries.append((product_id, "熔断拒绝"))
+                else:
+                    failed_queries.append((product_id, "返回空数据"))
+                    print(f"⚠ 产品 {product_id} 返回空数据")
+                yield product_id, stock_data
+        except Exception as e:
+            print(f"异步查询引擎异常: {e}")
+            # 剩余产品回退到串行查询（同样受截止时间约束）
+            print("回退到串行查询模式...")
+            for product_id, stock_data in _iter_serial_query(list(pending_ids), deadline=deadline):
+                pending_ids.pop(product_id, None)
+                succeeded += 1 if stock_data else 0
+                yield product_id, stock_data
+            return
+    finally:
+        # 批次指标（调用方提前停止时同样记录，未产出的产品计为未完成）
+        record_stock_batch(total_ids, succeeded, len(pending_ids), time.time() - start_time)
 
     # 统计信息
     end_time = time.time()
     duration = round(end_time - start_time, 2)
-    success_rate = len(results) / len(product_ids) * 100 if product_ids else 0
+    success_rate = succeeded / len(product_ids) * 100 if product_ids else 0
 
-    print(f"并发查询完成: 成功 {len(results)}/{len(product_ids)} "
+    print(f"并发查询完成: 成功 {succeeded}/{len(product_ids)} "
           f"({success_rate:.1f}%), 耗时 {duration}秒")
 
     if failed_queries:
         print(f"失败查询: {failed_queries}")
 
-    return results
+    controller_state = stock_controller.snapshot()
+    print(f"并发控制器: 上限 {controller_state['limit']}, 平均延迟 {controller_state['latency_ewma']}秒, "
+          f"增加 {controller_state['increases']} 次, 降低 {controller_state['decreases']} 次")
+
+    flight_stats = stock_flight.stats()
+    print(f"请求合并统计: 累计发出 {flight_stats['executed']} 次，合并 {flight_stats['collapsed']} 次")
+
+    if HEDGE_ENABLED:
+        hedge_stats = stock_hedging.stats()
+        print(f"对冲请求统计: 对冲延迟 {hedge_stats['delay']}秒, 发出 {hedge_stats['issued']} 次"
+              f"（额外负载 {hedge_stats['extra_load']}%），对冲胜出 {hedge_stats['won']} 次")
+
 
+def batch_query_stock_concurrent(product_ids: List[str], max_workers: Optional[int] = None,
+                                 timeout_per_request: int = 10) -> Dict[
+    str, Any]:
+    """
+    并发批量查询库存（基于异步引擎，不再为每次查询创建线程池）
 
-def fallback_serial_query(product_ids: List[str]) -> Dict[str, Any]:
+    Args:
+        product_ids: 产品ID列表
+        max_workers: 本批次最大在途请求数（默认None，由共享的 AIMD 控制器自适应调整）
+        timeout_per_request: 单个请求超时时间（秒）
+
+    Returns:
+        查询结果字典 {product_id: stock_data}
     """
-    回退串行查询（当并发查询失败时使用）
+    return {
+        product_id: stock_data
+        for product_id, stock_data in stream_stock_query_concurrent(
+            product_ids, max_workers=max_workers, timeout_per_request=timeout_per_request
+        )
+        if stock_data
+    }
+
+
+def batch_query_stock_with_deadline(product_ids: List[str], batch_timeout: float = INVENTORY_BATCH_DEADLINE_SECONDS,
+                                    max_workers: Optional[int] = None,
+                                    timeout_per_request: int = 10) -> Dict[str, Any]:
     """
-    print("回退到串行查询模式...")
+    带整体截止时间的批量查询：到期后返回已完成的部分结果
+
+    Returns:
+        {"results": {product_id: stock_data}, "missed": [未在截止时间内完成的product_id], "duration": 秒}
+    """
+    start_time = time.monotonic()
+    deadline = start_time + batch_timeout
+    pending_ids = dict.fromkeys(product_ids)
     results = {}
+    for product_id, stock_data in stream_stock_query_concurrent(
+            list(pending_ids), max_workers=max_workers, timeout_per_request=timeout_per_request,
+            deadline=deadline):
+        pending_ids.pop(product_id, None)
+        if stock_data:
+            results[product_id] = stock_data
+
+    return {
+        "results": results,
+        "missed": list(pending_ids),
+        "duration": round(time.monotonic() - start_time, 2)
+    }
+
 
+def _iter_serial_query(product_ids: List[str], deadline: Optional[float] = None) -> Iterator[Tuple[str, List[Any]]]:
+    """逐个串行查询并产出 (product_id, stock_data)；超过截止时间后停止"""
     for i, pid in enumerate(product_ids, 1):
+        if deadline is not None and time.monotonic() >= deadline:
+            print(f"串行查询已到截止时间: 剩余 {len(product_ids) - i + 1} 个产品未查询")
+            return
         try:
             # 添加延迟避免请求过快
             if i > 1:
@@ -566,26 +750,31 @@ def fallback_serial_query(product_ids: List[str]) -> Dict[str, Any]:
 
             stock_data = query_stock_by_product_id(pid)
             if stock_data:
-                results[pid] = stock_data
                 print(f"串行查询进度: {i}/{len(product_ids)} - ✓ {pid}")
             else:
                 print(f"串行查询进度: {i}/{len(product_ids)} - ⚠ {pid} (空数据)")
 
         except Exception as e:
+            stock_data = []
             print(f"串行查询进度: {i}/{len(product_ids)} - ❌ {pid} (失败: {e})")
 
-    return results
+        yield pid, stock_data
 
 
-def safe_batch_query(favorites_list, max_workers=None):
+def fallback_serial_query(product_ids: List[str], deadline: Optional[float] = None) -> Dict[str, Any]:
     """
-    安全的批量查询入口函数
-    包含各种边界条件检查和保护措施
+    回退串行查询（当并发查询失败时使用）
     """
+    print("回退到串行查询模式...")
+    return {pid: stock_data for pid, stock_data in _iter_serial_query(product_ids, deadline=deadline) if stock_data}
+
+
+def _validate_favorites(favorites_list):
+    """验证收藏列表中的SKU格式，返回可查询的收藏"""
     # 参数检查
     if not favorites_list:
         print("警告: 传入空收藏列表")
-        return {}
+        return []
 
     # 验证SKU格式
     valid_favorites = []
@@ -598,26 +787,38 @@ def safe_batch_query(favorites_list, max_workers=None):
 
     if not valid_favorites:
         print("错误: 没有有效的SKU可供查询")
-        return {}
+        return []
 
-    # 限制最大查询数量（安全限制）
-    MAX_QUERY_LIMIT = 50
-    if len(valid_favorites) > MAX_QUERY_LIMIT:
-        print("警告: 查询数量超过限制 " + str(MAX_QUERY_LIMIT) + "，进行截断")
-        valid_favorites = valid_favorites[:MAX_QUERY_LIMIT]
-
-    # 动态计算并发数（更激进的并发策略）
-    if max_workers is None:
-        if len(valid_favorites) <= 2:
-            max_workers = 1
-        elif len(valid_favorites) <= 5:
-            max_workers = 3  # Increased from 2
-        elif len(valid_favorites) <= 15:
-            max_workers = 5  # Increased from 3
-        else:
-            max_workers = 8  # Increased from 3
+    # 不再截断查询数量：分块流水线按块处理，并受进程级每秒请求预算约束
+    return valid_favorites
 
-    print("安全查询配置: " + str(len(valid_favorites)) + "个产品, 并发数: " + str(max_workers))
+
+def safe_batch_query(favorites_list, max_workers=None):
+    """
+    安全的批量查询入口函数
+    包含各种边界条件检查和保护措施
+    """
+    valid_favorites = _validate_favorites(favorites_list)
+    if not valid_favorites:
+        return {}
+
+    # 并发数由共享的 AIMD 控制器自适应调整，传入的 max_workers 作为本批次上限
+    concurrency_text = str(max_workers) if max_workers else "自适应(当前" + str(stock_controller.current_limit) + ")"
+    print("安全查询配置: " + str(len(valid_favorites)) + "个产品, 并发数: " + concurrency_text)
 
     # 执行查询
-    return get_inventory_matrix_transposed(valid_favorites)
\ No newline at end of file
+    return get_inventory_matrix_transposed(valid_favorites, max_workers=max_workers)
+
+
+def safe_iter_inventory_matrix(favorites_list, max_workers=None):
+    """
+    安全的流式查询入口函数（边界检查与 safe_batch_query 相同）
+
+    Yields:
+        (sku, stock_rows, inventory_matrix, progress)，格式同 iter_inventory_matrix
+    """
+    valid_favorites = _validate_favorites(favorites_list)
+    if not valid_favorites:
+        return
+
+    yield from iter_inventory_matrix(valid_favorites, max_workers=max_workers)
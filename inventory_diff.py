@@ -0,0 +1,213 @@
+import numpy as np
+
+from inventory_check import REGION_KEYS, store_registry
+from inventory_matrix import UNKNOWN_STOCK, InventoryMatrix
+
+# 变化类型
+DELTA_RESTOCKED = "restocked"   # 无库存 → 有库存
+DELTA_SOLD_OUT = "sold_out"     # 有库存 → 无库存
+DELTA_CHANGED = "changed"       # 有库存，数量变化
+
+DELTA_LABELS = {
+    DELTA_RESTOCKED: "补货",
+    DELTA_SOLD_OUT: "售罄",
+    DELTA_CHANGED: "数量变化",
+}
+
+# 每个区域分类包含的店铺（汇总区域级变化时只遍历相关区域的店铺）
+_REGION_STORES = {region_key: store_registry.stores_in_region(region_key) for region_key in REGION_KEYS}
+
+
+def _normalize_stock(stock):
+    """与统计函数一致的库存解析：数字返回整数，其他返回 None（未知）"""
+    if stock is not None and str(stock).isdigit():
+        return int(stock)
+    return None
+
+
+def _classify_change(old_stock, new_stock):
+    """单元格或区域的变化类型（不视为变化时返回 None）"""
+    if old_stock <= 0 < new_stock:
+        return DELTA_RESTOCKED
+    if new_stock <= 0 < old_stock:
+        return DELTA_SOLD_OUT
+    if new_stock > 0 and old_stock > 0:
+        return DELTA_CHANGED
+    return None
+
+
+def flatten_inventory_matrix(inventory_matrix):
+    """
+    将 店铺×产品 矩阵展开为哈希表 {(store_name, product_key): stock}（供轮询任务等字典形式的比较使用）
+    未知的库存值不放入表中；会话中比较两次查询结果时使用 diff_inventory_snapshots，不需要展开
+    """
+    if isinstance(inventory_matrix, InventoryMatrix):
+        rows, cols = np.nonzero(inventory_matrix.known_mask)
+        stores, products = inventory_matrix.stores, inventory_matrix.products
+        return {
+            (stores[i], products[j]): stock
+            for i, j, stock in zip(rows.tolist(), cols.tolist(), inventory_matrix.values[rows, cols].tolist())
+        }
+
+    cells = {}
+    for store_name, products in inventory_matrix.items():
+        for product_key, stock in products.items():
+            stock_count = _normalize_stock(stock)
+            if stock_count is not None:
+                cells[(store_name, product_key)] = stock_count
+    return cells
+
+
+def diff_inventory_cells(old_cells, new_cells):
+    """
+    比较两个展开后的库存表，返回按 (产品, 店铺) 排序的变化列表
+
+    通过哈希表的 items 集合差集找出变化的单元格（在 C 层完成），
+    之后的分类处理只与变化的单元格数量成正比。
+    旧表中不存在的单元格（新增收藏或上次查询失败）不视为变化，
+    新表中不存在的单元格（本次查询失败）也不视为售罄。
+    """
+    deltas = []
+    for key, new_stock in new_cells.items() - old_cells.items():
+        old_stock = old_cells.get(key)
+        if old_stock is None:
+            continue
+
+        kind = _classify_change(old_stock, new_stock)
+        if kind is None:
+            continue
+
+        store_name, product_key = key
+        deltas.append({
+            "kind": kind,
+            "store_name": store_name,
+            "product_key": product_key,
+            "old": old_stock,
+            "new": new_stock,
+        })
+
+    deltas.sort(key=lambda d: (d["product_key"], d["store_name"]))
+    return deltas
+
+
+def diff_inventory_matrices(old_matrix, new_matrix):
+    """比较两个库存矩阵（字典形式或 InventoryMatrix）"""
+    return diff_inventory_cells(flatten_inventory_matrix(old_matrix or {}),
+                                flatten_inventory_matrix(new_matrix or {}))
+
+
+def _touched_regions(deltas):
+    """变化单元格涉及的 (产品, 区域)"""
+    touched = set()
+    for delta in deltas:
+        region_key = store_registry.get(delta["store_name"]).region_key
+        if region_key:
+            touched.add((delta["product_key"], region_key))
+    return touched
+
+
+def diff_region_totals(old_cells, new_cells, deltas):
+    """
+    汇总区域级变化（例如"釜山圈售罄"）：只计算变化单元格涉及的 (产品, 区域)
+
+    Returns:
+        [{"kind", "region", "product_key", "old", "new"}]
+    """
+    touched = _touched_regions(deltas)
+    if not touched:
+        return []
+
+    region_deltas = []
+    for (product_key, region_key) in sorted(touched):
+        stores = _REGION_STORES.get(region_key, [])
+        old_total = sum(old_cells.get((store, product_key), 0) for store in stores)
+        # 本次查询缺失的单元格沿用上次的值，避免把查询失败误判为售罄
+        new_total = sum(new_cells.get((store, product_key), old_cells.get((store, product_key), 0))
+                        for store in stores)
+        if old_total == new_total:
+            continue
+        region_deltas.append({
+            "kind": _classify_change(old_total, new_total) or DELTA_CHANGED,
+            "region": region_key,
+            "product_key": product_key,
+            "old": old_total,
+            "new": new_total,
+        })
+    return region_deltas
+
+
+def _aligned_indexes(old_names, new_index):
+    """两个矩阵共有的行（或列）：返回 (旧矩阵下标, 新矩阵下标)，按旧矩阵的顺序"""
+    pairs = [(i, new_index[name]) for i, name in enumerate(old_names) if name in new_index]
+    old_idx = np.fromiter((i for i, _ in pairs), dtype=np.intp, count=len(pairs))
+    new_idx = np.fromiter((j for _, j in pairs), dtype=np.intp, count=len(pairs))
+    return old_idx, new_idx
+
+
+def _region_totals(old_matrix, new_matrix, product_key, region_key):
+    """区域内某产品的库存合计：(旧合计, 新合计)；本次查询缺失的单元格沿用上次的值"""
+    old_j = old_matrix.product_index.get(product_key)
+    new_j = new_matrix.product_index.get(product_key)
+    old_total = new_total = 0
+    for store_name in _REGION_STORES.get(region_key, []):
+        old_i = old_matrix.store_index.get(store_name)
+        new_i = new_matrix.store_index.get(store_name)
+        old_stock = old_matrix.values[old_i, old_j] if old_i is not None and old_j is not None else UNKNOWN_STOCK
+        new_stock = new_matrix.values[new_i, new_j] if new_i is not None and new_j is not None else UNKNOWN_STOCK
+        old_stock = int(old_stock) if old_stock != UNKNOWN_STOCK else 0
+        old_total += old_stock
+        new_total += int(new_stock) if new_stock != UNKNOWN_STOCK else old_stock
+    return old_total, new_total
+
+
+def diff_inventory_snapshots(old_matrix, new_matrix):
+    """
+    比较两次查询的 InventoryMatrix，返回 {"cells": 店铺变化, "regions": 区域变化}
+
+    按共有的店铺和产品对齐两个数组，用 np.nonzero 找出两边都已知且不相等的单元格，
+    之后只为变化的单元格生成记录（与 diff_inventory_cells / diff_region_totals 的结果相同）。
+    """
+    old_matrix = InventoryMatrix.from_dict(old_matrix)
+    new_matrix = InventoryMatrix.from_dict(new_matrix)
+    old_rows, new_rows = _aligned_indexes(old_matrix.stores, new_matrix.store_index)
+    old_cols, new_cols = _aligned_indexes(old_matrix.products, new_matrix.product_index)
+
+    old_values = old_matrix.values[np.ix_(old_rows, old_cols)]
+    new_values = new_matrix.values[np.ix_(new_rows, new_cols)]
+    changed = (old_values != new_values) & (old_values != UNKNOWN_STOCK) & (new_values != UNKNOWN_STOCK)
+
+    cell_deltas = []
+    for i, j in zip(*np.nonzero(changed)):
+        old_stock, new_stock = int(old_values[i, j]), int(new_values[i, j])
+        kind = _classify_change(old_stock, new_stock)
+        if kind is None:
+            continue
+        cell_deltas.append({
+            "kind": kind,
+            "store_name": old_matrix.stores[old_rows[i]],
+            "product_key": old_matrix.products[old_cols[j]],
+            "old": old_stock,
+            "new": new_stock,
+        })
+    cell_deltas.sort(key=lambda d: (d["product_key"], d["store_name"]))
+
+    region_deltas = []
+    for product_key, region_key in sorted(_touched_regions(cell_deltas)):
+        old_total, new_total = _region_totals(old_matrix, new_matrix, product_key, region_key)
+        if old_total == new_total:
+            continue
+        region_deltas.append({
+            "kind": _classify_change(old_total, new_total) or DELTA_CHANGED,
+            "region": region_key,
+            "product_key": product_key,
+            "old": old_total,
+            "new": new_total,
+        })
+    return {"cells": cell_deltas, "regions": region_deltas}
+
+
+def format_delta(delta):
+    """将变化格式化为一行文本"""
+    label = DELTA_LABELS.get(delta["kind"], delta["kind"])
+    location = delta.get("region") or store_registry.get(delta["store_name"]).simplified_name
+    return f"{delta['product_key']} · {location} {label} ({delta['old']}→{delta['new']})"
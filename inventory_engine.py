@@ -0,0 +1,443 @@
+import asyncio
+import atexit
+import os
+import queue
+import threading
+import time
+from typing import Any, AsyncIterator, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import aiohttp
+
+from circuit_breaker import CircuitBreaker
+from http_cassette import is_recording, is_replaying, load_cassette, save_cassette
+from concurrency_control import AIMDController, AdaptiveLimiter, HedgingPolicy, RateBudget
+from metrics import (
+    metrics_registry, record_stock_fetch, record_stock_request, record_stock_retry,
+    stock_breaker_open, stock_concurrency_limit, stock_in_flight
+)
+from singleflight import SingleFlight
+from stock_decode import decode_stock_payload
+
+# 上游接口地址（可通过环境变量 ARCTERYX_API_BASE_URL 指向本地替身服务 fake_upstream.py）
+API_BASE_URL = os.environ.get("ARCTERYX_API_BASE_URL", "https://api.arcteryx.co.kr").rstrip("/")
+
+# 库存接口（与 query_stock_by_product_id 使用同一个地址）
+STOCK_API_URL = (
+    API_BASE_URL + "/api/stores?limit=0&page=1&local_code=&search_keyword=&x=&y="
+    "&product_option_id={product_id}&orderby=store_sort%7Casc"
+)
+
+STOCK_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36"
+}
+
+# 进程级在途请求上限（所有会话、所有批次共享；AIMD 控制器在此范围内自适应调整）
+MAX_IN_FLIGHT = 32
+# 初始并发上限：与原来按批次大小选择的最大线程数一致，之后由 AIMD 控制器调整
+INITIAL_IN_FLIGHT = 10
+# 单个请求超时时间（秒）
+REQUEST_TIMEOUT = 10
+# 进程退出时等待共享会话关闭的最长时间（秒）
+SHUTDOWN_TIMEOUT_SECONDS = 5
+# 重试策略（与 get_session 中的 urllib3 Retry 保持一致）
+RETRY_TOTAL = 2
+RETRY_BACKOFF = 0.3
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# 进程级请求预算（每秒请求数，包含重试）
+REQUESTS_PER_SECOND = 20
+# 熔断：连续失败的请求（重试用尽后的最终结果，429 限流不计入）达到次数后，冷却期内的请求直接失败
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+# 对冲请求（可通过环境变量 INVENTORY_HEDGE=1 开启）：请求超过最近延迟的分位数仍未返回时，
+# 再发出一个相同的请求，先返回的结果生效，另一个被取消
+HEDGE_ENABLED = os.environ.get("INVENTORY_HEDGE", "0") == "1"
+HEDGE_PERCENTILE = 0.95
+# 对冲请求数量上限（占主请求数量的比例）
+HEDGE_MAX_EXTRA_RATIO = 0.1
+
+# 库存请求合并组：同一SKU的并发查询（跨会话、跨批次）只发出一次请求
+stock_flight = SingleFlight("库存查询")
+
+# 库存请求的并发控制器：状态跨批次、跨会话共享，逐步收敛到上游可承受的最高并发
+stock_controller = AIMDController(min_limit=1, max_limit=MAX_IN_FLIGHT, initial_limit=INITIAL_IN_FLIGHT)
+
+# 库存请求预算：所有会话、批次和单个查询共享同一个每秒请求数上限
+stock_budget = RateBudget(REQUESTS_PER_SECOND)
+
+# 库存接口熔断器：上游持续失败时所有会话快速失败，不再逐个等待超时
+stock_breaker = CircuitBreaker("库存接口", failure_threshold=BREAKER_FAILURE_THRESHOLD,
+                               reset_timeout=BREAKER_RESET_SECONDS)
+
+# 库存请求的对冲策略：对冲延迟随最近的延迟分布自适应，额外负载受比例上限约束
+stock_hedging = HedgingPolicy(percentile=HEDGE_PERCENTILE, max_extra_ratio=HEDGE_MAX_EXTRA_RATIO)
+
+class _RejectedStockRows(tuple):
+    """熔断期间被拒绝的查询结果：与空结果一样为假值、可以当作空列表迭代，通过 is_breaker_rejected 区分"""
+    __slots__ = ()
+
+
+# 熔断期间被拒绝的查询返回的结果（唯一实例；不写入快照，调用方应把对应的SKU视为未完成）
+BREAKER_REJECTED = _RejectedStockRows()
+
+
+def is_breaker_rejected(rows):
+    """查询结果是否是熔断期间被拒绝的（而不是上游返回的空结果或请求失败）"""
+    return rows is BREAKER_REJECTED
+
+
+_loop = None
+_loop_thread = None
+_loop_lock = threading.Lock()
+_http_session = None
+_limiter = None
+# 流式结果队列的结束标记
+_STREAM_END = object()
+
+
+def _collect_engine_metrics():
+    """导出指标前写入并发闸门和控制器的当前状态"""
+    stock_in_flight.set(_limiter.in_flight if _limiter is not None else 0)
+    stock_concurrency_limit.set(stock_controller.current_limit)
+    stock_breaker_open.set(1 if stock_breaker.is_open() else 0)
+
+
+metrics_registry.add_collector(_collect_engine_metrics)
+
+
+def get_event_loop():
+    """获取进程级后台事件循环（首次调用时在守护线程中启动）"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, name="inventory-engine", daemon=True)
+            thread.start()
+            _loop, _loop_thread = loop, thread
+    return _loop
+
+
+async def _close_http_session():
+    """关闭共享的 aiohttp 会话（释放连接池）"""
+    global _http_session
+    if _http_session is not None and not _http_session.closed:
+        await _http_session.close()
+    _http_session = None
+
+
+def shutdown_engine(timeout=SHUTDOWN_TIMEOUT_SECONDS):
+    """关闭共享会话并停止后台事件循环（进程退出时自动调用；之后再使用时会重新创建）"""
+    global _loop, _loop_thread
+    with _loop_lock:
+        loop, thread = _loop, _loop_thread
+        _loop = _loop_thread = None
+    if loop is None:
+        return
+    if loop.is_running():
+        try:
+            asyncio.run_coroutine_threadsafe(_close_http_session(), loop).result(timeout)
+        except Exception as e:
+            print(f"库存查询会话关闭失败: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+    if not loop.is_running():
+        loop.close()
+
+
+atexit.register(shutdown_engine)
+
+
+def run_sync(coro, timeout=None):
+    """在后台事件循环中执行协程，并阻塞等待结果（供 Streamlit 脚本线程调用）"""
+    future = asyncio.run_coroutine_threadsafe(coro, get_event_loop())
+    return future.result(timeout)
+
+
+async def _get_http_session():
+    """获取共享的 aiohttp 会话（只在后台事件循环中创建和使用）"""
+    global _http_session, _limiter
+    if _http_session is None or _http_session.closed:
+        # 连接池大小与控制器的并发上限保持一致，并发提高时不会因等待连接而排队
+        pool_size = stock_controller.max_limit
+        connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size, ttl_dns_cache=300)
+        _http_session = aiohttp.ClientSession(connector=connector, headers=STOCK_HEADERS)
+        _limiter = AdaptiveLimiter(stock_controller)
+    return _http_session
+
+
+async def fetch_stock_rows(product_id, timeout=REQUEST_TIMEOUT):
+    """异步查询单个产品的库存（同一SKU的并发调用共享一次请求）"""
+    return await stock_flight.do_async(str(product_id), _fetch_stock_rows, product_id, timeout)
+
+
+def report_breaker_failure(status=None):
+    """
+    向熔断器报告一个最终失败的请求
+    429 说明上游仍在响应、只是在限流：交给并发控制器和退避处理，不计入熔断的连续失败
+    """
+    if status == 429:
+        stock_breaker.release_probe()
+    else:
+        stock_breaker.record_failure()
+
+
+def _breaker_allows(attempt):
+    """
+    在等待请求预算前检查熔断器：熔断期间的请求立即失败
+    首次尝试占用半开状态的探测名额；重试只在已经熔断时放弃
+    """
+    if attempt == 0:
+        return stock_breaker.allow_request()
+    return not stock_breaker.is_open()
+
+
+async def _load_cassette(url):
+    """回放模式下在线程池中读取录制的响应（解压和磁盘读取不阻塞事件循环中的其他请求）"""
+    if not is_replaying():
+        return None
+    return await asyncio.get_running_loop().run_in_executor(None, load_cassette, url)
+
+
+async def _save_cassette(url, status, headers, body):
+    """录制模式下在线程池中保存响应（压缩和磁盘写入不阻塞事件循环中的其他请求）"""
+    if not is_recording():
+        return
+    await asyncio.get_running_loop().run_in_executor(None, save_cassette, url, status, headers, body)
+
+
+async def _request_stock(session, url, client_timeout):
+    """发出一次库存请求，返回 (status, stock_rows)；HTTP 错误时 stock_rows 为 None"""
+    # 回放模式：直接使用录制的响应
+    entry = await _load_cassette(url)
+    if entry is not None:
+        if entry.status >= 400:
+            return entry.status, None
+        return entry.status, decode_stock_payload(entry.body)
+
+    started = time.monotonic()
+    status = "error"
+    body = b""
+    try:
+        async with session.get(url, timeout=client_timeout) as response:
+            status = response.status
+            if response.status >= 400:
+                await _save_cassette(url, response.status, response.headers, b"")
+                return response.status, None
+            body = await response.read()
+            await _save_cassette(url, response.status, response.headers, body)
+    except asyncio.TimeoutError:
+        status = "timeout"
+        raise
+    except asyncio.CancelledError:
+        # 被取消的请求（落后的对冲请求、批次截止）不计入请求指标
+        status = None
+        raise
+    finally:
+        if status is not None:
+            record_stock_request("async", status, time.monotonic() - started, len(body))
+    # 记录每个请求自身的耗时（对冲胜出的请求从它自己发出时算起，避免对冲延迟抬高分位数）
+    stock_hedging.record_latency(time.monotonic() - started)
+    # 只解码店铺名称和可用库存
+    return response.status, decode_stock_payload(body)
+
+
+def _request_succeeded(task):
+    return not task.cancelled() and task.exception() is None and task.result()[0] < 400
+
+
+async def _hedged_request_stock(session, url, client_timeout):
+    """
+    对冲请求：主请求超过对冲延迟仍未返回时再发出一个相同的请求，先成功返回的结果生效
+    对冲请求不占用并发闸门的名额，但同样消耗每秒请求预算
+    """
+    delay = stock_hedging.hedge_delay() if HEDGE_ENABLED else None
+    stock_hedging.on_request()
+    if delay is None:
+        return await _request_stock(session, url, client_timeout)
+
+    primary = asyncio.ensure_future(_request_stock(session, url, client_timeout))
+    hedge = None
+    try:
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not stock_hedging.try_acquire():
+            return await primary
+
+        await stock_budget.acquire()
+        if primary.done():
+            return primary.result()
+        hedge = asyncio.ensure_future(_request_stock(session, url, client_timeout))
+
+        pending = {primary, hedge}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if _request_succeeded(task):
+                    if task is hedge:
+                        stock_hedging.record_win()
+                    return task.result()
+        # 两个请求都失败：以主请求的结果为准
+        return primary.result()
+    finally:
+        # 取消落后的请求
+        for task in (primary, hedge):
+            if task is not None and not task.done():
+                task.cancel()
+
+
+async def _fetch_stock_rows(product_id, timeout=REQUEST_TIMEOUT):
+    """异步查询单个产品的库存（失败时返回空列表，与 query_stock_by_product_id 一致）"""
+    rows = await _fetch_stock_rows_with_retry(product_id, timeout)
+    record_stock_fetch("async", bool(rows))
+    return rows
+
+
+async def _fetch_stock_rows_with_retry(product_id, timeout=REQUEST_TIMEOUT):
+    """请求库存接口，按 RETRY_STATUS 和超时重试；熔断器只记录最终结果，不记录每次尝试"""
+    session = await _get_http_session()
+    url = STOCK_API_URL.format(product_id=product_id)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    status = None
+
+    for attempt in range(RETRY_TOTAL + 1):
+        if attempt > 0:
+            # 指数退避
+            record_stock_retry("async")
+            await asyncio.sleep(RETRY_BACKOFF * (2 ** (attempt - 1)))
+        # 先检查熔断器再等待请求预算：熔断期间的请求立即失败，不排队等待预算
+        if not _breaker_allows(attempt):
+            return BREAKER_REJECTED
+        try:
+            await stock_budget.acquire()
+            async with _limiter:
+                # 排队期间熔断的请求直接失败
+                if stock_breaker.is_open():
+                    return BREAKER_REJECTED
+                started = time.monotonic()
+                status, rows = await _hedged_request_stock(session, url, client_timeout)
+                if status in RETRY_STATUS:
+                    # 限流或服务端错误：通知控制器降低并发
+                    stock_controller.on_congestion()
+                    if attempt < RETRY_TOTAL:
+                        continue
+                if status >= 400:
+                    raise aiohttp.ClientError(f"HTTP {status}: {url}")
+                stock_controller.on_success(time.monotonic() - started)
+            stock_breaker.record_success()
+            return rows
+        except asyncio.TimeoutError as e:
+            status = None
+            stock_controller.on_congestion()
+            if attempt >= RETRY_TOTAL:
+                report_breaker_failure()
+                print(f"库存查询超时: {e}")
+                return []
+        except aiohttp.ClientError as e:
+            if attempt >= RETRY_TOTAL:
+                report_breaker_failure(status)
+                print(f"库存查询失败: {e}")
+                return []
+            status = None
+        except Exception as e:
+            report_breaker_failure()
+            print(f"库存查询失败: {e}")
+            return []
+    return []
+
+
+async def iter_stock_rows(product_ids: Iterable[str], max_in_flight: Optional[int] = None,
+                          timeout=REQUEST_TIMEOUT,
+                          deadline: Optional[float] = None) -> AsyncIterator[Tuple[str, List[Any]]]:
+    """
+    异步批量查询库存，按完成顺序逐个产出结果
+
+    Args:
+        product_ids: 产品ID列表（重复ID只查询一次，与其他批次同时在途的ID共享请求）
+        max_in_flight: 本批次的在途请求上限（为 None 时完全由并发控制器决定）
+        timeout: 单个请求超时时间（秒）
+        deadline: 整个批次的截止时间（time.monotonic() 时间戳）；到期后取消剩余请求并结束，
+            未产出的产品即为超时未完成的产品
+
+    Yields:
+        (product_id, stock_rows)，查询失败的产品对应空列表；熔断期间被拒绝的产品对应 BREAKER_REJECTED
+    """
+    product_ids = list(product_ids)
+    unique_ids = list(dict.fromkeys(product_ids))
+    if not unique_ids:
+        return
+    # 批次内重复的SKU直接合并
+    stock_flight.record_collapsed(len(product_ids) - len(unique_ids))
+
+    batch_limit = asyncio.Semaphore(max(1, max_in_flight)) if max_in_flight else None
+
+    async def _fetch(pid):
+        try:
+            if batch_limit is None:
+                return pid, await fetch_stock_rows(pid, timeout=timeout)
+            async with batch_limit:
+                return pid, await fetch_stock_rows(pid, timeout=timeout)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ 产品 {pid} 查询失败: {e}")
+            return pid, []
+
+    tasks = [asyncio.ensure_future(_fetch(pid)) for pid in unique_ids]
+    pending = set(tasks)
+    try:
+        while pending:
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                print(f"⏱ 批次截止时间已到: {len(pending)} 个产品未完成")
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        # 调用方提前停止时取消尚未完成的请求
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def fetch_stock_batch(product_ids: Iterable[str], max_in_flight: Optional[int] = None,
+                            timeout=REQUEST_TIMEOUT, deadline: Optional[float] = None) -> Dict[str, List[Any]]:
+    """异步批量查询库存，返回 {product_id: stock_rows}（按输入顺序，不含超过截止时间的产品）"""
+    product_ids = list(product_ids)
+    collected = {}
+    async for pid, rows in iter_stock_rows(product_ids, max_in_flight=max_in_flight, timeout=timeout,
+                                           deadline=deadline):
+        collected[pid] = rows
+    return {pid: collected[pid] for pid in dict.fromkeys(product_ids) if pid in collected}
+
+
+def query_stock_batch(product_ids: List[str], max_in_flight: Optional[int] = None,
+                      timeout=REQUEST_TIMEOUT, deadline: Optional[float] = None) -> Dict[str, List[Any]]:
+    """fetch_stock_batch 的同步包装"""
+    return run_sync(fetch_stock_batch(product_ids, max_in_flight=max_in_flight, timeout=timeout,
+                                      deadline=deadline))
+
+
+def stream_stock_batch(product_ids: List[str], max_in_flight: Optional[int] = None,
+                       timeout=REQUEST_TIMEOUT,
+                       deadline: Optional[float] = None) -> Iterator[Tuple[str, List[Any]]]:
+    """iter_stock_rows 的同步包装：每个产品查询完成后立即产出 (product_id, stock_rows)"""
+    results = queue.Queue()
+
+    async def _pump():
+        try:
+            async for item in iter_stock_rows(product_ids, max_in_flight=max_in_flight, timeout=timeout,
+                                              deadline=deadline):
+                results.put(item)
+        finally:
+            results.put(_STREAM_END)
+
+    future = asyncio.run_coroutine_threadsafe(_pump(), get_event_loop())
+    try:
+        while True:
+            item = results.get()
+            if item is _STREAM_END:
+                break
+            yield item
+        # 传递引擎内部的异常
+        future.result()
+    finally:
+        future.cancel()
@@ -0,0 +1,172 @@
+import hashlib
+import heapq
+import sys
+
+import numpy as np
+import pandas as pd
+
+# 未知库存（接口未返回或返回非数字）的占位值
+UNKNOWN_STOCK = -1
+
+
+def make_product_key(favorite):
+    """收藏产品在库存矩阵中的列名（型号 颜色 尺码）"""
+    return f"{favorite['product_model']} {favorite['color']} {favorite['size']}"
+
+
+def parse_stock_value(stock):
+    """解析接口返回的库存值：数字返回整数，其他返回 UNKNOWN_STOCK"""
+    if stock is not None and str(stock).isdigit():
+        return int(stock)
+    return UNKNOWN_STOCK
+
+
+def _merge_key_order(store_products):
+    """
+    合并各店铺的产品顺序（拓扑排序，并列时按首次出现的顺序）
+    只要各店铺的顺序互不矛盾，每个店铺内产品的相对顺序都保持不变
+    """
+    first_seen = {}
+    successors = {}
+    indegree = {}
+    for products in store_products:
+        previous = None
+        for key in products:
+            if key not in first_seen:
+                first_seen[key] = len(first_seen)
+                successors[key] = set()
+                indegree[key] = 0
+            if previous is not None and key not in successors[previous]:
+                successors[previous].add(key)
+                indegree[key] += 1
+            previous = key
+
+    ready = [(first_seen[key], key) for key, count in indegree.items() if count == 0]
+    heapq.heapify(ready)
+    order = []
+    while ready:
+        _, key = heapq.heappop(ready)
+        order.append(key)
+        for successor in successors[key]:
+            indegree[successor] -= 1
+            if indegree[successor] == 0:
+                heapq.heappush(ready, (first_seen[successor], successor))
+
+    # 各店铺的顺序互相矛盾时，剩余产品按首次出现的顺序排在最后
+    if len(order) < len(first_seen):
+        placed = set(order)
+        order.extend(key for key in first_seen if key not in placed)
+    return order
+
+
+class InventoryMatrix:
+    """
+    库存矩阵（列式存储）
+    - values: 店铺×产品 的 int32 数组，未知库存为 UNKNOWN_STOCK
+    - stores / products: 行、列名称（已驻留的字符串），store_index / product_index 为名称到下标的映射
+    """
+
+    __slots__ = ("stores", "products", "store_index", "product_index", "values")
+
+    def __init__(self, stores, products, values):
+        self.stores = [sys.intern(name) for name in stores]
+        self.products = [sys.intern(key) for key in products]
+        self.store_index = {name: i for i, name in enumerate(self.stores)}
+        self.product_index = {key: j for j, key in enumerate(self.products)}
+        self.values = np.asarray(values, dtype=np.int32).reshape(len(self.stores), len(self.products))
+
+    @classmethod
+    def from_dict(cls, inventory_matrix, product_keys=None):
+        """
+        从 {store_name: {product_key: stock}} 构建
+
+        Args:
+            inventory_matrix: get_inventory_matrix_transposed 返回的字典
+            product_keys: 列顺序（默认合并各店铺的产品顺序；矩阵中没有出现过的产品不会成为列）
+        """
+        if isinstance(inventory_matrix, InventoryMatrix):
+            return inventory_matrix
+
+        stores = list(inventory_matrix.keys())
+        if product_keys is None:
+            product_keys = _merge_key_order(inventory_matrix.values())
+        else:
+            present = set()
+            for products in inventory_matrix.values():
+                present.update(products)
+            product_keys = [key for key in dict.fromkeys(product_keys) if key in present]
+
+        product_index = {key: j for j, key in enumerate(product_keys)}
+        values = np.full((len(stores), len(product_keys)), UNKNOWN_STOCK, dtype=np.int32)
+        for i, products in enumerate(inventory_matrix.values()):
+            for key, stock in products.items():
+                j = product_index.get(key)
+                if j is not None:
+                    values[i, j] = parse_stock_value(stock)
+        return cls(stores, product_keys, values)
+
+    def to_dict(self):
+        """转换为 {store_name: {product_key: stock}}（未知库存的单元格省略）"""
+        known = self.values != UNKNOWN_STOCK
+        return {
+            store_name: {
+                self.products[j]: int(self.values[i, j]) for j in np.flatnonzero(known[i])
+            }
+            for i, store_name in enumerate(self.stores)
+        }
+
+    def to_dataframe(self):
+        """转换为 DataFrame（行：店铺，列：产品，未知库存为空值）"""
+        df = pd.DataFrame(self.values, index=self.stores, columns=self.products)
+        return df.where(self.values != UNKNOWN_STOCK).astype("Int64")
+
+    @property
+    def known_mask(self):
+        """已知库存的单元格"""
+        return self.values != UNKNOWN_STOCK
+
+    @property
+    def stock(self):
+        """库存数组（未知库存按 0 计）"""
+        return np.where(self.values > 0, self.values, 0)
+
+    def subset(self, store_names=None, product_keys=None):
+        """按店铺和/或产品选取子矩阵（不存在的名称会被忽略）"""
+        rows = (range(len(self.stores)) if store_names is None
+                else [self.store_index[name] for name in store_names if name in self.store_index])
+        cols = (range(len(self.products)) if product_keys is None
+                else [self.product_index[key] for key in dict.fromkeys(product_keys) if key in self.product_index])
+        return self.take(np.fromiter(rows, dtype=np.intp), np.fromiter(cols, dtype=np.intp))
+
+    def take(self, rows=None, cols=None):
+        """按行、列下标数组选取子矩阵（下标顺序即结果顺序）"""
+        rows = np.arange(len(self.stores)) if rows is None else np.asarray(rows, dtype=np.intp)
+        cols = np.arange(len(self.products)) if cols is None else np.asarray(cols, dtype=np.intp)
+        return InventoryMatrix(
+            [self.stores[i] for i in rows],
+            [self.products[j] for j in cols],
+            self.values[np.ix_(rows, cols)]
+        )
+
+    def digest(self):
+        """内容摘要（用于缓存键，代替对整个字典做 JSON 序列化）"""
+        hasher = hashlib.md5()
+        hasher.update("\x1f".join(self.stores).encode())
+        hasher.update(b"\x1e")
+        hasher.update("\x1f".join(self.products).encode())
+        hasher.update(b"\x1e")
+        hasher.update(np.ascontiguousarray(self.values).tobytes())
+        return hasher.hexdigest()
+
+    def __len__(self):
+        """店铺数量（与字典形式的 len() 一致）"""
+        return len(self.stores)
+
+    def __bool__(self):
+        return len(self.stores) > 0
+
+    def __contains__(self, store_name):
+        return store_name in self.store_index
+
+    def __repr__(self):
+        return f"InventoryMatrix({len(self.stores)} stores × {len(self.products)} products)"
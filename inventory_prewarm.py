@@ -0,0 +1,137 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from favorites_manager import load_favorites
+from inventory_check import INVENTORY_MAX_AGE_SECONDS, query_stock_by_product_id
+from inventory_store import get_snapshot_store
+
+# 是否启用后台库存预热（可通过环境变量 INVENTORY_PREWARM=1 开启）
+PREWARM_ENABLED = os.environ.get("INVENTORY_PREWARM", "0") == "1"
+# 每轮预热的时长（秒）：本轮请求均匀分布在这段时间内；需小于快照最大年龄，保证用户查询时数据仍然有效
+PREWARM_INTERVAL_SECONDS = int(INVENTORY_MAX_AGE_SECONDS * 0.8)
+# 快照到期前提前刷新的时间（秒）：每个SKU最晚在 最近获取时间 + 最大年龄 - 该值 时刷新，快照不会在两轮之间过期
+PREWARM_REFRESH_MARGIN_SECONDS = 30
+
+
+class InventoryPrewarmer:
+    """后台库存预热：定期遍历全部收藏，把库存写入共享的快照存储"""
+
+    def __init__(self, interval=PREWARM_INTERVAL_SECONDS, max_age=INVENTORY_MAX_AGE_SECONDS,
+                 margin=PREWARM_REFRESH_MARGIN_SECONDS):
+        self.interval = interval
+        self.max_age = max_age
+        self.margin = margin
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.rounds = 0
+        self.refreshed = 0
+        self.skipped = 0
+        self.last_round_at = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台线程（已在运行时不重复启动）"""
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="inventory-prewarm", daemon=True)
+        self._thread.start()
+        print(f"库存预热已启动: 每轮 {self.interval} 秒")
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop_event.set()
+
+    def _due_skus(self, round_started):
+        """
+        获取本轮需要刷新的SKU：[(SKU, 刷新期限)]，按期限排序
+        刷新期限为 最近获取时间 + 最大年龄 - margin；期限在本轮结束之后的SKU（例如用户刚刚查询过）留到下一轮
+        """
+        skus = list(dict.fromkeys(
+            str(fav.get('sku', '')).strip() for fav in load_favorites()
+        ))
+        skus = [sku for sku in skus if sku.isdigit()]
+
+        latest = get_snapshot_store().latest_fetched_at(skus)
+        round_ends = round_started + self.interval
+        deadlines = {sku: latest.get(sku, 0) + self.max_age - self.margin for sku in skus}
+        due = sorted((sku for sku in skus if deadlines[sku] < round_ends), key=deadlines.get)
+        self.skipped += len(skus) - len(due)
+        return [(sku, deadlines[sku]) for sku in due]
+
+    def run_once(self):
+        """
+        执行一轮预热，返回本轮刷新的SKU数量
+        请求均匀分布在 interval 内，但每个SKU不晚于自己的刷新期限；已经过期的快照按均匀的间隔刷新
+        """
+        round_started = time.time()
+        due = self._due_skus(round_started)
+        if not due:
+            return 0
+
+        spacing = self.interval / len(due)
+        refreshed = 0
+        for position, (sku, deadline) in enumerate(due):
+            slot = round_started + position * spacing
+            target = slot if deadline <= round_started else min(slot, deadline)
+            if self._stop_event.wait(max(0.0, target - time.time())):
+                break
+            # max_age=0：强制请求接口，并写入快照存储
+            if query_stock_by_product_id(sku, max_age=0):
+                refreshed += 1
+
+        self.refreshed += refreshed
+        print(f"库存预热完成一轮: 刷新 {refreshed}/{len(due)} 个SKU")
+        return refreshed
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            round_started = time.monotonic()
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"库存预热失败: {e}")
+            self.rounds += 1
+            self.last_round_at = datetime.now()
+            # 本轮没有需要刷新的SKU时，等待剩余时间再开始下一轮
+            self._stop_event.wait(max(0.0, self.interval - (time.monotonic() - round_started)))
+
+    def get_statistics(self):
+        """获取预热统计信息"""
+        return {
+            'running': self.is_running(),
+            'interval': self.interval,
+            'rounds': self.rounds,
+            'refreshed': self.refreshed,
+            'skipped': self.skipped,
+            'last_round_at': self.last_round_at
+        }
+
+
+_prewarmer = None
+_prewarmer_lock = threading.Lock()
+
+
+def get_prewarmer():
+    """获取全局预热器"""
+    global _prewarmer
+    with _prewarmer_lock:
+        if _prewarmer is None:
+            _prewarmer = InventoryPrewarmer()
+    return _prewarmer
+
+
+def ensure_prewarmer_started():
+    """按配置启动后台预热（每个服务进程只启动一次）"""
+    global _prewarmer
+    if not PREWARM_ENABLED:
+        return None
+    with _prewarmer_lock:
+        if _prewarmer is None:
+            _prewarmer = InventoryPrewarmer()
+        _prewarmer.start()
+    return _prewarmer
@@ -0,0 +1,144 @@
+import json
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, Iterable, List, Optional
+
+from stock_decode import make_stock_row
+
+# 库存快照数据库文件路径（跨会话、跨重启共享）
+INVENTORY_DB_FILE = "inventory_snapshots.db"
+# 快照保留时长（秒），更早的快照会在写入时清理
+SNAPSHOT_RETENTION_SECONDS = 7 * 24 * 3600
+# SQLite 单条语句的参数数量上限（保守值）
+_SQL_PARAM_LIMIT = 500
+
+
+class InventorySnapshotStore:
+    """库存快照存储：按 (sku, fetched_at) 保存店铺名称和可用库存"""
+
+    def __init__(self, db_path=INVENTORY_DB_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        """初始化数据表"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS stock_snapshots ("
+                " sku TEXT NOT NULL,"
+                " fetched_at REAL NOT NULL,"
+                " rows TEXT NOT NULL,"
+                " PRIMARY KEY (sku, fetched_at))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_snapshots_fetched_at ON stock_snapshots (fetched_at)")
+
+    @staticmethod
+    def _encode_rows(rows):
+        """只保留店铺名称和可用库存，压缩为 [[store_name, usable_stock], ...]"""
+        return json.dumps(
+            [[row.get("store_name", ""), row.get("usable_stock", 0)] for row in rows],
+            ensure_ascii=False, separators=(",", ":")
+        )
+
+    @staticmethod
+    def _decode_rows(rows_json):
+        """还原为与库存接口解码结果一致的紧凑库存行"""
+        return [make_stock_row(name, stock) for name, stock in json.loads(rows_json)]
+
+    def save_snapshots(self, rows_by_sku: Dict[str, List[Any]], fetched_at: Optional[float] = None):
+        """保存一批快照（空结果不保存，避免把失败的查询当成有效数据）"""
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        records = [
+            (str(sku), fetched_at, self._encode_rows(rows))
+            for sku, rows in rows_by_sku.items() if rows
+        ]
+        if not records:
+            return 0
+
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.executemany("INSERT OR REPLACE INTO stock_snapshots (sku, fetched_at, rows) VALUES (?, ?, ?)",
+                                 records)
+                conn.execute("DELETE FROM stock_snapshots WHERE fetched_at < ?",
+                             (fetched_at - SNAPSHOT_RETENTION_SECONDS,))
+        except sqlite3.Error as e:
+            print(f"保存库存快照失败: {e}")
+            return 0
+        return len(records)
+
+    def save_snapshot(self, sku, rows, fetched_at: Optional[float] = None):
+        """保存单个SKU的快照"""
+        return self.save_snapshots({sku: rows}, fetched_at=fetched_at)
+
+    def load_fresh(self, skus: Iterable[str], max_age: float) -> Dict[str, List[Any]]:
+        """
+        读取未过期的快照
+
+        Args:
+            skus: SKU列表
+            max_age: 最大允许的快照年龄（秒），<=0 表示不使用快照
+
+        Returns:
+            {sku: stock_rows}，只包含存在且未过期快照的SKU（取最新一条）
+        """
+        sku_list = list(dict.fromkeys(str(sku) for sku in skus))
+        if not sku_list or max_age <= 0:
+            return {}
+
+        min_fetched_at = time.time() - max_age
+        results = {}
+        try:
+            with closing(self._connect()) as conn:
+                for i in range(0, len(sku_list), _SQL_PARAM_LIMIT):
+                    chunk = sku_list[i:i + _SQL_PARAM_LIMIT]
+                    placeholders = ",".join("?" * len(chunk))
+                    # SQLite 中与 MAX() 一起选出的列取自最大值所在的行
+                    cursor = conn.execute(
+                        f"SELECT sku, rows, MAX(fetched_at) FROM stock_snapshots "
+                        f"WHERE fetched_at >= ? AND sku IN ({placeholders}) GROUP BY sku",
+                        [min_fetched_at, *chunk]
+                    )
+                    for sku, rows_json, _ in cursor:
+                        results[sku] = self._decode_rows(rows_json)
+        except sqlite3.Error as e:
+            print(f"读取库存快照失败: {e}")
+            return {}
+        return results
+
+    def latest_fetched_at(self, skus: Iterable[str]) -> Dict[str, float]:
+        """获取每个SKU最近一次快照的时间戳"""
+        sku_list = list(dict.fromkeys(str(sku) for sku in skus))
+        results = {}
+        try:
+            with closing(self._connect()) as conn:
+                for i in range(0, len(sku_list), _SQL_PARAM_LIMIT):
+                    chunk = sku_list[i:i + _SQL_PARAM_LIMIT]
+                    placeholders = ",".join("?" * len(chunk))
+                    cursor = conn.execute(
+                        f"SELECT sku, MAX(fetched_at) FROM stock_snapshots WHERE sku IN ({placeholders}) GROUP BY sku",
+                        chunk
+                    )
+                    results.update(dict(cursor.fetchall()))
+        except sqlite3.Error as e:
+            print(f"读取库存快照失败: {e}")
+        return results
+
+
+_snapshot_store = None
+_snapshot_store_lock = threading.Lock()
+
+
+def get_snapshot_store():
+    """获取全局库存快照存储（首次调用时创建数据库）"""
+    global _snapshot_store
+    with _snapshot_store_lock:
+        if _snapshot_store is None:
+            _snapshot_store = InventorySnapshotStore()
+    return _snapshot_store
@@ -1,9 +1,8 @@
 import time
 import streamlit as st
 from discount_config import DISCOUNT_CONFIG
-import pandas as pd
-from product_search import generate_api_url, extract_product_ids_from_api
-from product_detail import extract_product_details, get_product_variants, get_sku_info
+from product_search import generate_api_url, extract_product_ids_from_api, search_all_products, SEARCH_ALL_GENDERS
+from product_detail import extract_product_details, get_product_variants, get_sku_info, get_sku_grid, iter_product_full_info
 from favorites_manager import load_favorites, add_to_favorites, remove_from_favorites
 from utils import standardize_model_name
 # 确保导入以下函数
@@ -14,11 +13,15 @@ from inventory_check import (
     calculate_enhanced_inventory_stats,
     calculate_product_depth_stats,
     calculate_key_store_analysis,
-    safe_batch_query,
+    calculate_stock_status_distribution,
+    safe_iter_inventory_matrix,
     STORE_REGION_MAPPING
 )
+from inventory_matrix import InventoryMatrix, make_product_key
+from inventory_engine import stock_breaker
 import re
 import hashlib
+import requests
 # 新增filter_utils的导入
 from filter_utils import apply_filters_and_sort, convert_to_excel
 from exchange_rate import get_exchange_rate  # 新增导入
@@ -27,6 +30,10 @@ from cache_manager import product_cache
 from purchase_plan_manager import add_to_plan, check_product_in_plan, load_plans
 from plan_display import show_purchase_plan_tab
 from cache_ui import show_cache_management_tab
+from inventory_prewarm import ensure_prewarmer_started
+from metrics import ensure_metrics_exporter_started
+from product_catalog import ensure_catalog_refresher_started, get_product_catalog
+from inventory_diff import diff_inventory_snapshots, format_delta
 
 # ============ 缓存优化函数 ============
 
@@ -116,6 +123,39 @@ def format_color(s):
 
     # 重新组合
     return '-'.join(formatted_words)
+
+
+# 没有 image_chip 时构造的产品图片地址；女款图片的型号后带 -W
+FALLBACK_IMAGE_URL = "https://product.arcteryx.co.kr/images/products/{product_id}/{model}{suffix}-{color}.jpg"
+FALLBACK_IMAGE_SUFFIXES = {"MALE": "", "FEMALE": "-W"}
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def resolve_fallback_image_url(product_id, formatted_model, formatted_color, gender):
+    """
+    构造产品图片地址：先试产品自己性别的图片，再试另一性别的图片（性别未知时两种都试），
+    返回第一个存在的地址；全部确认不存在时返回 None，检查请求都失败时返回第一个候选地址
+    """
+    genders = [gender] if gender in FALLBACK_IMAGE_SUFFIXES else []
+    genders += [g for g in FALLBACK_IMAGE_SUFFIXES if g not in genders]
+    candidates = [
+        FALLBACK_IMAGE_URL.format(product_id=product_id, model=formatted_model,
+                                  suffix=FALLBACK_IMAGE_SUFFIXES[g], color=formatted_color)
+        for g in genders
+    ]
+    checked = False
+    for url in candidates:
+        try:
+            response = requests.head(url, timeout=5, allow_redirects=True)
+        except requests.RequestException as e:
+            print(f"产品图片检查失败: {url} ({e})")
+            continue
+        checked = True
+        if response.status_code == 200:
+            return url
+    return None if checked else candidates[0]
+
+
 def get_current_step():
     """获取当前步骤"""
     if "step_history" not in st.session_state:
@@ -167,15 +207,27 @@ def show_product_query_tab():
     # 新增：性别选择控件
     gender = st.radio(
         "选择性别",
-        ["男款", "女款", "背包"],
+        ["男款", "女款", "男女款", "背包"],
         index=0,  # 默认选择男款
         key="gender_select",
         horizontal=True  # 水平排列
     )
+    search_all_pages = st.checkbox(
+        "搜索全部结果",
+        key="search_all_pages",
+        help="获取所有页的搜索结果（默认只取第一页的16个）；选择“男女款”时始终搜索全部结果"
+    )
 
     # 将中文转换为API参数
-    gender_map = {"男款": "MALE", "女款": "FEMALE", "背包": "BACKPACK"}
+    gender_map = {"男款": "MALE", "女款": "FEMALE", "男女款": "ALL", "背包": "BACKPACK"}
     selected_gender = gender_map[gender]
+
+    # 本地目录中的相近型号（部分输入或拼写错误也能匹配，不请求接口）
+    catalog_matches = get_product_catalog().search(product_model, gender=selected_gender) \
+        if product_model.strip() else []
+    if catalog_matches:
+        suggestions = "、".join(list(dict.fromkeys(match["exact_model"] for match in catalog_matches))[:8])
+        st.caption(f"📚 本地目录中的相近型号：{suggestions}")
     if st.button("搜索产品", key="search_btn"):
         if not product_model.strip():
             st.error("请输入产品型号")
@@ -185,15 +237,44 @@ def show_product_query_tab():
         st.session_state.search_model = standardized_model
         st.session_state.selected_gender = selected_gender  # 保存性别选择
 
-        # 生成API URL并获取产品ID
-        api_url = generate_api_url(standardized_model, gender=selected_gender)
-        product_ids = extract_product_ids_from_api(api_url)
+        # 生成API URL并获取产品ID（全部结果：所有页和所选性别并发请求，合并去重，并记录每个产品所属的性别）
+        product_genders = {}
+        search_failed = False
+        if selected_gender == "ALL" or search_all_pages:
+            genders = SEARCH_ALL_GENDERS if selected_gender == "ALL" else (selected_gender,)
+            try:
+                with st.spinner("正在搜索全部结果..."):
+                    product_genders = search_all_products(standardized_model, genders)
+            except Exception as e:
+                print(f"全部结果搜索失败: {e}")
+                search_failed = True
+            product_ids = list(product_genders)
+        else:
+            api_url = generate_api_url(standardized_model, gender=selected_gender)
+            product_ids = extract_product_ids_from_api(api_url)
+
+        get_product_catalog().record_query(standardized_model)
+        if not product_ids and catalog_matches:
+            # 实时搜索没有结果（例如拼写错误或请求失败）时，使用本地目录中的相近型号
+            st.session_state.catalog_fallback_notice = (
+                "实时搜索请求失败，已显示本地目录中的相近型号" if search_failed
+                else "实时搜索没有结果，已显示本地目录中的相近型号")
+            product_ids = [match["product_id"] for match in catalog_matches]
+            product_genders = _catalog_product_genders(catalog_matches)
 
         if not product_ids:
-            st.error("未找到匹配的产品")
+            st.error("搜索请求失败，请稍后重试" if search_failed else "未找到匹配的产品")
             return
 
         st.session_state.product_ids = product_ids
+        st.session_state.product_genders = product_genders
+        go_to_step("select_product")
+
+    if catalog_matches and st.button(f"使用本地目录结果（{len(catalog_matches)} 个产品）", key="catalog_search_btn"):
+        st.session_state.search_model = standardize_model_name(product_model)
+        st.session_state.selected_gender = selected_gender
+        st.session_state.product_ids = [match["product_id"] for match in catalog_matches]
+        st.session_state.product_genders = _catalog_product_genders(catalog_matches)
         go_to_step("select_product")
 
     # 根据当前步骤显示相应界面
@@ -209,96 +290,29 @@ def show_product_query_tab():
         show_product_details()
 
 
-def show_product_selection():
-    """显示产品选择界面（优化版）"""
-    # 1. 优化：提前检查必要的session_state状态
-    required_states = ['search_model', 'selected_gender', 'product_ids']
-    missing_states = [state for state in required_states if state not in st.session_state]
-
-    if missing_states:
-        st.error(f"系统状态异常，缺少: {', '.join(missing_states)}")
-        if st.button("← 返回搜索", key="back_to_search_error"):
-            go_back()
-        return
-
-    # 2. 显示界面标题和搜索条件（保留原有功能）
-    st.subheader("找到以下产品，请选择：")
-
-    # 优化：使用更清晰的变量名
-    gender_display = {"MALE": "男款", "FEMALE": "女款", "BACKPACK": "背包"}
-    current_gender = gender_display.get(st.session_state.selected_gender, "男款")
-
-    # 优化：使用更醒目的方式显示搜索条件
-    st.markdown(f"""
-    **搜索条件:** `{st.session_state.search_model}` - **{current_gender}**
-    """)
-
-    # 3. 回退按钮布局优化
-    col1, col2 = st.columns([1, 3])
-    with col1:
-        if st.button("← 返回搜索", key="back_to_search"):
-            go_back()
-
-    # 4. 优化产品详情获取流程
-    product_ids = st.session_state.product_ids
-    product_details = []
-
-    # 优化：添加加载状态指示器
-    progress_bar = st.progress(0)
-    status_text = st.empty()
-
-    total_products = len(product_ids)
-
-    for i, pid in enumerate(product_ids):
-        # 更新进度状态
-        progress = (i + 1) / total_products
-        progress_bar.progress(progress)
-        status_text.text(f"正在获取产品信息... ({i + 1}/{total_products})")
-
-        detail_url = f"https://arcteryx.co.kr/products/view/{pid}?sc=100"
-
-        # 优化：添加缓存机制（如果可用）
-        cache_key = f"product_detail_{pid}"
-        if cache_key in st.session_state:
-            full_info = st.session_state[cache_key]
-            details = full_info["details"]
-        else:
-            details = extract_product_details(detail_url)
-            color_options, size_options = get_product_variants(detail_url)
-            if details and color_options:
-                # 存储完整的缓存信息
-                full_info = {
-                    "details": details,
-                    "color_options": color_options,
-                    "size_options": size_options,
-                    "detail_url": detail_url
-                }
-                st.session_state[cache_key] = full_info
-            else:
-                full_info = None
-        if details:
-            product_details.append({
-                "id": pid,
-                "description": details["description"],
-                "year_info": details["year_info"],
-                "exact_model": details["exact_model"],
-                "has_full_info": full_info is not None  # 标记是否有完整信息
-            })
-
-    # 清除进度指示器
-    progress_bar.empty()
-    status_text.empty()
-
+def _catalog_product_genders(catalog_matches):
+    """本地目录结果中只属于一个性别的产品：{产品ID: 性别}"""
+    return {
+        match["product_id"]: match["genders"][0]
+        for match in catalog_matches if len(match.get("genders") or []) == 1
+    }
 
-    # 5. 优化产品显示逻辑
-    if not product_details:
-        st.warning("⚠️ 未能获取到产品详情信息")
-        return
 
-    # 优化：使用更清晰的布局显示产品
-    for i, product in enumerate(product_details):
+def _render_product_row(placeholder, position, pid, details, has_full_info):
+    """在产品预留的位置显示一个产品（没有详情时清空该位置），返回是否显示"""
+    if not details:
+        placeholder.empty()
+        return False
+    product = {
+        "id": pid,
+        "description": details["description"],
+        "year_info": details["year_info"],
+        "exact_model": details["exact_model"],
+        "has_full_info": has_full_info  # 标记是否有完整信息
+    }
+    with placeholder.container():
         # 优化：使用更紧凑的expand布局
-        with st.expander(f"产品 {i + 1}: {product['exact_model']}", expanded=(i == 0)):
+        with st.expander(f"产品 {position + 1}: {product['exact_model']}", expanded=(position == 0)):
 
             # 优化：使用列布局显示产品信息
             col_info, col_action = st.columns([3, 1], gap="small")
@@ -320,7 +334,7 @@ def show_product_selection():
 
             with col_action:
                 # 优化：按钮样式和布局
-                if st.button("选择此产品", key=f"select_{i}", use_container_width=True):
+                if st.button("选择此产品", key=f"select_{position}", use_container_width=True):
                     st.session_state.selected_product_id = product["id"]
                     st.session_state.exact_model = product["exact_model"]
                     st.session_state.year_info = product["year_info"]
@@ -347,7 +361,7 @@ def show_product_selection():
                             }
                         else:
                             st.error("无法获取产品颜色选项，请重新选择")
-                            return
+                            return True
 
                     # 优化：添加成功反馈
                     st.success(f"✅ 已选择: {product['exact_model']}")
@@ -359,6 +373,97 @@ def show_product_selection():
 
                     # 防止多个按钮同时触发
                     st.rerun()
+    return True
+
+
+def show_product_selection():
+    """显示产品选择界面（优化版）"""
+    # 1. 优化：提前检查必要的session_state状态
+    required_states = ['search_model', 'selected_gender', 'product_ids']
+    missing_states = [state for state in required_states if state not in st.session_state]
+
+    if missing_states:
+        st.error(f"系统状态异常，缺少: {', '.join(missing_states)}")
+        if st.button("← 返回搜索", key="back_to_search_error"):
+            go_back()
+        return
+
+    # 2. 显示界面标题和搜索条件（保留原有功能）
+    st.subheader("找到以下产品，请选择：")
+    notice = st.session_state.pop("catalog_fallback_notice", None)
+    if notice:
+        st.info(notice)
+
+    # 优化：使用更清晰的变量名
+    gender_display = {"MALE": "男款", "FEMALE": "女款", "ALL": "男女款", "BACKPACK": "背包"}
+    current_gender = gender_display.get(st.session_state.selected_gender, "男款")
+
+    # 优化：使用更醒目的方式显示搜索条件
+    st.markdown(f"""
+    **搜索条件:** `{st.session_state.search_model}` - **{current_gender}**
+    """)
+
+    # 3. 回退按钮布局优化
+    col1, col2 = st.columns([1, 3])
+    with col1:
+        if st.button("← 返回搜索", key="back_to_search"):
+            go_back()
+
+    # 4. 优化产品详情获取流程：按搜索结果的顺序为每个产品预留位置，已缓存的立即显示，
+    #    未缓存的详情页并发下载，完成一个就显示一个，不等待全部完成
+    product_ids = st.session_state.product_ids
+
+    # 优化：添加加载状态指示器
+    progress_bar = st.progress(0)
+    status_text = st.empty()
+    placeholders = [st.empty() for _ in product_ids]
+
+    total_products = len(product_ids)
+    detail_urls = {pid: f"https://arcteryx.co.kr/products/view/{pid}?sc=100" for pid in product_ids}
+
+    # 优化：添加缓存机制（如果可用）
+    uncached_positions = []
+    rendered = 0
+    for position, pid in enumerate(product_ids):
+        cache_key = f"product_detail_{pid}"
+        if cache_key in st.session_state:
+            full_info = st.session_state[cache_key]
+            if _render_product_row(placeholders[position], position, pid, full_info["details"], True):
+                rendered += 1
+        else:
+            uncached_positions.append(position)
+
+    completed = total_products - len(uncached_positions)
+    progress_bar.progress(completed / total_products if total_products else 1.0)
+    for index, details, color_options, size_options in iter_product_full_info(
+            [detail_urls[product_ids[position]] for position in uncached_positions]):
+        position = uncached_positions[index]
+        pid = product_ids[position]
+        has_full_info = bool(details and color_options)
+        if has_full_info:
+            # 存储完整的缓存信息
+            st.session_state[f"product_detail_{pid}"] = {
+                "details": details,
+                "color_options": color_options,
+                "size_options": size_options,
+                "detail_url": detail_urls[pid]
+            }
+        if _render_product_row(placeholders[position], position, pid, details, has_full_info):
+            rendered += 1
+
+        # 更新进度状态
+        completed += 1
+        progress_bar.progress(completed / total_products)
+        status_text.text(f"正在获取产品信息... ({completed}/{total_products})")
+
+    # 清除进度指示器
+    progress_bar.empty()
+    status_text.empty()
+
+    # 5. 优化产品显示逻辑
+    if not rendered:
+        st.warning("⚠️ 未能获取到产品详情信息")
+        return
 
     # 6. 优化：添加底部导航提示
     st.markdown("---")
@@ -511,7 +616,20 @@ def show_size_selection():
     with col1:
         if st.button("← 返回颜色选择", key="back_to_color"):
             go_back()
-    selected_size = st.radio("请选择尺码:", st.session_state.size_options, key="size_radio")
+
+    # 当前颜色下各尺码的库存（来自已解析的详情页，不额外请求）
+    color_skus = get_sku_grid(cached_info.get('detail_url', '')).get(st.session_state.selected_color, {})
+
+    def format_size(size):
+        sku = color_skus.get(size)
+        if not sku:
+            return size
+        if not sku['is_orderable']:
+            return f"{size}（官网不可订购）"
+        return f"{size}（官网库存 {sku['stock']} 件）"
+
+    selected_size = st.radio("请选择尺码:", st.session_state.size_options, key="size_radio",
+                             format_func=format_size)
 
 
     # 尺码选项和确认按钮之间留出间距
@@ -572,12 +690,9 @@ def show_product_details():
             product_id = st.session_state.selected_product_id
             formatted_model = format_string(st.session_state.exact_model)
             formatted_color = format_color(st.session_state.selected_color)
-            gender = st.session_state.selected_gender  # MALE 或 FEMALE
-
-            if gender == "FEMALE":
-                image_url = f"https://product.arcteryx.co.kr/images/products/{product_id}/{formatted_model}-W-{formatted_color}.jpg"
-            else:
-                image_url = f"https://product.arcteryx.co.kr/images/products/{product_id}/{formatted_model}-{formatted_color}.jpg"
+            # 产品自己的性别（“男女款”搜索时按搜索结果记录），没有记录时使用所选性别（“男女款”时为 ALL，两种图片都会尝试）
+            gender = st.session_state.get('product_genders', {}).get(product_id, st.session_state.selected_gender)
+            image_url = resolve_fallback_image_url(product_id, formatted_model, formatted_color, gender)
         except Exception as e:
             pass
 
@@ -625,6 +740,8 @@ def show_product_details():
 
             stock = sku_info.get('stock', 0)
             st.write(f"**库存:** {stock} 件")
+            if not sku_info.get('is_orderable', True):
+                st.warning("该颜色尺码在官网暂不可订购")
         except Exception as e:
             st.error(f"价格信息获取失败: {e}")
 
@@ -743,6 +860,90 @@ def convert_krw_to_cny(krw_amount):
     return 0
 
 
+def render_partial_inventory(stats_placeholder, table_placeholder, inventory_matrix, target_favorites):
+    """渲染查询过程中的部分统计和库存矩阵"""
+    stock_status = calculate_stock_status_distribution(inventory_matrix)
+    stats_placeholder.markdown(
+        f"✅ 高库存店铺 **{stock_status['高库存店铺']['count']}** 家 · "
+        f"⚠️ 低库存店铺 **{stock_status['低库存店铺']['count']}** 家 · "
+        f"❌ 无库存店铺 **{stock_status['无库存店铺']['count']}** 家"
+    )
+    product_keys = [make_product_key(favorite) for favorite in target_favorites]
+    partial_df = InventoryMatrix.from_dict(inventory_matrix, product_keys).to_dataframe()
+    table_placeholder.dataframe(partial_df, use_container_width=True, height=300)
+
+
+def run_streaming_inventory_query(target_favorites, progress_text):
+    """流式查询库存：每个产品查询完成后立即更新进度、统计和部分库存矩阵，返回 InventoryMatrix"""
+    progress_bar = st.progress(0)
+    stats_placeholder = st.empty()
+    table_placeholder = st.empty()
+
+    inventory_matrix = {}
+    progress = None
+    last_render = 0
+    for _, _, inventory_matrix, progress in safe_iter_inventory_matrix(target_favorites):
+        done, total = progress["done"], progress["total"]
+        progress_bar.progress(done / total)
+        eta_text = f"，预计还需 {progress['eta']:.0f} 秒" if progress["eta"] is not None and done < total else ""
+        progress_text.info(
+            f"已完成 {done}/{total} 个产品（第 {progress['chunk']}/{progress['chunks']} 块），"
+            f"已获取 {len(inventory_matrix)} 个店铺的库存数据{eta_text}..."
+        )
+
+        # 限制刷新频率，避免大批量查询时频繁重绘
+        now = time.time()
+        if inventory_matrix and (done == total or now - last_render >= 0.5):
+            last_render = now
+            render_partial_inventory(stats_placeholder, table_placeholder, inventory_matrix, target_favorites)
+
+    # 清除部分结果显示，由完整的库存矩阵区域接管
+    progress_bar.empty()
+    stats_placeholder.empty()
+    table_placeholder.empty()
+
+    # 超过截止时间或库存接口熔断而未完成的SKU：显示部分结果并提示
+    missed = progress["missed"] if progress else []
+    if missed:
+        reason = "库存接口暂时不可用" if stock_breaker.is_open() else "查询超时"
+        st.warning(f"⏱ {len(missed)} 个产品未能获取库存（{reason}），以下为部分结果。"
+                   f"稍后重新查询即可补全: {', '.join(missed[:20])}{' …' if len(missed) > 20 else ''}")
+    # 转换为列式存储（按收藏顺序排列列），会话中只保存数组形式的矩阵
+    product_keys = [make_product_key(favorite) for favorite in target_favorites]
+    return InventoryMatrix.from_dict(inventory_matrix, product_keys)
+
+
+def record_inventory_changes(inventory_matrix):
+    """与本会话上一次查询的结果比较，记录库存变化（补货、售罄、数量变化）"""
+    previous_matrix = st.session_state.get("previous_inventory_matrix")
+    if previous_matrix is not None:
+        st.session_state.inventory_changes = diff_inventory_snapshots(previous_matrix, inventory_matrix)
+    # 只保存列式矩阵本身（与 st.session_state.inventory_matrix 是同一个对象，不额外占用内存）
+    st.session_state.previous_inventory_matrix = inventory_matrix
+
+
+def show_inventory_changes():
+    """显示与上一次查询相比的库存变化"""
+    changes = st.session_state.get("inventory_changes")
+    if not changes:
+        return
+
+    cell_deltas = changes["cells"]
+    region_deltas = changes["regions"]
+    title = f"🔔 库存变化（与上次查询相比，共 {len(cell_deltas)} 处）"
+    with st.expander(title, expanded=bool(cell_deltas)):
+        if not cell_deltas:
+            st.write("库存没有变化")
+            return
+        if region_deltas:
+            st.write("**区域变化:**")
+            for delta in region_deltas:
+                st.write(f"• {format_delta(delta)}")
+        st.write("**店铺变化:**")
+        for delta in cell_deltas:
+            st.write(f"• {format_delta(delta)}")
+
+
 def show_favorites_tab():
     """显示收藏标签页面"""
     favorites = load_favorites_cached()
@@ -958,12 +1159,13 @@ def show_favorites_tab():
                 progress_text = st.empty()
                 progress_text.info("开始安全并发查询 " + str(len(selected_favorites)) + " 个产品...")
 
-                # 使用安全的并发查询
-                inventory_matrix = safe_batch_query(selected_favorites)
+                # 使用安全的并发查询（流式显示部分结果）
+                inventory_matrix = run_streaming_inventory_query(selected_favorites, progress_text)
 
                 if inventory_matrix:
                     st.session_state.inventory_queried = True
                     st.session_state.inventory_matrix = inventory_matrix
+                    record_inventory_changes(inventory_matrix)
                     st.session_state.inventory_matrix_page = 1  # 【优化】重置分页状态
                     progress_text.success("查询完成！共获取 " + str(len(inventory_matrix)) + " 个店铺的库存数据")
                 else:
@@ -983,12 +1185,13 @@ def show_favorites_tab():
                 progress_text = st.empty()
                 progress_text.info(f"开始查询所有 {len(favorites)} 个产品的库存...")
 
-                # 实际执行查询（查询所有收藏产品）
-                inventory_matrix = safe_batch_query(favorites)
+                # 实际执行查询（查询所有收藏产品，流式显示部分结果）
+                inventory_matrix = run_streaming_inventory_query(favorites, progress_text)
 
                 if inventory_matrix:
                     st.session_state.inventory_queried = True
                     st.session_state.inventory_matrix = inventory_matrix
+                    record_inventory_changes(inventory_matrix)
                     st.session_state.inventory_matrix_page = 1  # 【优化】重置分页状态
                     progress_text.success(f"查询完成！共获取 {len(inventory_matrix)} 个店铺的库存数据")
                 else:
@@ -1066,6 +1269,9 @@ def show_favorites_tab():
             for region, data in stats['region_heatmap'].items():
                 st.write(f"**{region}**: {data['count']}家店铺 ({data['percentage']}%) - {data['inventory']}件库存")
 
+            # 显示与上一次查询相比的库存变化
+            show_inventory_changes()
+
             # 获取当前显示的产品列表（选中产品或全部产品）
             if selected_count > 0:
                 display_favorites = [favorites[i] for i in st.session_state.selected_favorites if i < len(favorites)]
@@ -1175,8 +1381,8 @@ def show_favorites_tab():
             )
 
             if filtered_matrix:
-                # 转换为DataFrame显示
-                df = pd.DataFrame.from_dict(filtered_matrix, orient='index')
+                # 转换为DataFrame显示（未知库存显示为空）
+                df = filtered_matrix.to_dataframe()
 
                 # 添加表格样式
                 st.markdown("""
@@ -1202,7 +1408,7 @@ def show_favorites_tab():
 
                 # Excel下载按钮 - 转换DataFrame为JSON字符串以支持缓存
                 import json
-                df_dict = df.to_dict(orient='index')
+                df_dict = df.astype(object).where(df.notna(), None).to_dict(orient='index')
                 df_json_str = json.dumps(df_dict, default=str)
                 excel_data = convert_to_excel(df_json_str)
                 st.download_button(
@@ -1542,6 +1748,13 @@ def display_calculation_results(selected_products, result):
     # cny_price = convert_krw_to_cny(result['final_payment'])
     # st.write(f"**人民币价格:** {cny_price:,.0f}元")
 def main():
+    # 按配置启动后台库存预热（每个服务进程只启动一次）
+    ensure_prewarmer_started()
+    # 按配置启动指标导出（本机端口或文件）
+    ensure_metrics_exporter_started()
+    # 按配置启动后台产品目录刷新
+    ensure_catalog_refresher_started()
+
     # 获取汇率信息
     rate_info = get_exchange_rate()
 
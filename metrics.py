@@ -0,0 +1,378 @@
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 指标导出（Prometheus 文本格式），可通过环境变量开启：
+# - INVENTORY_METRICS_PORT=9108：在本机端口提供 http://127.0.0.1:9108/metrics
+# - INVENTORY_METRICS_FILE=/path/inventory.prom：定期写入文件（例如供 node_exporter 的 textfile 收集器读取）
+METRICS_PORT = int(os.environ.get("INVENTORY_METRICS_PORT", "0") or 0)
+METRICS_HOST = os.environ.get("INVENTORY_METRICS_HOST", "127.0.0.1")
+METRICS_FILE = os.environ.get("INVENTORY_METRICS_FILE", "")
+# 写入指标文件的间隔（秒）
+METRICS_WRITE_INTERVAL_SECONDS = 15
+
+# 单个请求延迟的分桶（秒）
+REQUEST_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# 整批查询耗时的分桶（秒）
+BATCH_DURATION_BUCKETS = (1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(label_names, label_values, extra=()):
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """指标基类：按标签值分别保存数值（线程安全）"""
+
+    metric_type = "untyped"
+
+    def __init__(self, name, help_text, label_names=()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"指标 {self.name} 的标签应为 {self.label_names}，实际为 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.metric_type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for label_values, value in items:
+            lines.extend(self._render_sample(label_values, value))
+        return lines
+
+    def _render_sample(self, label_values, value):
+        return [f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """只增不减的计数"""
+
+    metric_type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """当前值"""
+
+    metric_type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    """分桶直方图：保存每个桶的计数、总和与样本数"""
+
+    metric_type = "histogram"
+
+    def __init__(self, name, help_text, label_names=(), buckets=REQUEST_LATENCY_BUCKETS):
+        super().__init__(name, help_text, label_names)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state["counts"][i] += 1
+                    break
+            state["sum"] += value
+            state["count"] += 1
+
+    def _render_sample(self, label_values, state):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, state["counts"]):
+            cumulative += count
+            labels = _format_labels(self.label_names, label_values, [("le", _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.label_names, label_values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(round(state['sum'], 6))}")
+        lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    指标注册表
+    - counter() / gauge() / histogram(): 创建并登记指标
+    - add_collector(): 登记在导出前调用的回调，用于把控制器、熔断器等的当前状态写入仪表
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, label_names=()):
+        return self._add(Counter(name, help_text, label_names))
+
+    def gauge(self, name, help_text, label_names=()):
+        return self._add(Gauge(name, help_text, label_names))
+
+    def histogram(self, name, help_text, label_names=(), buckets=REQUEST_LATENCY_BUCKETS):
+        return self._add(Histogram(name, help_text, label_names, buckets))
+
+    def add_collector(self, collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        """生成 Prometheus 文本格式"""
+        with self._lock:
+            collectors = list(self._collectors)
+            metrics = list(self._metrics)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                print(f"指标收集失败: {e}")
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# 全局注册表
+metrics_registry = MetricsRegistry()
+
+# ============ 库存查询指标 ============
+# path: async（异步引擎）/ sync（串行回退和单个查询）
+
+stock_requests = metrics_registry.counter(
+    "inventory_stock_requests_total",
+    "库存接口请求次数（每次尝试，包括重试和对冲请求），按状态码或 timeout/error 分类",
+    ("path", "status"))
+stock_request_duration = metrics_registry.histogram(
+    "inventory_stock_request_duration_seconds",
+    "单次库存接口请求的耗时（秒）",
+    ("path",), buckets=REQUEST_LATENCY_BUCKETS)
+stock_response_bytes = metrics_registry.counter(
+    "inventory_stock_response_bytes_total",
+    "库存接口响应体的字节数",
+    ("path",))
+stock_retries = metrics_registry.counter(
+    "inventory_stock_retries_total",
+    "库存接口重试次数",
+    ("path",))
+stock_fetches = metrics_registry.counter(
+    "inventory_stock_fetches_total",
+    "单个SKU的库存查询结果（重试之后）：success 为取得库存数据，failure 为失败或空数据",
+    ("path", "outcome"))
+stock_in_flight = metrics_registry.gauge(
+    "inventory_stock_in_flight",
+    "异步引擎当前的在途请求数")
+stock_concurrency_limit = metrics_registry.gauge(
+    "inventory_stock_concurrency_limit",
+    "AIMD 控制器当前的并发上限")
+stock_breaker_open = metrics_registry.gauge(
+    "inventory_stock_breaker_open",
+    "库存接口熔断器是否处于熔断冷却期（1 为熔断中）")
+
+stock_batches = metrics_registry.counter(
+    "inventory_stock_batches_total",
+    "批量库存查询次数")
+stock_batch_duration = metrics_registry.histogram(
+    "inventory_stock_batch_duration_seconds",
+    "批量库存查询的耗时（秒）",
+    buckets=BATCH_DURATION_BUCKETS)
+stock_batch_products = metrics_registry.counter(
+    "inventory_stock_batch_products_total",
+    "批量查询中的SKU数量：succeeded 有数据，empty 失败或空数据，missed 未在截止时间内完成",
+    ("result",))
+stock_batch_throughput = metrics_registry.gauge(
+    "inventory_stock_batch_last_throughput",
+    "最近一次批量查询的吞吐量（SKU/秒）")
+stock_batch_success_ratio = metrics_registry.gauge(
+    "inventory_stock_batch_last_success_ratio",
+    "最近一次批量查询的成功比例（0~1）")
+
+
+def record_stock_request(path, status, duration, response_bytes=0):
+    """记录一次库存接口请求（status 为 HTTP 状态码或 timeout/error）"""
+    stock_requests.inc(path=path, status=status)
+    stock_request_duration.observe(duration, path=path)
+    if response_bytes:
+        stock_response_bytes.inc(response_bytes, path=path)
+
+
+def record_stock_retry(path, count=1):
+    if count:
+        stock_retries.inc(count, path=path)
+
+
+def record_stock_fetch(path, succeeded):
+    stock_fetches.inc(path=path, outcome="success" if succeeded else "failure")
+
+
+def record_stock_batch(total, succeeded, missed, duration):
+    """记录一次批量查询（total 为SKU总数，missed 为未完成的数量）"""
+    stock_batches.inc()
+    stock_batch_duration.observe(duration)
+    stock_batch_products.inc(succeeded, result="succeeded")
+    stock_batch_products.inc(max(0, total - succeeded - missed), result="empty")
+    stock_batch_products.inc(missed, result="missed")
+    if duration > 0:
+        stock_batch_throughput.set(round((total - missed) / duration, 3))
+    if total:
+        stock_batch_success_ratio.set(round(succeeded / total, 4))
+
+
+# ============ 导出 ============
+
+def render_metrics():
+    """生成全部指标的 Prometheus 文本"""
+    return metrics_registry.render()
+
+
+def write_metrics_file(path):
+    """写入指标文件（先写临时文件再替换，读取方不会读到一半的内容）"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = render_metrics().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # 不在控制台输出每次抓取
+        pass
+
+
+class MetricsExporter:
+    """指标导出器：在本机端口提供 /metrics，和/或定期写入指标文件"""
+
+    def __init__(self, port=METRICS_PORT, host=METRICS_HOST, file_path=METRICS_FILE,
+                 interval=METRICS_WRITE_INTERVAL_SECONDS):
+        self.port = port
+        self.host = host
+        self.file_path = file_path
+        self.interval = interval
+        self._server = None
+        # 端口绑定失败的原因：记住后不再重试（每次页面重新运行都会调用 start）
+        self.bind_error = None
+        self._writer = None
+        self._stop_event = threading.Event()
+
+    def is_running(self):
+        return self._server is not None or (self._writer is not None and self._writer.is_alive())
+
+    def start(self):
+        """启动导出（已在运行时不重复启动；端口绑定失败过时不再重试）"""
+        if self.port and self._server is None and self.bind_error is None:
+            try:
+                self._server = ThreadingHTTPServer((self.host, self.port), _MetricsHandler)
+            except OSError as e:
+                # 端口被占用（例如同一台机器上的另一个服务进程）时只输出一次警告，本进程不再提供端口导出
+                self.bind_error = str(e)
+                print(f"指标端口启动失败: {self.host}:{self.port} ({e})，本进程不再重试")
+            else:
+                self._server.daemon_threads = True
+                threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+                print(f"指标导出已启动: http://{self.host}:{self.port}/metrics")
+
+        if self.file_path and (self._writer is None or not self._writer.is_alive()):
+            self._stop_event.clear()
+            self._writer = threading.Thread(target=self._write_loop, name="metrics-writer", daemon=True)
+            self._writer.start()
+            print(f"指标文件导出已启动: {self.file_path}（每 {self.interval} 秒）")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def _write_loop(self):
+        while True:
+            try:
+                write_metrics_file(self.file_path)
+            except Exception as e:
+                print(f"指标文件写入失败: {e}")
+            if self._stop_event.wait(self.interval):
+                break
+
+    def get_statistics(self):
+        """获取导出状态"""
+        return {
+            'running': self.is_running(),
+            'url': f"http://{self.host}:{self.port}/metrics" if self._server is not None else None,
+            'bind_error': self.bind_error,
+            'file_path': self.file_path or None,
+            'interval': self.interval
+        }
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_metrics_exporter():
+    """获取全局指标导出器"""
+    global _exporter
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = MetricsExporter()
+    return _exporter
+
+
+def ensure_metrics_exporter_started():
+    """按配置启动指标导出（每个服务进程只启动一次）"""
+    if not METRICS_PORT and not METRICS_FILE:
+        return None
+    exporter = get_metrics_exporter()
+    with _exporter_lock:
+        exporter.start()
+    return exporter
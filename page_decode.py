@@ -0,0 +1,48 @@
+import json
+import re
+
+_decoder = json.JSONDecoder()
+
+# 选项数组的键：嵌在脚本字符串中的转义格式（\"options\":[）或直接嵌入的 JSON（"options":[）
+# 以固定字面量开头，一次扫描整个页面，不会回溯；是否转义由键前的反斜杠判断
+_OPTIONS_KEY = re.compile(r'"options(\\?)":\[')
+# 脚本字符串字面量的剩余部分（到第一个未转义的引号为止）；两个分支的首字符互斥，不会回溯
+_STRING_BODY = re.compile(r'(?:[^"\\]+|\\.)*', re.DOTALL)
+
+
+def _is_option_list(value):
+    """是否是产品选项数组（元素为带 parent_ids 的字典）"""
+    return isinstance(value, list) and any(isinstance(item, dict) and "parent_ids" in item for item in value)
+
+
+def _decode_plain(html_content, array_start):
+    """直接从页面中解码 JSON 数组"""
+    value, _ = _decoder.raw_decode(html_content, array_start)
+    return value
+
+
+def _decode_escaped(html_content, array_start):
+    """先把所在的脚本字符串按 JSON 字符串规则反转义，再解码其中的数组"""
+    body = _STRING_BODY.match(html_content, array_start).group(0)
+    text = json.loads(f'"{body}"')
+    value, _ = _decoder.raw_decode(text)
+    return value
+
+
+def extract_option_payload(html_content):
+    """
+    提取页面中嵌入的产品选项数组（颜色和尺码选项）
+    按页面顺序查找 options 键，解码后不是选项数组时继续查找下一个；没有找到时返回 None
+    """
+    if not html_content:
+        return None
+    for match in _OPTIONS_KEY.finditer(html_content):
+        escaped = match.group(1) and match.start() > 0 and html_content[match.start() - 1] == "\\"
+        decode = _decode_escaped if escaped else _decode_plain
+        try:
+            options = decode(html_content, match.end() - 1)
+        except ValueError:
+            continue
+        if _is_option_list(options):
+            return options
+    return None
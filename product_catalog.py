@@ -0,0 +1,455 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from concurrency_control import RateBudget
+from favorites_manager import load_favorites
+from product_detail import fetch_product_page
+from product_search import fetch_product_ids_by_gender
+from utils import standardize_model_name
+
+# 本地产品目录数据库文件路径（跨会话、跨重启共享）
+PRODUCT_CATALOG_DB_FILE = "product_catalog.db"
+# 是否启用后台目录刷新（可通过环境变量 PRODUCT_CATALOG_REFRESH=1 开启）
+CATALOG_REFRESH_ENABLED = os.environ.get("PRODUCT_CATALOG_REFRESH", "0") == "1"
+# 每轮刷新的间隔（秒）
+CATALOG_REFRESH_INTERVAL_SECONDS = int(os.environ.get("PRODUCT_CATALOG_REFRESH_SECONDS", 6 * 3600))
+# 产品信息超过这段时间后重新抓取详情页（季节、颜色、价格）
+CATALOG_STALE_SECONDS = 7 * 24 * 3600
+# 每轮最多抓取的详情页数量（其余的留到下一轮，避免一次请求过多）
+CATALOG_PAGES_PER_ROUND = 80
+# 同时抓取的详情页数量
+CATALOG_FETCH_WORKERS = 4
+# 目录刷新的请求预算（每秒请求数）：搜索页和详情页共用，后台抓取不会挤占前台查询
+CATALOG_REQUESTS_PER_SECOND = float(os.environ.get("PRODUCT_CATALOG_RPS", 2))
+# 目录搜索时每个性别同时请求的页数（前台搜索使用 SEARCH_CONCURRENT_PAGES）
+CATALOG_SEARCH_CONCURRENT_PAGES = 1
+# 用户搜索过的关键词在这段时间内参与目录刷新
+CATALOG_QUERY_RETENTION_SECONDS = 30 * 24 * 3600
+# 目录刷新时搜索的性别（BACKPACK 不带性别参数，可以找到背包等不分性别的产品）
+CATALOG_GENDERS = ("MALE", "FEMALE", "BACKPACK")
+# 目录刷新的基础关键词（产品系列），另外加上收藏中的型号和用户搜索过的关键词
+CATALOG_SEED_KEYWORDS = (
+    "alpha", "beta", "gamma", "atom", "cerium", "proton", "zeta", "squamish", "kyanite", "delta",
+    "rho", "covert", "konseal", "norvan", "aerios", "sylan", "mantis", "bora", "heliad", "arro",
+    "granville", "index", "sabre", "rush", "macai", "thorium", "therme", "solano", "gamma mx",
+    "lefroy", "sigma", "motus", "cormac", "taema", "ralle", "venta", "alpine", "fission", "incendo",
+)
+
+PRODUCT_DETAIL_URL = "https://arcteryx.co.kr/products/view/{product_id}?sc=100"
+
+# 模糊匹配：最低得分，以及查询完整出现在型号中时的加分
+FUZZY_MIN_SCORE = 0.45
+FUZZY_SUBSTRING_BONUS = 0.5
+
+
+def _trigrams(text):
+    """标准化文本的三元组（词首尾补空格，短词也能匹配）"""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex:
+    """三元组模糊索引：部分输入和拼写错误的型号也能在本地快速匹配"""
+
+    def __init__(self, entries: Dict[str, str]):
+        """entries: {产品ID: 标准化的型号}"""
+        self.texts = dict(entries)
+        self.grams = {}
+        self.postings = {}
+        for product_id, text in self.texts.items():
+            grams = _trigrams(text)
+            self.grams[product_id] = len(grams)
+            for gram in grams:
+                self.postings.setdefault(gram, []).append(product_id)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def search(self, query, limit=20, min_score=FUZZY_MIN_SCORE):
+        """
+        返回 [(产品ID, 得分)]，按得分从高到低排列
+        得分 = 查询三元组的覆盖率 × 0.7 + Dice 系数 × 0.3，查询完整出现在型号中时再加分
+        """
+        query = standardize_model_name(query)
+        if not query:
+            return []
+        query_grams = _trigrams(query)
+        common = Counter()
+        for gram in query_grams:
+            common.update(self.postings.get(gram, ()))
+
+        results = []
+        for product_id, shared in common.items():
+            coverage = shared / len(query_grams)
+            dice = 2 * shared / (len(query_grams) + self.grams[product_id])
+            score = coverage * 0.7 + dice * 0.3
+            if query in self.texts[product_id]:
+                score += FUZZY_SUBSTRING_BONUS
+            if score >= min_score:
+                results.append((product_id, score))
+        results.sort(key=lambda item: (-item[1], self.texts[item[0]], item[0]))
+        return results[:limit]
+
+
+class ProductCatalog:
+    """本地产品目录：保存搜索接口发现的产品和详情页信息，并维护内存中的模糊索引"""
+
+    def __init__(self, db_path=PRODUCT_CATALOG_DB_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._index = None
+        self._products = {}
+        self._init_db()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_db(self):
+        """初始化数据表"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS products ("
+                " product_id TEXT PRIMARY KEY,"
+                " exact_model TEXT,"
+                " model_key TEXT,"
+                " genders TEXT NOT NULL DEFAULT '',"
+                " season TEXT,"
+                " colors TEXT NOT NULL DEFAULT '[]',"
+                " price INTEGER,"
+                " first_seen_at REAL NOT NULL,"
+                " last_seen_at REAL NOT NULL,"
+                " detail_fetched_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS search_queries ("
+                " query TEXT PRIMARY KEY,"
+                " last_used_at REAL NOT NULL)"
+            )
+
+    # ---------- 写入 ----------
+
+    def record_query(self, query):
+        """记录用户搜索过的关键词（后台刷新时一并搜索）"""
+        query = standardize_model_name(query)
+        if not query:
+            return
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute("INSERT OR REPLACE INTO search_queries (query, last_used_at) VALUES (?, ?)",
+                             (query, time.time()))
+        except sqlite3.Error as e:
+            print(f"记录搜索关键词失败: {e}")
+
+    def recent_queries(self, max_age=CATALOG_QUERY_RETENTION_SECONDS) -> List[str]:
+        """最近搜索过的关键词"""
+        try:
+            with closing(self._connect()) as conn:
+                cursor = conn.execute("SELECT query FROM search_queries WHERE last_used_at >= ? "
+                                      "ORDER BY last_used_at DESC", (time.time() - max_age,))
+                return [row[0] for row in cursor]
+        except sqlite3.Error as e:
+            print(f"读取搜索关键词失败: {e}")
+            return []
+
+    def mark_seen(self, genders_by_id: Dict[str, Iterable[str]], seen_at: Optional[float] = None):
+        """记录搜索接口返回的产品（新产品插入，已有产品合并性别并更新最近出现时间），返回新产品数量"""
+        seen_at = seen_at if seen_at is not None else time.time()
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                existing = dict(conn.execute("SELECT product_id, genders FROM products"))
+                new_count = 0
+                for product_id, genders in genders_by_id.items():
+                    old_genders = existing.get(product_id)
+                    merged = sorted(set(filter(None, (old_genders or "").split(","))) | set(genders))
+                    if old_genders is None:
+                        new_count += 1
+                        conn.execute(
+                            "INSERT INTO products (product_id, genders, first_seen_at, last_seen_at) "
+                            "VALUES (?, ?, ?, ?)", (product_id, ",".join(merged), seen_at, seen_at))
+                    else:
+                        conn.execute("UPDATE products SET genders = ?, last_seen_at = ? WHERE product_id = ?",
+                                     (",".join(merged), seen_at, product_id))
+        except sqlite3.Error as e:
+            print(f"保存产品目录失败: {e}")
+            return 0
+        return new_count
+
+    def save_details(self, product_id, page, fetched_at: Optional[float] = None):
+        """保存详情页信息（型号、季节、颜色、价格）"""
+        fetched_at = fetched_at if fetched_at is not None else time.time()
+        details = page.details() or {}
+        exact_model = details.get("exact_model")
+        if exact_model == "未找到型号信息":
+            exact_model = None
+        season = details.get("year_info")
+        if season == "未找到年份信息":
+            season = None
+        colors = [color.get("name", "") for color in page.color_options if color.get("name")]
+        prices = [int(info["sell_price"]) for info in page.sku_index.values() if info["sell_price"].isdigit()]
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "UPDATE products SET exact_model = ?, model_key = ?, season = ?, colors = ?, price = ?, "
+                    "detail_fetched_at = ? WHERE product_id = ?",
+                    (exact_model, standardize_model_name(exact_model or ""), season,
+                     json.dumps(colors, ensure_ascii=False), min(prices) if prices else None,
+                     fetched_at, product_id))
+        except sqlite3.Error as e:
+            print(f"保存产品详情失败: {e}")
+
+    # ---------- 读取 ----------
+
+    def stale_product_ids(self, max_age=CATALOG_STALE_SECONDS, limit=CATALOG_PAGES_PER_ROUND) -> List[str]:
+        """需要抓取详情页的产品（从未抓取的优先，其次是最久未更新的）"""
+        try:
+            with closing(self._connect()) as conn:
+                cursor = conn.execute(
+                    "SELECT product_id FROM products WHERE detail_fetched_at IS NULL OR detail_fetched_at < ? "
+                    "ORDER BY detail_fetched_at IS NOT NULL, detail_fetched_at, last_seen_at DESC LIMIT ?",
+                    (time.time() - max_age, limit))
+                return [row[0] for row in cursor]
+        except sqlite3.Error as e:
+            print(f"读取产品目录失败: {e}")
+            return []
+
+    def load_products(self) -> Dict[str, dict]:
+        """读取全部已抓取详情的产品 {产品ID: 产品信息}"""
+        products = {}
+        try:
+            with closing(self._connect()) as conn:
+                cursor = conn.execute(
+                    "SELECT product_id, exact_model, model_key, genders, season, colors, price, last_seen_at "
+                    "FROM products WHERE model_key IS NOT NULL AND model_key != ''")
+                for product_id, exact_model, model_key, genders, season, colors, price, last_seen_at in cursor:
+                    products[product_id] = {
+                        "product_id": product_id,
+                        "exact_model": exact_model,
+                        "model_key": model_key,
+                        "genders": [gender for gender in genders.split(",") if gender],
+                        "season": season,
+                        "colors": json.loads(colors),
+                        "price": price,
+                        "last_seen_at": last_seen_at
+                    }
+        except sqlite3.Error as e:
+            print(f"读取产品目录失败: {e}")
+        return products
+
+    def rebuild_index(self):
+        """从数据库重建内存中的模糊索引（完成后整体替换，查询不会看到一半的索引）"""
+        products = self.load_products()
+        index = TrigramIndex({product_id: product["model_key"] for product_id, product in products.items()})
+        with self._lock:
+            self._products = products
+            self._index = index
+        return len(index)
+
+    def _get_index(self):
+        """获取索引和对应的产品信息（首次使用时从数据库构建）"""
+        if self._index is None:
+            self.rebuild_index()
+        with self._lock:
+            return self._index, self._products
+
+    def search(self, query, gender=None, limit=20) -> List[dict]:
+        """
+        在本地目录中模糊搜索型号
+
+        Args:
+            query: 用户输入（会先用 standardize_model_name 标准化，可以是部分型号或有拼写错误）
+            gender: MALE / FEMALE 时只返回该性别的产品，其他值不筛选
+
+        Returns:
+            [{product_id, exact_model, genders, season, colors, price, score}]，按匹配程度排列
+        """
+        index, products = self._get_index()
+        results = []
+        for product_id, score in index.search(query, limit=limit * 3 if gender else limit):
+            product = products[product_id]
+            if gender in ("MALE", "FEMALE") and product["genders"] and gender not in product["genders"]:
+                continue
+            results.append({**product, "score": round(score, 3)})
+            if len(results) >= limit:
+                break
+        return results
+
+    def get_statistics(self):
+        """获取目录统计信息"""
+        try:
+            with closing(self._connect()) as conn:
+                total, detailed = conn.execute(
+                    "SELECT COUNT(*), COUNT(detail_fetched_at) FROM products").fetchone()
+        except sqlite3.Error as e:
+            print(f"读取产品目录失败: {e}")
+            total = detailed = 0
+        return {
+            'products': total,
+            'detailed': detailed,
+            'indexed': len(self._index) if self._index is not None else 0
+        }
+
+
+class CatalogRefresher:
+    """后台目录刷新：定期搜索关键词发现新产品，并增量抓取新产品和过期产品的详情页"""
+
+    def __init__(self, catalog: ProductCatalog, interval=CATALOG_REFRESH_INTERVAL_SECONDS, budget=None):
+        self.catalog = catalog
+        self.interval = interval
+        # 所有目录请求（搜索页和详情页）共用的请求预算，不积累突发名额
+        self.budget = budget or RateBudget(CATALOG_REQUESTS_PER_SECOND, burst=1)
+        self._thread = None
+        self._stop_event = threading.Event()
+        self.rounds = 0
+        self.discovered = 0
+        self.fetched = 0
+        self.failed = 0
+        self.last_round_at = None
+        self._last_discovery = None
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        """启动后台线程（已在运行时不重复启动）"""
+        if self.is_running():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="catalog-refresh", daemon=True)
+        self._thread.start()
+        print(f"产品目录刷新已启动: 每 {self.interval} 秒一轮")
+
+    def stop(self):
+        """停止后台线程"""
+        self._stop_event.set()
+
+    def _keywords(self):
+        """本轮搜索的关键词：基础关键词 + 收藏中的型号 + 用户搜索过的关键词（去重）"""
+        favorite_models = [fav.get("product_model", "") for fav in load_favorites()]
+        keywords = [*CATALOG_SEED_KEYWORDS, *favorite_models, *self.catalog.recent_queries()]
+        return list(dict.fromkeys(filter(None, (standardize_model_name(k) for k in keywords))))
+
+    def discover(self):
+        """搜索全部关键词，记录发现的产品，返回新产品数量"""
+        genders_by_id = {}
+        for keyword in self._keywords():
+            if self._stop_event.is_set():
+                break
+            try:
+                results = fetch_product_ids_by_gender(
+                    keyword, CATALOG_GENDERS, concurrent_pages=CATALOG_SEARCH_CONCURRENT_PAGES,
+                    budget=self.budget)
+            except Exception as e:
+                print(f"目录搜索失败 '{keyword}': {e}")
+                continue
+            for gender, product_ids in results.items():
+                for product_id in product_ids:
+                    # BACKPACK 搜索不带性别参数，只记录产品，不记录性别
+                    genders = genders_by_id.setdefault(product_id, set())
+                    if gender != "BACKPACK":
+                        genders.add(gender)
+        new_count = self.catalog.mark_seen(genders_by_id)
+        self.discovered += new_count
+        return new_count
+
+    def _fetch_page(self, product_id):
+        """等待请求预算后下载并解析一个详情页"""
+        self.budget.acquire_blocking()
+        return fetch_product_page(PRODUCT_DETAIL_URL.format(product_id=product_id))
+
+    def fetch_details(self):
+        """抓取新产品和过期产品的详情页，返回成功数量"""
+        product_ids = self.catalog.stale_product_ids()
+        if not product_ids:
+            return 0
+
+        fetched = 0
+        with ThreadPoolExecutor(max_workers=CATALOG_FETCH_WORKERS, thread_name_prefix="catalog-fetch") as executor:
+            pages = executor.map(self._fetch_page, product_ids)
+            for product_id, page in zip(product_ids, pages):
+                if page is None:
+                    self.failed += 1
+                    continue
+                self.catalog.save_details(product_id, page)
+                fetched += 1
+        self.fetched += fetched
+        return fetched
+
+    def run_once(self):
+        """执行一轮刷新：发现新产品（每个间隔一次）、抓取详情页、重建索引"""
+        started = time.monotonic()
+        new_count = 0
+        if self._last_discovery is None or started - self._last_discovery >= self.interval:
+            new_count = self.discover()
+            self._last_discovery = started
+        fetched = self.fetch_details()
+        indexed = self.catalog.rebuild_index()
+        print(f"产品目录刷新完成: 新产品 {new_count} 个，抓取详情 {fetched} 个，"
+              f"索引 {indexed} 个产品，用时 {time.monotonic() - started:.1f} 秒")
+        return fetched
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                fetched = self.run_once()
+            except Exception as e:
+                print(f"产品目录刷新失败: {e}")
+                fetched = 0
+            self.rounds += 1
+            self.last_round_at = datetime.now()
+            # 还有未抓取的详情页时很快开始下一轮（只抓取详情页，不重复搜索），否则等待完整的间隔
+            wait = 60 if fetched >= CATALOG_PAGES_PER_ROUND else self.interval
+            self._stop_event.wait(wait)
+
+    def get_statistics(self):
+        """获取刷新统计信息"""
+        return {
+            'running': self.is_running(),
+            'interval': self.interval,
+            'rounds': self.rounds,
+            'discovered': self.discovered,
+            'fetched': self.fetched,
+            'failed': self.failed,
+            'last_round_at': self.last_round_at
+        }
+
+
+_catalog = None
+_refresher = None
+_catalog_lock = threading.Lock()
+
+
+def get_product_catalog():
+    """获取全局产品目录（首次调用时创建数据库）"""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = ProductCatalog()
+    return _catalog
+
+
+def get_catalog_refresher():
+    """获取全局目录刷新器"""
+    global _refresher
+    catalog = get_product_catalog()
+    with _catalog_lock:
+        if _refresher is None:
+            _refresher = CatalogRefresher(catalog)
+    return _refresher
+
+
+def ensure_catalog_refresher_started():
+    """按配置启动后台目录刷新（每个服务进程只启动一次）"""
+    if not CATALOG_REFRESH_ENABLED:
+        return None
+    refresher = get_catalog_refresher()
+    refresher.start()
+    return refresher
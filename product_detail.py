@@ -1,14 +1,43 @@
-import requests
-import re
 from lxml import html
-from cache_manager import product_cache  # 新增导入
 import streamlit as st
-import json # Added for extract_variant_json_from_html
-from bs4 import BeautifulSoup # Added for extract_variant_json_from_html
+import os
+import threading
+import multiprocessing
+from typing import Optional
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+from singleflight import SingleFlight
+from http_cassette import http_get
+from page_decode import extract_option_payload
+from product_page import ParsedProductPage, parse_product_page
+
+# 详情页请求合并组：多个会话同时请求同一URL时只下载一次
+page_flight = SingleFlight("详情页下载")
+
+# 详情页预取的最大并发下载数（进程级共享，所有会话的预取共用同一个信号量）
+DETAIL_PREFETCH_WORKERS = 8
+
+# 详情页解析进程数：lxml 和正则解析是CPU密集型的，放到进程池中与下载重叠并利用多核，只传回解析结果
+# 设置环境变量 PRODUCT_PARSE_PROCESSES=0 时在下载线程中直接解析
+# 在 Streamlit 服务进程中不使用进程池：spawn 的工作进程会把 Streamlit 注册的 __main__（应用脚本 main.py）
+# 作为 __mp_main__ 重新导入，每个工作进程都会执行页面配置、创建数据库客户端并导入整个界面；
+# 只有普通的 Python 入口（例如 bench 脚本，带 __main__ 保护）才启动解析进程
+PRODUCT_PARSE_PROCESSES = int(os.environ.get("PRODUCT_PARSE_PROCESSES", min(4, os.cpu_count() or 1)))
+
+_prefetch_slots = threading.BoundedSemaphore(DETAIL_PREFETCH_WORKERS)
+_parse_executor = None
+_parse_lock = threading.Lock()
+
 
-@st.cache_data(ttl=3600)
 def fetch_html_from_url(url):
-    """从URL获取HTML内容（支持缓存）"""
+    """从URL获取HTML内容（并发的同URL请求共享一次下载；缓存的是解析结果 ParsedProductPage，不缓存HTML）"""
+    return page_flight.do(url, _download_html, url)
+
+
+def _download_html(url):
+    """下载HTML内容"""
     try:
         headers = {
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
@@ -17,7 +46,7 @@ def fetch_html_from_url(url):
             "Connection": "keep-alive"
         }
 
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_get(url, headers=headers, timeout=10)
         response.raise_for_status()
 
         html_content = response.text
@@ -28,81 +57,78 @@ def fetch_html_from_url(url):
         return None
 
 
-def parse_hex_list(hex_string):
-    """从HEX字符串解析出HEX值列表（支持单色和混合色）"""
-    if not hex_string:
-        return []
-    
-    # 如果已经是列表，直接处理
-    if isinstance(hex_string, list):
-        # 处理列表中的各种格式
-        result = []
-        for item in hex_string:
-            if item:  # 非空检查
-                if isinstance(item, str):
-                    item = item.strip()
-                    if item.startswith('#'):
-                        result.append(item)
-                else:
-                    # 尝试转换为字符串
-                    item_str = str(item).strip()
-                    if item_str.startswith('#'):
-                        result.append(item_str)
-        print(f"[DEBUG parse_hex_list] 输入是列表: {hex_string} => 输出: {result}")
-        return result
-    
-    # 处理字符串格式的HEX值
-    if isinstance(hex_string, str):
-        # 先移除所有转义的引号（来自正则提取）
-        hex_string = hex_string.replace('\\"', '"').replace('\\', '')
-        # 然后移除所有引号
-        hex_string = hex_string.replace('"', '').replace("'", '')
-        
-        # 处理多个HEX值用逗号或其他分隔符分隔的情况
-        hex_values = [h.strip() for h in hex_string.split(',') if h.strip() and h.strip().startswith('#')]
-        result = hex_values if hex_values else ([hex_string] if hex_string.startswith('#') else [])
-        print(f"[DEBUG parse_hex_list] 输入是字符串: {hex_string} => 输出: {result}")
-        return result
-    
-    print(f"[DEBUG parse_hex_list] 未知类型 {type(hex_string)}: {hex_string}")
-    return []
-
-
-@st.cache_data(ttl=3600)
-def extract_product_details(detail_url):
-    """提取产品详情页的描述、年份信息和准确型号（支持缓存）"""
+def _get_parse_executor():
+    """获取详情页解析进程池（首次调用时创建；PRODUCT_PARSE_PROCESSES 为 0 或在 Streamlit 服务进程中时返回 None）"""
+    global _parse_executor
+    if runtime.exists():
+        return None
+    with _parse_lock:
+        if _parse_executor is None and PRODUCT_PARSE_PROCESSES > 0:
+            # 使用 spawn：主进程中已有事件循环和线程池，fork 可能复制到被持有的锁
+            _parse_executor = ProcessPoolExecutor(max_workers=PRODUCT_PARSE_PROCESSES,
+                                                  mp_context=multiprocessing.get_context("spawn"))
+            print(f"🧩 详情页解析进程池已启动（{PRODUCT_PARSE_PROCESSES} 个进程）")
+    return _parse_executor
+
+
+def _parse_in_pool(detail_url, html_content):
+    """在解析进程池中解析详情页（等待期间释放GIL，其他线程的下载继续进行）；进程池不可用时在当前线程解析"""
+    executor = _get_parse_executor()
+    if executor is None:
+        return parse_product_page(detail_url, html_content)
+    try:
+        # submit 在进程池已关闭或已损坏时抛出 RuntimeError（BrokenProcessPool 也是其子类）
+        future = executor.submit(parse_product_page, detail_url, html_content)
+    except RuntimeError as e:
+        return _parse_after_pool_failure(executor, detail_url, html_content, e)
     try:
-        html_content = fetch_html_from_url(detail_url)
-        if not html_content:
-            return None
+        return future.result()
+    except BrokenProcessPool as e:
+        # 工作进程异常退出；解析本身抛出的异常照常向上传递
+        return _parse_after_pool_failure(executor, detail_url, html_content, e)
+
+
+def _parse_after_pool_failure(executor, detail_url, html_content, error):
+    """进程池不可用：丢弃进程池（下次调用时重建），本次在当前线程解析"""
+    global _parse_executor
+    print(f"⚠️ 详情页解析进程池不可用，改为在当前线程解析: {error}")
+    with _parse_lock:
+        if _parse_executor is executor:
+            _parse_executor = None
+    return parse_product_page(detail_url, html_content)
+
+
+def fetch_product_page(detail_url) -> Optional[ParsedProductPage]:
+    """下载并解析详情页（不经过缓存，例如后台任务批量抓取时使用；下载失败时返回 None）"""
+    html_content = fetch_html_from_url(detail_url)
+    if not html_content:
+        return None
+    return _parse_in_pool(detail_url, html_content)
 
-        # 使用正则表达式提取年份款式信息
-        year_match = re.search(r'\\"season\\":\\"(\d+\/\w+)\\"', html_content)
-        year_info = year_match.group(1) if year_match else "未找到年份信息"
 
-        # 提取产品描述
-        tree = html.fromstring(html_content)
-        description_elements = tree.xpath('//*[@id="content-wrap"]/div[2]/div[2]/div/div[1]/div/div[2]/p/text()')
-        description = " ".join(desc.strip() for desc in description_elements if desc.strip())
-        description = re.sub(r'\s+', ' ', description).strip()
-
-        # 提取准确型号（Beta SL Jacket）
-        exact_model_elements = tree.xpath('//*[@id="content-wrap"]/div[3]/p[1]/text()')
-        exact_model = exact_model_elements[0].strip() if exact_model_elements else "未找到型号信息"
-
-        result = {
-            "description": description,
-            "year_info": year_info,
-            "exact_model": exact_model
-        }
+# 缓存解析结果（st.cache_resource 不做序列化，每次访问不会复制整个对象）；下载失败时抛出异常，不缓存失败结果
+@st.cache_resource(ttl=3600, max_entries=500, show_spinner=False)
+def _load_product_page(detail_url):
+    page = fetch_product_page(detail_url)
+    if page is None:
+        raise ValueError(f"详情页下载失败: {detail_url}")
+    return page
 
-        return result
 
-    except Exception as e:
-        print(f"详情页解析失败: {e}")
+def get_product_page(detail_url) -> Optional[ParsedProductPage]:
+    """获取解析后的产品详情页（下载失败时返回 None）"""
+    try:
+        return _load_product_page(detail_url)
+    except ValueError:
         return None
 
 
+def extract_product_details(detail_url):
+    """提取产品详情页的描述、年份信息和准确型号"""
+    page = get_product_page(detail_url)
+    return page.details() if page else None
+
+
 def extract_options(html_content, xpath):
     """从HTML中提取选项"""
     try:
@@ -119,246 +145,83 @@ def extract_options(html_content, xpath):
         return []
 
 
-@st.cache_data(ttl=3600)
 def extract_variant_json_from_html(html_content):
     """
-    从HTML中提取产品变体的JSON数据
-    JSON数据通常在script标签中，格式如：
-    var variantData = {...}
-    或在data属性中
+    从HTML中提取产品变体的JSON数据（选项数组）
+    选项数据通常嵌在脚本字符串中（转义格式）或直接嵌入页面，由 extract_option_payload 一次扫描定位并解码；
+    不做缓存（以整个页面为缓存键时每次调用都要哈希整个页面），详情页的解析结果按URL缓存，见 get_product_page
     """
     try:
-        # 方法1：查找script标签中的JSON数据（常见模式）
-        # 查找包含variant或option数据的JSON对象
-        json_patterns = [
-            r'var\s+\w+\s*=\s*(\{.*?"options".*?\});',  # var xxx = {...};
-            r'"options"\s*:\s*(\[.*?\]),',  # "options": [...],
-            r'data-variant=\'(.*?)\'',  # data-variant attribute
-            r'<script[^>]*>var\s+\w+\s*=\s*(\{.*?\});',  # script tag with var
-        ]
-        
-        for pattern in json_patterns:
-            matches = re.findall(pattern, html_content, re.DOTALL)
-            if matches:
-                for match in matches:
-                    try:
-                        # 尝试解析JSON
-                        if isinstance(match, str):
-                            # 修复JSON格式（移除转义符）
-                            json_str = match.replace('\\"', '"').replace('\\/', '/')
-                            # 如果不是有效的JSON对象/数组，跳过
-                            if json_str.startswith('[') or json_str.startswith('{'):
-                                data = json.loads(json_str)
-                                if isinstance(data, (dict, list)):
-                                    return data
-                    except json.JSONDecodeError:
-                        continue
-        
-        # 方法2：使用BeautifulSoup查找隐藏的script标签
-        soup = BeautifulSoup(html_content, 'html.parser')
-        
-        # 查找所有script标签
-        for script in soup.find_all('script'):
-            script_content = script.string
-            if script_content and ('variant' in script_content.lower() or 'option' in script_content.lower()):
-                try:
-                    # 尝试提取JSON部分
-                    json_match = re.search(r'\{.*\}', script_content, re.DOTALL)
-                    if json_match:
-                        json_str = json_match.group(0).replace('\\"', '"')
-                        data = json.loads(json_str)
-                        return data
-                except:
-                    continue
-        
-        return None
-        
+        return extract_option_payload(html_content)
     except Exception as e:
         print(f"提取variant JSON失败: {e}")
         return None
 
 
-@st.cache_data(ttl=3600)
 def get_product_variants(detail_url):
-    """获取产品的颜色和尺码选项（从JSON数据提取）"""
-    try:
-        html_content = fetch_html_from_url(detail_url)
-        if not html_content:
-            return None, None
-
-        # 初始化变量
-        color_options = []
-        size_options = []
-
-        # 首先尝试从HTML中提取完整的JSON数据
-        variant_json = extract_variant_json_from_html(html_content)
-        
-        if variant_json:
-            try:
-                # 解析JSON中的options数据
-                options = variant_json.get('options', []) if isinstance(variant_json, dict) else variant_json
-                
-                # 遍历options数组，color_id为0是颜色，color_id为1是尺码
-                for option in options:
-                    if isinstance(option, dict):
-                        parent_ids = option.get('parent_ids', [])
-                        value = option.get('value', '')
-                        
-                        # 颜色选项：parent_ids为[0]
-                        if parent_ids == [0]:
-                            hex_list = parse_hex_list(option.get('color_chips', []))
-                            color_item = {
-                                "id": option.get('id', ''),
-                                "name": value,
-                                "hex_list": hex_list,
-                                "image_chip": option.get('image_chip', '')
-                            }
-                            print(f"[DEBUG COLOR] 颜色名称: {value}, color_chips原始: {option.get('color_chips', [])}, 解析后hex_list: {hex_list}")
-                            color_options.append(color_item)
-                        
-                        # 尺码选项：parent_ids为[0, color_id]（任何color_id）
-                        elif len(parent_ids) == 2 and parent_ids[0] == 0:
-                            if value not in size_options:
-                                size_options.append(value)
-                
-                if color_options and size_options:
-                    return color_options, size_options
-                    
-            except Exception as e:
-                print(f"JSON解析失败: {e}")
-
-        # 回退方案：使用正则表达式直接从HTML中提取
-        try:
-            # 提取颜色选项（包括image_chip）
-            # 改进正则：捕获整个color_chips数组中的所有HEX值
-            color_matches = re.findall(
-                r'\\"id\\":(\d+),\\"parent_ids\\":\[0\],\\"sale_state\\":\\".+?\\",\\"value\\":\\"(.+?)\\",\\"adjust_price\\":0,\\"color_chips\\":\[(.*?)\],\\"image_chip\\":\\"([^"]+)\\"',
-                html_content
-            )
-            if color_matches:
-                color_options = [
-                    {
-                        "id": match[0],
-                        "name": match[1],
-                        "hex_list": parse_hex_list(match[2]),  # 使用parse_hex_list处理
-                        "image_chip": match[3]
-                    }
-                    for match in color_matches
-                ]
-            
-            # 备用的正则表达式（处理不同格式）
-            if not color_options:
-                color_matches = re.findall(
-                    r'"id":(\d+),"parent_ids":\[0\],"sale_state":"[^"]*","value":"([^"]+)"[^}]*"color_chips":\[(.*?)\][^}]*"image_chip":"([^"]+)"',
-                    html_content
-                )
-                if color_matches:
-                    color_options = [
-                        {
-                            "id": match[0],
-                            "name": match[1],
-                            "hex_list": parse_hex_list(match[2]),  # 使用parse_hex_list处理
-                            "image_chip": match[3]
-                        }
-                        for match in color_matches
-                    ]
-            
-            # 第三个备用正则（提取颜色HEX值，格式：颜色名称对应的HEX或HEX列表）
-            if not color_options:
-                # 查找所有单独的颜色芯片HEX值
-                hex_matches = re.findall(
-                    r'\\"color_chips\\":\[(.*?)\]',
-                    html_content
-                )
-
-                # 同时提取颜色名称
-                if hex_matches:
-                    color_name_matches = re.findall(
-                        r'\\"value\\":\\"([^"]+?)\\",\\"adjust_price\\":\d+,\\"color_chips\\":\[',
-                        html_content
-                    )
-                    if color_name_matches:
-                        # 配对HEX和颜色名称
-                        color_options = [
-                            {
-                                "id": f"color_{i}",
-                                "name": color_name_matches[i] if i < len(color_name_matches) else f"Color {i}",
-                                "hex_list": parse_hex_list(hex_matches[i]),
-                                "image_chip": ""
-                            }
-                            for i in range(min(len(hex_matches), len(color_name_matches)))
-                        ]
-        except Exception as e:
-            print(f"颜色正则提取失败: {e}")
-
-        # 尺码选项提取
-        try:
-            size_matches = re.findall(
-                r'\\"parent_ids\\":\[0,\d+\],\\"sale_state\\":\\"\w+\\",\\"value\\":\\"([^"]+?)\\",\\"adjust_price\\":',
-                html_content
-            )
-            if size_matches:
-                seen = set()
-                size_options = []
-                for size in size_matches:
-                    if size not in seen:
-                        seen.add(size)
-                        size_options.append(size)
-        except Exception as e:
-            print(f"尺码提取失败: {e}")
-
-        return color_options, size_options
-
-    except Exception as e:
-        print(f"产品变体获取失败: {e}")
-        return [], []
+    """获取产品的颜色和尺码选项"""
+    page = get_product_page(detail_url)
+    if page is None:
+        return None, None
+    return page.variants()
 
 
-@st.cache_data(ttl=3600)
 def get_sku_info(detail_url, color_value, size_value):
-    """获取特定颜色和尺码的SKU信息（支持缓存）"""
-    try:
-        html_content = fetch_html_from_url(detail_url)
-        if not html_content:
-            return None
-
-        # 查找颜色ID
-        escaped_color = re.escape(color_value)
-        pattern_color = fr'\\"id\\":(\d+),\\"parent_ids\\":\[0\],\\"sale_state\\":\\"\w+\\",\\"value\\":\\"{escaped_color}\\"'
-        match_color = re.search(pattern_color, html_content, re.DOTALL)
-
-        if not match_color:
-            pattern_color2 = fr'"id":(\d+),"parent_ids":\[0\],"sale_state":"\w+","value":"{escaped_color}"'
-            match_color = re.search(pattern_color2, html_content, re.DOTALL)
-            if not match_color:
-                return None
-
-        color_id = match_color.group(1)
-
-        # 查找尺码信息
-        escaped_size = re.escape(size_value)
-        pattern_sku = fr'\\"id\\":(\d+),\\"parent_ids\\":\[0,{color_id}\],\\"sale_state\\":\\"\w+\\",\\"value\\":\\"{escaped_size}\\",\\"adjust_price\\":(\d+),\\"sell_price\\":(\d+),\\"is_orderable\\":\w+,\\"stock\\":(\d+),\\"images\\":\[\]'
-        match_sku = re.search(pattern_sku, html_content, re.DOTALL)
-
-        if not match_sku:
-            pattern_sku2 = fr'"id":(\d+),"parent_ids":\[0,{color_id}\],"sale_state":"\w+","value":"{escaped_size}","adjust_price":(\d+),"sell_price":(\d+),"is_orderable":\w+,"stock":(\d+),"images":\[\]'
-            match_sku = re.search(pattern_sku2, html_content, re.DOTALL)
-
-        if match_sku:
-            result = {
-                "sku_id": match_sku.group(1),
-                "adjust_price": match_sku.group(2),
-                "sell_price": match_sku.group(3),
-                "stock": match_sku.group(4)
-            }
-
-            return result
+    """获取特定颜色和尺码的SKU信息"""
+    page = get_product_page(detail_url)
+    return page.sku_info(color_value, size_value) if page else None
 
-        return None
 
-    except Exception as e:
-        print(f"SKU信息提取失败: {e}")
-        return None
+def get_sku_grid(detail_url):
+    """获取产品全部颜色×尺码的SKU信息 {颜色名称: {尺码: SKU信息}}（下载失败时返回空字典）"""
+    page = get_product_page(detail_url)
+    return page.sku_grid() if page else {}
+
+
+def _attach_script_run_ctx(ctx):
+    """预取线程启动时附加当前会话的脚本上下文，Streamlit 缓存在线程中正常工作"""
+    if ctx is not None:
+        add_script_run_ctx(threading.current_thread(), ctx)
+
+
+def _fetch_product_full_info(detail_url):
+    """在预取线程中下载并解析详情页（占用一个进程级下载名额）"""
+    with _prefetch_slots:
+        page = get_product_page(detail_url)
+    if page is None:
+        return None, None, None
+    color_options, size_options = page.variants()
+    return page.details(), color_options, size_options
+
+
+def iter_product_full_info(detail_urls):
+    """
+    并发获取多个产品的详情和颜色/尺码（同时下载的页面数不超过 DETAIL_PREFETCH_WORKERS）
+
+    Yields:
+        (index, details, color_options, size_options)，按完成顺序产出；index 为 detail_urls 中的位置
+    """
+    # 每次运行使用自己的线程池：会话的脚本上下文只附加在本次运行的线程上，运行结束后随线程一起释放，
+    # 不会留在共享线程上被其他会话的任务继承；总下载并发仍由 _prefetch_slots 限制
+    executor = ThreadPoolExecutor(max_workers=DETAIL_PREFETCH_WORKERS,
+                                  thread_name_prefix="detail-prefetch",
+                                  initializer=_attach_script_run_ctx,
+                                  initargs=(get_script_run_ctx(),))
+    try:
+        futures = {
+            executor.submit(_fetch_product_full_info, detail_url): i
+            for i, detail_url in enumerate(detail_urls)
+        }
+        for future in as_completed(futures):
+            try:
+                details, color_options, size_options = future.result()
+            except Exception as e:
+                print(f"产品详情预取失败: {detail_urls[futures[future]]} ({e})")
+                details, color_options, size_options = None, None, None
+            yield futures[future], details, color_options, size_options
+    finally:
+        # 调用方提前停止迭代（例如脚本重新运行）时取消尚未开始的下载，不等待进行中的下载
+        executor.shutdown(wait=False, cancel_futures=True)
 
 
 # 新增：缓存管理函数
@@ -367,4 +230,5 @@ def clear_product_detail_cache():
     cache_keys = [key for key in st.session_state.keys()
                   if key.startswith(('html_', 'product_details_', 'product_variants_', 'sku_info_'))]
     for key in cache_keys:
-        del st.session_state[key]
\ No newline at end of file
+        del st.session_state[key]
+    _load_product_page.clear()
\ No newline at end of file
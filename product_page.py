@@ -0,0 +1,401 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from lxml import html
+
+from page_decode import extract_option_payload
+
+
+def parse_hex_list(hex_string):
+    """从HEX字符串解析出HEX值列表（支持单色和混合色）"""
+    if not hex_string:
+        return []
+    
+    # 如果已经是列表，直接处理
+    if isinstance(hex_string, list):
+        # 处理列表中的各种格式
+        result = []
+        for item in hex_string:
+            if item:  # 非空检查
+                if isinstance(item, str):
+                    item = item.strip()
+                    if item.startswith('#'):
+                        result.append(item)
+                else:
+                    # 尝试转换为字符串
+                    item_str = str(item).strip()
+                    if item_str.startswith('#'):
+                        result.append(item_str)
+        return result
+    
+    # 处理字符串格式的HEX值
+    if isinstance(hex_string, str):
+        # 先移除所有转义的引号（来自正则提取）
+        hex_string = hex_string.replace('\\"', '"').replace('\\', '')
+        # 然后移除所有引号
+        hex_string = hex_string.replace('"', '').replace("'", '')
+        
+        # 处理多个HEX值用逗号或其他分隔符分隔的情况
+        hex_values = [h.strip() for h in hex_string.split(',') if h.strip() and h.strip().startswith('#')]
+        result = hex_values if hex_values else ([hex_string] if hex_string.startswith('#') else [])
+        return result
+    
+    return []
+
+
+# 颜色选项（parent_ids 为 [0]）：id, sale_state, value
+_COLOR_OPTION_PATTERNS = (
+    re.compile(r'\\"id\\":(\d+),\\"parent_ids\\":\[0\],\\"sale_state\\":\\"(\w+)\\",\\"value\\":\\"([^"\\]*)\\"'),
+    re.compile(r'"id":(\d+),"parent_ids":\[0\],"sale_state":"(\w+)","value":"([^"]*)"'),
+)
+# 尺码选项（parent_ids 为 [0, 颜色ID]）：id, 颜色ID, sale_state, value, adjust_price, sell_price, is_orderable, stock
+_SIZE_OPTION_PATTERNS = (
+    re.compile(r'\\"id\\":(\d+),\\"parent_ids\\":\[0,(\d+)\],\\"sale_state\\":\\"(\w+)\\",\\"value\\":\\"([^"\\]*)\\",'
+               r'\\"adjust_price\\":(\d+),\\"sell_price\\":(\d+),\\"is_orderable\\":(\w+),\\"stock\\":(\d+),\\"images\\":\[\]'),
+    re.compile(r'"id":(\d+),"parent_ids":\[0,(\d+)\],"sale_state":"(\w+)","value":"([^"]*)",'
+               r'"adjust_price":(\d+),"sell_price":(\d+),"is_orderable":(\w+),"stock":(\d+),"images":\[\]'),
+)
+
+
+@dataclass(frozen=True)
+class ParsedProductPage:
+    """
+    解析后的产品详情页（每个URL只下载和解析一次，缓存的是解析结果而不是HTML）
+    - description / year_info / exact_model: 详情页基本信息（解析失败时为 None）
+    - color_options / size_options: 颜色（含HEX色块）和尺码选项
+    - options: 完整的选项树（颜色选项和各颜色下的尺码选项，按页面中的顺序）
+    - sku_index: (颜色名称, 尺码) → SKU信息，查询SKU时直接查字典，不再扫描页面
+    """
+    url: str
+    description: Optional[str]
+    year_info: Optional[str]
+    exact_model: Optional[str]
+    color_options: List[dict] = field(default_factory=list)
+    size_options: List[str] = field(default_factory=list)
+    options: List[dict] = field(default_factory=list)
+    sku_index: Dict[Tuple[str, str], dict] = field(default_factory=dict, repr=False)
+
+    def details(self):
+        """描述、年份信息和准确型号（与原 extract_product_details 的返回值相同）"""
+        if self.description is None:
+            return None
+        return {
+            "description": self.description,
+            "year_info": self.year_info,
+            "exact_model": self.exact_model
+        }
+
+    def variants(self):
+        """颜色和尺码选项（返回副本，调用方修改不影响缓存）"""
+        return [dict(color) for color in self.color_options], list(self.size_options)
+
+    def sku_info(self, color_value, size_value):
+        """特定颜色和尺码的SKU信息（sku_id / adjust_price / sell_price / stock 为字符串，is_orderable 为布尔值）"""
+        info = self.sku_index.get((color_value, size_value))
+        return dict(info) if info else None
+
+    def sku_grid(self):
+        """全部颜色×尺码的SKU信息：{颜色名称: {尺码: SKU信息}}，按页面中的顺序"""
+        grid = {}
+        for (color_value, size_value), info in self.sku_index.items():
+            grid.setdefault(color_value, {})[size_value] = dict(info)
+        return grid
+
+
+def _parse_details(html_content):
+    """解析描述、年份信息和准确型号，返回 (description, year_info, exact_model)"""
+    # 使用正则表达式提取年份款式信息
+    year_match = re.search(r'\\"season\\":\\"(\d+\/\w+)\\"', html_content)
+    year_info = year_match.group(1) if year_match else "未找到年份信息"
+
+    # 提取产品描述
+    tree = html.fromstring(html_content)
+    description_elements = tree.xpath('//*[@id="content-wrap"]/div[2]/div[2]/div/div[1]/div/div[2]/p/text()')
+    description = " ".join(desc.strip() for desc in description_elements if desc.strip())
+    description = re.sub(r'\s+', ' ', description).strip()
+
+    # 提取准确型号（Beta SL Jacket）
+    exact_model_elements = tree.xpath('//*[@id="content-wrap"]/div[3]/p[1]/text()')
+    exact_model = exact_model_elements[0].strip() if exact_model_elements else "未找到型号信息"
+
+    return description, year_info, exact_model
+
+
+def _normalize_option(option):
+    """解码后的选项 → 选项树中的统一格式（颜色选项只保留 id / parent_ids / sale_state / value）"""
+    parent_ids = [int(parent_id) for parent_id in option.get("parent_ids", [])]
+    normalized = {
+        "id": int(option["id"]),
+        "parent_ids": parent_ids,
+        "sale_state": option.get("sale_state", ""),
+        "value": str(option.get("value", ""))
+    }
+    if len(parent_ids) == 2:
+        normalized.update({
+            "adjust_price": int(option.get("adjust_price") or 0),
+            "sell_price": int(option.get("sell_price") or 0),
+            "is_orderable": option.get("is_orderable") in (True, "true"),
+            "stock": int(option.get("stock") or 0)
+        })
+    return normalized
+
+
+def _options_from_payload(payload):
+    """从解码后的选项数组构建选项树（保持页面中的顺序，跳过无法识别的元素）"""
+    options = []
+    for option in payload:
+        if not isinstance(option, dict) or "id" not in option:
+            continue
+        try:
+            normalized = _normalize_option(option)
+        except (TypeError, ValueError):
+            continue
+        if normalized["parent_ids"] == [0] or (
+                len(normalized["parent_ids"]) == 2 and normalized["parent_ids"][0] == 0):
+            options.append(normalized)
+    return options
+
+
+def _options_from_patterns(html_content):
+    """
+    回退方案：用正则表达式扫描页面中的颜色和尺码选项（要求固定的字段顺序）
+    页面中的选项数据可能是转义的（嵌在脚本字符串中）或未转义的，两种格式都扫描，转义格式在前
+    """
+    positioned = []
+    for color_pattern, size_pattern in zip(_COLOR_OPTION_PATTERNS, _SIZE_OPTION_PATTERNS):
+        for match in color_pattern.finditer(html_content):
+            option_id, sale_state, value = match.groups()
+            option = {"id": int(option_id), "parent_ids": [0], "sale_state": sale_state, "value": value}
+            positioned.append((match.start(), option))
+        for match in size_pattern.finditer(html_content):
+            option_id, color_id, sale_state, value, adjust_price, sell_price, is_orderable, stock = match.groups()
+            option = {
+                "id": int(option_id),
+                "parent_ids": [0, int(color_id)],
+                "sale_state": sale_state,
+                "value": value,
+                "adjust_price": int(adjust_price),
+                "sell_price": int(sell_price),
+                "is_orderable": is_orderable == "true",
+                "stock": int(stock)
+            }
+            positioned.append((match.start(), option))
+    # 同一位置只会匹配一种格式；稳定排序保证同名选项中转义格式的先出现
+    first_seen = [option for _, option in positioned]
+    options = [option for _, option in sorted(positioned, key=lambda item: item[0])]
+    return options, first_seen
+
+
+def _build_sku_index(options, first_seen):
+    """
+    (颜色名称, 尺码) → SKU信息
+    同一颜色名称或同一 (颜色, 尺码) 出现多次时，以 first_seen 中第一次出现的为准；
+    没有对应颜色选项的尺码不建立索引
+    """
+    color_ids = {}
+    size_index = {}
+    for option in first_seen:
+        if option["parent_ids"] == [0]:
+            color_ids.setdefault(option["value"], option["id"])
+        elif len(option["parent_ids"]) == 2:
+            size_index.setdefault((option["parent_ids"][1], option["value"]), option)
+
+    color_names = {}
+    for color_value, color_id in color_ids.items():
+        color_names.setdefault(color_id, []).append(color_value)
+    sku_index = {}
+    for option in options:
+        if len(option["parent_ids"]) != 2:
+            continue
+        color_id = option["parent_ids"][1]
+        if size_index.get((color_id, option["value"])) is not option:
+            continue
+        for color_value in color_names.get(color_id, ()):
+            sku_index[(color_value, option["value"])] = {
+                "sku_id": str(option["id"]),
+                "adjust_price": str(option["adjust_price"]),
+                "sell_price": str(option["sell_price"]),
+                "stock": str(option["stock"]),
+                "is_orderable": option["is_orderable"]
+            }
+    return sku_index
+
+
+def _parse_option_tree(html_content, payload=None):
+    """
+    解析页面中的全部颜色和尺码选项，返回 (options, sku_index)
+    优先使用解码后的选项数组（extract_option_payload，与字段顺序和附加字段无关）；
+    没有可解码的选项数组时回退到正则扫描
+    """
+    if payload is None:
+        payload = extract_option_payload(html_content)
+    options = _options_from_payload(payload) if payload else []
+    if options:
+        return options, _build_sku_index(options, options)
+    options, first_seen = _options_from_patterns(html_content)
+    return options, _build_sku_index(options, first_seen)
+
+
+def parse_product_page(detail_url, html_content) -> ParsedProductPage:
+    """解析详情页HTML（不依赖 Streamlit，可在任意线程或解析进程中调用）"""
+    try:
+        description, year_info, exact_model = _parse_details(html_content)
+    except Exception as e:
+        print(f"详情页解析失败: {e}")
+        description = year_info = exact_model = None
+
+    # 选项数组只解码一次，变体和SKU索引共用
+    try:
+        payload = extract_option_payload(html_content) or []
+    except Exception as e:
+        print(f"选项数据解码失败: {e}")
+        payload = []
+
+    try:
+        color_options, size_options = _parse_variants(html_content, payload)
+    except Exception as e:
+        print(f"产品变体获取失败: {e}")
+        color_options, size_options = [], []
+
+    try:
+        options, sku_index = _parse_option_tree(html_content, payload)
+    except Exception as e:
+        print(f"SKU信息提取失败: {e}")
+        options, sku_index = [], {}
+
+    return ParsedProductPage(
+        url=detail_url,
+        description=description,
+        year_info=year_info,
+        exact_model=exact_model,
+        color_options=color_options or [],
+        size_options=size_options or [],
+        options=options,
+        sku_index=sku_index
+    )
+
+
+def _parse_variants(html_content, payload=None):
+    """解析颜色和尺码选项（优先使用页面中的JSON数据，失败时使用正则表达式）"""
+    # 初始化变量
+    color_options = []
+    size_options = []
+
+    # 首先尝试从HTML中提取完整的JSON数据
+    variant_json = payload if payload is not None else extract_option_payload(html_content)
+
+    if variant_json:
+        try:
+            # 解析JSON中的options数据
+            options = variant_json.get('options', []) if isinstance(variant_json, dict) else variant_json
+
+            # 遍历options数组，color_id为0是颜色，color_id为1是尺码
+            for option in options:
+                if isinstance(option, dict):
+                    parent_ids = option.get('parent_ids', [])
+                    value = option.get('value', '')
+
+                    # 颜色选项：parent_ids为[0]
+                    if parent_ids == [0]:
+                        hex_list = parse_hex_list(option.get('color_chips', []))
+                        color_item = {
+                            "id": str(option.get('id', '')),
+                            "name": value,
+                            "hex_list": hex_list,
+                            "image_chip": option.get('image_chip', '')
+                        }
+                        color_options.append(color_item)
+
+                    # 尺码选项：parent_ids为[0, color_id]（任何color_id）
+                    elif len(parent_ids) == 2 and parent_ids[0] == 0:
+                        if value not in size_options:
+                            size_options.append(value)
+
+            if color_options and size_options:
+                return color_options, size_options
+
+        except Exception as e:
+            print(f"JSON解析失败: {e}")
+
+    # 回退方案：使用正则表达式直接从HTML中提取
+    try:
+        # 提取颜色选项（包括image_chip）
+        # 改进正则：捕获整个color_chips数组中的所有HEX值
+        color_matches = re.findall(
+            r'\\"id\\":(\d+),\\"parent_ids\\":\[0\],\\"sale_state\\":\\".+?\\",\\"value\\":\\"(.+?)\\",\\"adjust_price\\":0,\\"color_chips\\":\[(.*?)\],\\"image_chip\\":\\"([^"]+)\\"',
+            html_content
+        )
+        if color_matches:
+            color_options = [
+                {
+                    "id": match[0],
+                    "name": match[1],
+                    "hex_list": parse_hex_list(match[2]),  # 使用parse_hex_list处理
+                    "image_chip": match[3]
+                }
+                for match in color_matches
+            ]
+
+        # 备用的正则表达式（处理不同格式）
+        if not color_options:
+            color_matches = re.findall(
+                r'"id":(\d+),"parent_ids":\[0\],"sale_state":"[^"]*","value":"([^"]+)"[^}]*"color_chips":\[(.*?)\][^}]*"image_chip":"([^"]+)"',
+                html_content
+            )
+            if color_matches:
+                color_options = [
+                    {
+                        "id": match[0],
+                        "name": match[1],
+                        "hex_list": parse_hex_list(match[2]),  # 使用parse_hex_list处理
+                        "image_chip": match[3]
+                    }
+                    for match in color_matches
+                ]
+
+        # 第三个备用正则（提取颜色HEX值，格式：颜色名称对应的HEX或HEX列表）
+        if not color_options:
+            # 查找所有单独的颜色芯片HEX值
+            hex_matches = re.findall(
+                r'\\"color_chips\\":\[(.*?)\]',
+                html_content
+            )
+
+            # 同时提取颜色名称
+            if hex_matches:
+                color_name_matches = re.findall(
+                    r'\\"value\\":\\"([^"]+?)\\",\\"adjust_price\\":\d+,\\"color_chips\\":\[',
+                    html_content
+                )
+                if color_name_matches:
+                    # 配对HEX和颜色名称
+                    color_options = [
+                        {
+                            "id": f"color_{i}",
+                            "name": color_name_matches[i] if i < len(color_name_matches) else f"Color {i}",
+                            "hex_list": parse_hex_list(hex_matches[i]),
+                            "image_chip": ""
+                        }
+                        for i in range(min(len(hex_matches), len(color_name_matches)))
+                    ]
+    except Exception as e:
+        print(f"颜色正则提取失败: {e}")
+
+    # 尺码选项提取
+    try:
+        size_matches = re.findall(
+            r'\\"parent_ids\\":\[0,\d+\],\\"sale_state\\":\\"\w+\\",\\"value\\":\\"([^"]+?)\\",\\"adjust_price\\":',
+            html_content
+        )
+        if size_matches:
+            seen = set()
+            size_options = []
+            for size in size_matches:
+                if size not in seen:
+                    seen.add(size)
+                    size_options.append(size)
+    except Exception as e:
+        print(f"尺码提取失败: {e}")
+
+    return color_options, size_options
@@ -1,11 +1,31 @@
-import requests
+import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 import streamlit as st
+from http_cassette import http_get
+from utils import standardize_model_name
+
+# 上游接口地址（可通过环境变量 ARCTERYX_API_BASE_URL 指向本地替身服务 fake_upstream.py）
+API_BASE_URL = os.environ.get("ARCTERYX_API_BASE_URL", "https://api.arcteryx.co.kr").rstrip("/")
+PRODUCT_SEARCH_API_URL = API_BASE_URL + "/api/products/search"
+
+# 全部结果搜索：每页数量、每个性别最多请求的页数、同时请求的页数
+SEARCH_PAGE_SIZE = 16
+SEARCH_MAX_PAGES = 30
+SEARCH_CONCURRENT_PAGES = 6
+# 搜索“男女款”时依次合并的性别
+SEARCH_ALL_GENDERS = ("MALE", "FEMALE")
+
+SEARCH_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+    "Accept": "application/json",
+    "Referer": "https://arcteryx.co.kr/"
+}
 
 def generate_api_url(product_model, gender="MALE", page=1, display_size=16):
     """生成API请求URL"""
-    base_url = "https://api.arcteryx.co.kr/api/products/search"
+    base_url = PRODUCT_SEARCH_API_URL
     processed_model = product_model.replace(" ", "+")
     encoded_model = quote(processed_model)
 
@@ -24,27 +44,118 @@ def generate_api_url(product_model, gender="MALE", page=1, display_size=16):
     query_string = "&".join([f"{k}={v}" for k, v in params.items()])
     return f"{base_url}?{query_string}"
 
+def _fetch_search_page(api_url, budget=None):
+    """
+    请求一页搜索结果，返回 (产品ID列表, 结果总数)；响应中没有总数时为 None（请求失败时抛出异常）
+    传入 budget（concurrency_control.RateBudget）时，请求前先等待一个令牌
+    """
+    if budget is not None:
+        budget.acquire_blocking()
+    response = http_get(api_url, headers=SEARCH_HEADERS, timeout=10)
+    response.raise_for_status()
+
+    data = response.json()
+
+    if data.get("success") and "data" in data:
+        product_ids = [str(product["product_id"]) for product in data["data"]["rows"]]
+        return product_ids, data["data"].get("total")
+    return [], 0
+
+
 @st.cache_data(ttl=3600)
 def extract_product_ids_from_api(api_url):
     """从API响应中提取产品ID（支持缓存）"""
     try:
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            "Accept": "application/json",
-            "Referer": "https://arcteryx.co.kr/"
+        return _fetch_search_page(api_url)[0]
+    except Exception as e:
+        print(f"API请求失败: {e}")
+        return []
+
+
+def _search_gender_pages(executor, product_model, gender, concurrent_pages=SEARCH_CONCURRENT_PAGES, budget=None):
+    """
+    获取一个性别的全部页，返回按页顺序排列的产品ID
+    先请求第一页：响应带有结果总数时，其余页一次提交；否则每轮并发请求 concurrent_pages 页，
+    遇到没有结果（或不足一页）的页后停止；任何一页请求失败时抛出异常，不返回不完整的结果
+    """
+    def page_url(page):
+        return generate_api_url(product_model, gender, page, SEARCH_PAGE_SIZE)
+
+    product_ids, total = _fetch_search_page(page_url(1), budget)
+    if len(product_ids) < SEARCH_PAGE_SIZE:
+        return product_ids
+
+    last_page = SEARCH_MAX_PAGES
+    if isinstance(total, int):
+        last_page = min(SEARCH_MAX_PAGES, -(-total // SEARCH_PAGE_SIZE))
+    window = last_page - 1 if isinstance(total, int) else concurrent_pages
+
+    page = 2
+    while page <= last_page:
+        futures = [
+            executor.submit(_fetch_search_page, page_url(p), budget)
+            for p in range(page, min(page + window, last_page + 1))
+        ]
+        for future in futures:
+            try:
+                rows, _ = future.result()
+            except Exception:
+                # 同一轮中尚未开始的页不再请求
+                for pending in futures:
+                    pending.cancel()
+                print(f"搜索结果第 {page} 页请求失败（{gender}）")
+                raise
+            product_ids.extend(rows)
+            if len(rows) < SEARCH_PAGE_SIZE:
+                # 最后一页：同一轮中更靠后的页不再使用
+                return product_ids
+            page += 1
+    if not isinstance(total, int) or total > SEARCH_MAX_PAGES * SEARCH_PAGE_SIZE:
+        print(f"⚠️ 搜索结果可能超过 {SEARCH_MAX_PAGES} 页（{gender}），只取前 {SEARCH_MAX_PAGES} 页")
+    return product_ids
+
+
+def fetch_product_ids_by_gender(product_model, genders, concurrent_pages=SEARCH_CONCURRENT_PAGES, budget=None):
+    """
+    并发获取多个性别的全部页（不缓存），返回 {性别: 按页顺序排列的产品ID}
+    同时在途的页请求不超过 concurrent_pages × 性别数；传入 budget 时每个页请求先等待一个令牌
+    任何一页请求失败时抛出异常
+    """
+    # 每个性别占用一个线程等待自己的页请求，另外 concurrent_pages 个线程用于请求
+    with ThreadPoolExecutor(max_workers=(concurrent_pages + 1) * len(genders),
+                            thread_name_prefix="product-search") as executor:
+        gender_futures = {
+            gender: executor.submit(_search_gender_pages, executor, product_model, gender, concurrent_pages, budget)
+            for gender in genders
         }
+        return {gender: future.result() for gender, future in gender_futures.items()}
 
-        response = requests.get(api_url, headers=headers, timeout=10)
-        response.raise_for_status()
 
-        data = response.json()
+# 只缓存完整的结果：任何一页请求失败时抛出异常，st.cache_data 不缓存异常
+@st.cache_data(ttl=3600, show_spinner=False)
+def _search_all_products(product_model, genders):
+    results = fetch_product_ids_by_gender(product_model, genders)
 
-        if data.get("success") and "data" in data:
-            product_ids = [str(product["product_id"]) for product in data["data"]["rows"]]
-            return product_ids
-        else:
-            return []
+    # 合并并去重（按性别顺序、页顺序保留第一次出现的位置和对应的性别）
+    merged = {}
+    for gender, product_ids in results.items():
+        for product_id in product_ids:
+            merged.setdefault(product_id, gender)
+    print(f"🔍 全部结果搜索 '{product_model}' {'/'.join(genders)}: "
+          f"{sum(len(ids) for ids in results.values())} 条结果，去重后 {len(merged)} 个产品")
+    return merged
 
-    except Exception as e:
-        print(f"API请求失败: {e}")
-        return []
\ No newline at end of file
+
+def search_all_products(product_model, genders=("MALE",)):
+    """
+    搜索全部页（可同时搜索多个性别），返回 {产品ID: 性别}，按性别顺序、页顺序排列
+    同一产品出现在多个性别的结果中时，性别取第一个；任何一页请求失败时抛出异常
+    结果按标准化的型号和性别缓存1小时，同一搜索的不同写法（大小写、空格）共用缓存
+    """
+    genders = tuple(dict.fromkeys(genders))
+    return dict(_search_all_products(standardize_model_name(product_model), genders))
+
+
+def search_all_product_ids(product_model, genders=("MALE",)):
+    """搜索全部页（可同时搜索多个性别）并合并去重后的产品ID；任何一页请求失败时抛出异常"""
+    return list(search_all_products(product_model, genders))
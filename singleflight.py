@@ -0,0 +1,132 @@
+import asyncio
+import concurrent.futures
+import threading
+
+# 所有请求合并组（按名称登记，便于统计展示）
+_flight_groups = {}
+
+
+class SingleFlight:
+    """
+    进程级请求合并：同一个键同时只有一个请求在执行，
+    其余并发调用方等待并共享这一次的结果（或异常）
+    线程版和协程版共用同一个键空间：线程版调用会等待在途的协程任务，协程版调用也会等待在途的线程版调用
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._tasks = {}
+        self._waiters = {}
+        self.executed = 0
+        self.collapsed = 0
+        _flight_groups[name] = self
+
+    def do(self, key, fn, *args, **kwargs):
+        """线程版：在当前线程执行 fn，或等待同键的在途调用（包括事件循环中的协程任务）"""
+        with self._lock:
+            task = self._tasks.get(key)
+            future = self._calls.get(key)
+            if task is not None and not task.done() and not _runs_on_current_thread(task):
+                # 在途的协程任务：到任务所在的事件循环中登记为等待方，任务不会因协程调用方全部取消而被取消
+                self.collapsed += 1
+                waiter = asyncio.run_coroutine_threadsafe(self._join_task(task), task.get_loop())
+                leader = False
+            elif future is None:
+                future = concurrent.futures.Future()
+                self._calls[key] = future
+                self.executed += 1
+                leader = True
+            else:
+                self.collapsed += 1
+                waiter = future
+                leader = False
+
+        if not leader:
+            try:
+                return waiter.result()
+            except concurrent.futures.CancelledError:
+                # 登记前任务已被取消（它的调用方都已离开）：重新发起
+                return self.do(key, fn, *args, **kwargs)
+
+        try:
+            result = fn(*args, **kwargs)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+    async def do_async(self, key, coro_fn, *args, **kwargs):
+        """协程版：同一事件循环内同键的调用共享一个任务，同键的线程版调用在途时等待它的结果"""
+        with self._lock:
+            task = self._tasks.get(key)
+            future = self._calls.get(key)
+            if task is None and future is None:
+                task = asyncio.ensure_future(coro_fn(*args, **kwargs))
+                self._tasks[key] = task
+                task.add_done_callback(lambda done, key=key: self._forget_task(key, done))
+                self.executed += 1
+            else:
+                self.collapsed += 1
+
+        if task is None:
+            # shield：调用方被取消时不取消线程版调用共享的结果
+            return await asyncio.shield(asyncio.wrap_future(future))
+        return await self._join_task(task)
+
+    def _forget_task(self, key, task):
+        """协程任务结束后移出在途表"""
+        with self._lock:
+            if self._tasks.get(key) is task:
+                del self._tasks[key]
+
+    async def _join_task(self, task):
+        """在任务所在的事件循环中等待共享的协程任务"""
+        # shield：某个调用方被取消时不影响其他共享结果的调用方；
+        # 所有调用方都被取消（例如批次到达截止时间）时才取消共享的任务，避免无人等待的请求继续占用并发名额
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+                if not task.done():
+                    task.cancel()
+
+    def record_collapsed(self, count):
+        """记录在调用前就已合并掉的重复请求（例如同一批次内的重复SKU）"""
+        if count > 0:
+            with self._lock:
+                self.collapsed += count
+
+    def stats(self):
+        """获取统计信息"""
+        with self._lock:
+            total = self.executed + self.collapsed
+            return {
+                "name": self.name,
+                "executed": self.executed,
+                "collapsed": self.collapsed,
+                "in_flight": len(self._calls) + len(self._tasks),
+                "collapse_rate": round(self.collapsed / total * 100, 2) if total else 0
+            }
+
+
+def _runs_on_current_thread(task):
+    """任务所在的事件循环是否正在当前线程中运行（此时线程版调用不能阻塞等待它）"""
+    try:
+        return asyncio.get_running_loop() is task.get_loop()
+    except RuntimeError:
+        return False
+
+
+def get_singleflight_stats():
+    """获取所有请求合并组的统计信息"""
+    return [group.stats() for group in _flight_groups.values()]
@@ -0,0 +1,109 @@
+import json
+import sys
+from typing import Any, List, NamedTuple
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库的定向解析
+    orjson = None
+
+
+class StockRow(NamedTuple):
+    """库存行：只保留店铺名称和可用库存（店铺的其他元数据不再为每个SKU保存一份）"""
+    store_name: str
+    usable_stock: Any
+
+    def get(self, key, default=None):
+        """兼容原来的字典行：row.get("store_name") / row.get("usable_stock")"""
+        if key in self._fields:
+            return getattr(self, key)
+        return default
+
+
+# 店铺名称缓存：所有SKU的库存行引用同一个字符串对象
+_store_names = {}
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+def make_stock_row(store_name, usable_stock):
+    """创建库存行（店铺名称只保存一份）"""
+    store_name = store_name if isinstance(store_name, str) else ""
+    cached = _store_names.get(store_name)
+    if cached is None:
+        cached = _store_names.setdefault(store_name, sys.intern(store_name))
+    return StockRow(cached, usable_stock)
+
+
+def parse_stock_payload(data) -> List[StockRow]:
+    """从已解析的库存接口响应中取出店铺行"""
+    if not data.get("success"):
+        return []
+    return [
+        make_stock_row(row.get("store_name", ""), row.get("usable_stock", 0))
+        for row in data["data"]["rows"]
+    ]
+
+
+def _value_after_key(text, key_end):
+    """key_end 指向键名之后：跳过冒号解析值；该位置不是键（例如是某个字符串值）时返回 (None, -1)"""
+    i = key_end
+    while i < len(text) and text[i] in _WHITESPACE:
+        i += 1
+    if i >= len(text) or text[i] != ":":
+        return None, -1
+    i += 1
+    while i < len(text) and text[i] in _WHITESPACE:
+        i += 1
+    return _decoder.raw_decode(text, i)
+
+
+def _scan_values(text, key, start=0):
+    """按出现顺序解析某个键的全部值（只解码这些值，不构建其他字段）"""
+    needle = f'"{key}"'
+    values = []
+    pos = text.find(needle, start)
+    while pos >= 0:
+        value, end = _value_after_key(text, pos + len(needle))
+        if end >= 0:
+            values.append(value)
+            pos = text.find(needle, end)
+        else:
+            pos = text.find(needle, pos + len(needle))
+    return values
+
+
+def _scan_stock_rows(text) -> List[StockRow]:
+    """
+    定向解析：只解码 success、store_name 和 usable_stock 的值，跳过店铺的其他元数据
+    两个字段的数量不一致（例如出现嵌套的同名字段）时抛出 ValueError，由调用方回退到完整解析
+    """
+    success = _scan_values(text, "success")
+    if not success or not success[0]:
+        return []
+
+    rows_start = text.find('"rows"')
+    if rows_start < 0:
+        raise ValueError("库存响应中没有 rows 字段")
+    names = _scan_values(text, "store_name", rows_start)
+    stocks = _scan_values(text, "usable_stock", rows_start)
+    if len(names) != len(stocks):
+        raise ValueError("库存响应的店铺名称与库存数量不一致")
+    return [make_stock_row(name, stock) for name, stock in zip(names, stocks)]
+
+
+def decode_stock_payload(body) -> List[StockRow]:
+    """
+    解码库存接口的原始响应（bytes 或 str），返回紧凑的库存行
+    - 安装了 orjson 时使用 orjson 解析
+    - 否则使用标准库定向解析，只解码需要的字段；结构异常时回退到 json.loads
+    """
+    if orjson is not None:
+        return parse_stock_payload(orjson.loads(body))
+
+    text = body.decode("utf-8") if isinstance(body, (bytes, bytearray)) else body
+    try:
+        return _scan_stock_rows(text)
+    except ValueError:
+        return parse_stock_payload(json.loads(text))
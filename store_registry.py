@@ -0,0 +1,88 @@
+import threading
+from typing import NamedTuple, Optional
+
+
+class StoreInfo(NamedTuple):
+    """店铺信息（注册时一次性计算）"""
+    store_id: int
+    name: str                  # 规范名称（中文）
+    region: Optional[str]      # 映射表中的区域（首尔城区、京畿道地区…），不在映射表中为 None
+    region_key: Optional[str]  # 区域分类键（首尔圈、京畿道圈…），无法分类为 None
+    region_code: int           # 区域分类下标（region_keys 中的位置，无法分类为 len(region_keys)）
+    simplified_name: str       # 简化名称（去掉"始祖鸟"前缀）
+    is_key_store: bool         # 是否为重点关注店铺
+
+
+class StoreRegistry:
+    """
+    店铺注册表：为每个店铺分配小整数ID，并预先计算名称翻译、区域和重点店铺标记
+    - resolve(): 接口返回的韩文店名 → StoreInfo（一次字典查找）
+    - get(): 规范名称 → StoreInfo
+    映射表之外的店铺在第一次出现时注册（区域为 None）
+    """
+
+    def __init__(self, translations, region_mapping, region_keys, key_stores, region_key_of, simplify_name):
+        self.region_keys = list(region_keys)
+        self.other_region_code = len(self.region_keys)
+        self._region_mapping = dict(region_mapping)
+        self._region_code_of = {key: i for i, key in enumerate(self.region_keys)}
+        self._region_key_of = region_key_of
+        self._simplify_name = simplify_name
+        self._key_store_names = list(dict.fromkeys(key_stores))
+
+        self._lock = threading.Lock()
+        self._stores = []
+        self._by_name = {}
+        self._by_raw_name = {}
+
+        for name in list(translations.values()) + list(region_mapping) + self._key_store_names:
+            self._register(name)
+        for raw_name, name in translations.items():
+            self._by_raw_name[raw_name] = self._by_name[name]
+
+        self.key_stores = [self._by_name[name] for name in self._key_store_names]
+
+    def _register(self, name):
+        """注册店铺（已注册时直接返回）"""
+        info = self._by_name.get(name)
+        if info is not None:
+            return info
+        with self._lock:
+            info = self._by_name.get(name)
+            if info is None:
+                region = self._region_mapping.get(name)
+                region_key = self._region_key_of(region)
+                info = StoreInfo(
+                    store_id=len(self._stores),
+                    name=name,
+                    region=region,
+                    region_key=region_key,
+                    region_code=self._region_code_of.get(region_key, self.other_region_code),
+                    simplified_name=self._simplify_name(name),
+                    is_key_store=name in self._key_store_names
+                )
+                self._stores.append(info)
+                self._by_name[name] = info
+        return info
+
+    def resolve(self, raw_name):
+        """根据接口返回的店铺名称（韩文）获取店铺信息；没有翻译的名称按原名注册"""
+        info = self._by_raw_name.get(raw_name)
+        if info is None:
+            info = self._register(raw_name)
+            self._by_raw_name[raw_name] = info
+        return info
+
+    def get(self, name):
+        """根据规范名称获取店铺信息"""
+        return self._by_name.get(name) or self._register(name)
+
+    def by_id(self, store_id):
+        return self._stores[store_id]
+
+    def stores_in_region(self, region_key):
+        """属于某个区域分类的全部店铺名称（按注册顺序）"""
+        return [info.name for info in list(self._stores) if info.region_key == region_key]
+
+    def __len__(self):
+        return len(self._stores)